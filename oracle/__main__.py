@@ -0,0 +1,207 @@
+"""Score a file of generations with the GGL legality oracle.
+
+    python -m oracle --tokenizer-abi tok.json --grammar-abi lex.grammar.v1.ggl.json \\
+        generations.jsonl -o results.jsonl --workers 8
+
+Input is read line by line: JSONL lines are either a JSON string or an object
+holding the text under ``--field``; with ``--format text`` every line is one
+candidate. A blank JSONL line is scored as an empty generation. One
+OracleResult per input line is written in input order, so output line N
+belongs to input line N, and a summary goes to stderr.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import fields
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from .abi import ABI, load_abi_mapped
+from .compiled import compile_abi
+from .oracle import OracleResult, _init_worker, _run_oracle, _worker_oracle_chunk
+from .stats import OracleStats, active_stats, disable_stats, enable_stats
+
+# Batches queued per worker; bounds memory while keeping every worker busy.
+_IN_FLIGHT_PER_WORKER = 4
+
+
+def _read_candidates(f: TextIO, fmt: str, field: str) -> Iterator[str]:
+    for lineno, line in enumerate(f, 1):
+        if fmt == "text":
+            yield line[:-1] if line.endswith("\n") else line
+            continue
+        if not line.strip():
+            # Scored as an empty generation so output lines stay aligned with input lines.
+            yield ""
+            continue
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise SystemExit(f"line {lineno}: invalid JSON: {e}")
+        if isinstance(obj, dict):
+            obj = obj.get(field)
+        if not isinstance(obj, str):
+            raise SystemExit(f"line {lineno}: expected a string or an object with a {field!r} string")
+        yield obj
+
+
+def _batches(texts: Iterable[str], size: int) -> Iterator[List[str]]:
+    batch: List[str] = []
+    for text in texts:
+        batch.append(text)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _collect(
+    future: "Future[Tuple[List[OracleResult], Optional[Dict[str, Any]]]]",
+    stats: Optional[OracleStats],
+) -> List[OracleResult]:
+    results, snap = future.result()
+    if snap is not None:
+        stats.merge(snap)
+    return results
+
+
+def _score_batches(
+    batches: Iterable[List[str]],
+    abi: ABI,
+    want_lower: bool,
+    workers: int,
+) -> Iterator[Tuple[List[str], List[OracleResult]]]:
+    if workers <= 1:
+        compiled = compile_abi(abi)
+        for batch in batches:
+            yield batch, [_run_oracle(text, abi, compiled, want_lower) for text in batch]
+        return
+
+    stats = active_stats()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(abi,),
+    ) as pool:
+        pending: Deque[Tuple[List[str], Future]] = deque()
+        for batch in batches:
+            job = (batch, want_lower, stats is not None)
+            pending.append((batch, pool.submit(_worker_oracle_chunk, job)))
+            if len(pending) >= workers * _IN_FLIGHT_PER_WORKER:
+                done, future = pending.popleft()
+                yield done, _collect(future, stats)
+        while pending:
+            done, future = pending.popleft()
+            yield done, _collect(future, stats)
+
+
+class _Summary:
+    def __init__(self) -> None:
+        self.count = 0
+        self.ok = 0
+        self.nbytes = 0
+        self.partial = 0.0
+        self.prefix = 0.0
+        self.failures: Dict[str, Dict[str, int]] = {}
+
+    def add(self, text: str, result: OracleResult) -> None:
+        self.count += 1
+        self.nbytes += len(text.encode("utf-8", "surrogatepass"))
+        self.partial += result.partial_score
+        self.prefix += result.prefix_score
+        if result.ok:
+            self.ok += 1
+            return
+        codes = self.failures.setdefault(result.stage, {})
+        codes[result.code] = codes.get(result.code, 0) + 1
+
+    def report(self, seconds: float) -> str:
+        rate = self.count / seconds if seconds > 0 else 0.0
+        mbps = self.nbytes / seconds / 1e6 if seconds > 0 else 0.0
+        n = max(self.count, 1)
+        lines = [
+            f"scored {self.count:,} generations in {seconds:.2f}s ({rate:,.0f}/s, {mbps:.2f} MB/s)",
+            f"pass rate: {100.0 * self.ok / n:.2f}% ({self.ok:,}/{self.count:,})",
+            f"mean partial_score: {self.partial / n:.4f}",
+            f"mean prefix_score: {self.prefix / n:.4f}",
+        ]
+        if self.failures:
+            lines.append("failures:")
+            for stage, codes in self.failures.items():
+                total = sum(codes.values())
+                lines.append(f"  {stage:<9} {total:>10,}")
+                for code, count in sorted(codes.items(), key=lambda item: -item[1]):
+                    lines.append(f"    {code:<28} {count:>10,}")
+        return "\n".join(lines)
+
+
+_OMITTED = ("ast", "lowered")
+
+
+def _result_json(result: OracleResult, omit_ast: bool) -> str:
+    # Shallow field dict: dataclasses.asdict would deep-copy every AST first.
+    data = {
+        f.name: getattr(result, f.name)
+        for f in fields(result)
+        if not (omit_ast and f.name in _OMITTED)
+    }
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m oracle",
+        description="Score generations with the GGL legality oracle",
+    )
+    parser.add_argument("input", help="JSONL/text file of candidates, or - for stdin")
+    parser.add_argument("--tokenizer-abi", required=True, help="Tokenizer ABI JSON")
+    parser.add_argument("--grammar-abi", required=True, help="Grammar ABI JSON")
+    parser.add_argument("-o", "--output", default="-", help="Result JSONL path (default: stdout)")
+    parser.add_argument("--format", choices=("jsonl", "text"), default="jsonl", help="Input format")
+    parser.add_argument("--field", default="text", help="JSONL object key holding the generation")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--batch-size", type=int, default=256, help="Candidates per worker job")
+    parser.add_argument("--no-lower", action="store_true", help="Skip the lowering stage")
+    parser.add_argument("--omit-ast", action="store_true", help="Leave ast/lowered out of the output")
+    parser.add_argument("--stats", metavar="PATH", help="Also dump per-stage OracleStats JSON here")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    abi = load_abi_mapped(args.tokenizer_abi, args.grammar_abi)
+    if args.stats:
+        enable_stats()
+
+    src = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    dst = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    summary = _Summary()
+    start = time.perf_counter()
+    try:
+        batches = _batches(_read_candidates(src, args.format, args.field), args.batch_size)
+        for texts, results in _score_batches(batches, abi, not args.no_lower, args.workers):
+            for text, result in zip(texts, results):
+                summary.add(text, result)
+                dst.write(_result_json(result, args.omit_ast))
+                dst.write("\n")
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+    elapsed = time.perf_counter() - start
+
+    print(summary.report(elapsed), file=sys.stderr)
+    if args.stats:
+        disable_stats().dump(args.stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,25 @@ from __future__ import annotations
 
 import hashlib
 import json
+import os
+import tempfile
 from dataclasses import dataclass
-from typing import Any, Dict
+from typing import Any, Dict, Mapping, Optional, Tuple
 
-from .canon import canon_json_bytes_v1
+from .canon import write_canon_json_v1
+from .lazy_json import MappedJSONDocument
+
+SIDECAR_FORMAT = 2
+SIDECAR_SUFFIX = ".abi-hash.json"
+
+# Shared with the compiled-ABI disk cache; sidecars go here when it is set.
+CACHE_DIR_ENV = "ASX_ORACLE_ABI_CACHE"
 
 
 @dataclass(frozen=True)
 class ABI:
-    tokenizer: Dict[str, Any]
-    grammar: Dict[str, Any]
+    tokenizer: Mapping[str, Any]
+    grammar: Mapping[str, Any]
     abi_hash: str
 
 
@@ -23,9 +32,115 @@ def load_abi(tokenizer_path: str, grammar_path: str) -> ABI:
 
     tok_obj = json.loads(tok_raw.decode("utf-8"))
     gr_obj = json.loads(gr_raw.decode("utf-8"))
+    return abi_from_objects(tok_obj, gr_obj)
+
+
+def abi_from_objects(tok_obj: Dict[str, Any], gr_obj: Dict[str, Any]) -> ABI:
+    # sha256(canon(tok) + b"\n" + canon(gr)), streamed without building either.
+    h = hashlib.sha256()
+    write_canon_json_v1(tok_obj, h)
+    h.update(b"\n")
+    write_canon_json_v1(gr_obj, h)
+    return ABI(tokenizer=tok_obj, grammar=gr_obj, abi_hash=h.hexdigest())
+
+
+def abi_sidecar_path(tokenizer_path: str, cache_dir: Optional[str] = None) -> str:
+    """``<tokenizer_path>.abi-hash.json``, or a file in ``cache_dir`` named by the path's hash."""
+    if not cache_dir:
+        return tokenizer_path + SIDECAR_SUFFIX
+    key = hashlib.sha256(os.path.abspath(tokenizer_path).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, key[:32] + SIDECAR_SUFFIX)
+
+
+def load_abi_mapped(
+    tokenizer_path: str,
+    grammar_path: str,
+    *,
+    sidecar_path: Optional[str] = None,
+    write_sidecar: Optional[bool] = None,
+) -> ABI:
+    """Like :func:`load_abi`, but with mmap-backed, lazily decoded sections.
+
+    ``abi_hash`` is taken from the sidecar when its recorded raw-file digests
+    match both files; otherwise it is computed exactly as ``load_abi`` does.
+    The sidecar defaults to a file under ``$ASX_ORACLE_ABI_CACHE`` when that
+    is set and to ``<tokenizer_path>.abi-hash.json`` otherwise. A stale or
+    missing sidecar is only (re)written when ``write_sidecar`` is true; the
+    default writes it to an explicit ``sidecar_path`` or the cache directory,
+    never next to the ABI files. The sidecar also records where each
+    top-level section sits in its file. The returned ABI pickles as two paths,
+    digests and spans, and no section is decoded until something reads it,
+    so workers that find a warm compiled-ABI cache never parse the JSON.
+    """
+    tok = MappedJSONDocument(tokenizer_path)
+    gr = MappedJSONDocument(grammar_path)
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    sidecar = sidecar_path or abi_sidecar_path(tokenizer_path, cache_dir)
+    if write_sidecar is None:
+        write_sidecar = bool(sidecar_path or cache_dir)
+
+    data = _read_sidecar(sidecar, tok.raw_sha256, gr.raw_sha256)
+    if data is not None:
+        tok_spans = _spans(data["tokenizer_spans"])
+        gr_spans = _spans(data["grammar_spans"])
+        tok = MappedJSONDocument(tokenizer_path, tok.raw_sha256, spans=tok_spans)
+        gr = MappedJSONDocument(grammar_path, gr.raw_sha256, spans=gr_spans)
+        return ABI(tokenizer=tok, grammar=gr, abi_hash=data["abi_hash"])
+
+    abi_hash = abi_from_objects(tok.to_dict(), gr.to_dict()).abi_hash
+    if write_sidecar:
+        _write_sidecar(sidecar, tok, gr, abi_hash)
+    return ABI(tokenizer=tok, grammar=gr, abi_hash=abi_hash)
+
+
+def _spans(raw: Dict[str, Any]) -> Dict[str, Tuple[int, int]]:
+    return {key: (int(span[0]), int(span[1])) for key, span in raw.items()}
+
+
+def _read_sidecar(path: str, tok_sha256: str, gr_sha256: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (
+        not isinstance(data, dict)
+        or data.get("format") != SIDECAR_FORMAT
+        or data.get("tokenizer_sha256") != tok_sha256
+        or data.get("grammar_sha256") != gr_sha256
+        or not isinstance(data.get("abi_hash"), str)
+        or not isinstance(data.get("tokenizer_spans"), dict)
+        or not isinstance(data.get("grammar_spans"), dict)
+    ):
+        return None
+    return data
 
-    tok_c = canon_json_bytes_v1(tok_obj)
-    gr_c = canon_json_bytes_v1(gr_obj)
 
-    h = hashlib.sha256(tok_c + b"\n" + gr_c).hexdigest()
-    return ABI(tokenizer=tok_obj, grammar=gr_obj, abi_hash=h)
+def _write_sidecar(
+    path: str,
+    tok: MappedJSONDocument,
+    gr: MappedJSONDocument,
+    abi_hash: str,
+) -> None:
+    data = {
+        "format": SIDECAR_FORMAT,
+        "tokenizer_sha256": tok.raw_sha256,
+        "grammar_sha256": gr.raw_sha256,
+        "abi_hash": abi_hash,
+        "tokenizer_spans": tok.spans,
+        "grammar_spans": gr.spans,
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".abi-hash-")
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, sort_keys=True, separators=(",", ":"))
+            f.write("\n")
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
@@ -0,0 +1,328 @@
+"""Micro-benchmarks for the oracle pipeline.
+
+Run with ``python -m oracle.bench <name>``; every benchmark builds its own
+synthetic ABI and inputs so it can run without any model artifacts.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import random
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from .abi import ABI, abi_from_objects
+from .canon import canon_hash, canon_json_bytes_v1
+from .ggl_legal import (
+    LegalityError,
+    check_legality_limits,
+    compile_grammar_limits,
+    legality_errors,
+)
+from .ggl_lower import (
+    SCENE_CONTRACT_V1,
+    SceneInterner,
+    compile_lowering,
+    lower_ast_with_template,
+    write_lowered_canon,
+)
+from .oracle import BOUNDARY_CLOSE, ggl_legality_oracle, ggl_legality_oracle_many
+from .stream import StreamingOracle
+
+BENCH_TOKENIZER_ABI = {
+    "allowed_unicode_ranges": [[9, 10], [32, 126]],
+    "disallowed_unicode_ranges": [[60, 60]],
+}
+BENCH_GRAMMAR_ABI = {
+    "ast_type": "ggl.program.v1",
+    "max_length": 4096,
+    "lowered_type": "scene.ir.v1",
+    "lowering_contract_id": "asx://lower/ggl.scene.v1",
+}
+
+_STATEMENTS = [
+    "Wo entropy = 0.32",
+    "Sek perceive -> decide -> act",
+    "Pop scene.light: \"warm\"",
+    "Wo camera.fov = 60",
+]
+
+
+def bench_abi() -> ABI:
+    return abi_from_objects(BENCH_TOKENIZER_ABI, BENCH_GRAMMAR_ABI)
+
+
+def synthetic_generations(n: int, *, seed: int = 0, max_stmts: int = 12) -> List[str]:
+    """Mix of legal payloads and the usual failure shapes seen in free-run decodes."""
+    rng = random.Random(seed)
+    out: List[str] = []
+    for _ in range(n):
+        body = "\n".join(rng.choice(_STATEMENTS) for _ in range(rng.randint(1, max_stmts)))
+        roll = rng.random()
+        if roll < 0.6:
+            out.append(f"<GGL>\n{body}\n</GGL>")
+        elif roll < 0.75:
+            out.append(f"<GGL>{body}")
+        elif roll < 0.85:
+            out.append(f"note: <GGL>{body}</GGL>")
+        else:
+            out.append(f"<GGL>{body} <bad></GGL>")
+    return out
+
+
+def _timed(fn: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def bench_batch(args: argparse.Namespace) -> Dict[str, float]:
+    abi = bench_abi()
+    texts = synthetic_generations(args.n, seed=args.seed)
+
+    loop_s = _timed(lambda: [ggl_legality_oracle(t, abi, want_lower=args.lower) for t in texts])
+    batch_s = _timed(lambda: ggl_legality_oracle_many(texts, abi, want_lower=args.lower))
+    report = {
+        "n": float(args.n),
+        "loop_per_s": args.n / loop_s,
+        "batch_per_s": args.n / batch_s,
+    }
+    if args.workers > 1:
+        pool_s = _timed(
+            lambda: ggl_legality_oracle_many(
+                texts, abi, want_lower=args.lower, workers=args.workers
+            )
+        )
+        report["pool_per_s"] = args.n / pool_s
+    return report
+
+
+def synthetic_tokenizer_abi(n: int, *, seed: int = 0) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyz\u00e9\u4e2d "
+    vocab = {
+        "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 8))) + str(i): i
+        for i in range(n)
+    }
+    return {
+        "allowed_unicode_ranges": [[i, i + 3] for i in range(0, 4 * n, 5)],
+        "vocab": vocab,
+        "merges": [f"{rng.choice(alphabet)}{i} {rng.choice(alphabet)}" for i in range(n // 2)],
+    }
+
+
+def bench_canon(args: argparse.Namespace) -> Dict[str, float]:
+    tok = synthetic_tokenizer_abi(args.n, seed=args.seed)
+    size = len(canon_json_bytes_v1(tok))
+
+    v1_s = _timed(lambda: hashlib.sha256(canon_json_bytes_v1(tok)).hexdigest())
+    hash_s = _timed(lambda: canon_hash(tok))
+    return {
+        "n": float(args.n),
+        "canon_mb": size / 1e6,
+        "v1_hash_mb_s": size / v1_s / 1e6,
+        "stream_hash_mb_s": size / hash_s / 1e6,
+    }
+
+
+BENCH_LEGALITY_RULES = [
+    {"kind": "max_depth", "max": 1 << 20},
+    {"kind": "max_nodes", "max": 1 << 30},
+    {"kind": "max_nodes", "node": "stmt", "max": 1 << 30},
+    {"kind": "max_children", "node": "path", "max": 1 << 20},
+    {"kind": "token_pattern", "token": "ID", "re": "[a-z_][a-z0-9_]*"},
+    {"kind": "token_max_length", "token": "ID", "max": 32},
+    {"kind": "forbid_values", "token": "ID", "values": ["eval", "exec"]},
+]
+
+
+def _token(ttype: str, value: str, line: int) -> Dict[str, Any]:
+    return {"type": ttype, "value": value, "line": line, "col": 1}
+
+
+def wide_ast(n: int) -> Dict[str, Any]:
+    """``n`` statements of a few tokens each under the program node."""
+    stmts = [
+        {
+            "type": "stmt",
+            "line": i + 1,
+            "col": 1,
+            "children": [
+                _token("KW", "Wo", i + 1),
+                {"type": "path", "line": i + 1, "col": 4, "children": [_token("ID", f"v{i}", i + 1)]},
+                _token("SYM", "=", i + 1),
+                _token("NUM", str(i), i + 1),
+            ],
+        }
+        for i in range(n)
+    ]
+    return {"type": "ggl.program.v1", "body": "x", "children": stmts}
+
+
+def deep_ast(depth: int) -> Dict[str, Any]:
+    """One chain of ``depth`` nested path nodes ending in a token."""
+    node: Dict[str, Any] = _token("ID", "leaf", depth)
+    for i in range(depth, 0, -1):
+        node = {"type": "path", "line": i, "col": 1, "children": [node, _token("SYM", ".", i)]}
+    return {"type": "ggl.program.v1", "body": "x", "children": [node]}
+
+
+def _count_nodes(ast: Dict[str, Any]) -> int:
+    total, stack = 0, list(ast["children"])
+    while stack:
+        node = stack.pop()
+        total += 1
+        stack.extend(node.get("children", ()))
+    return total
+
+
+def bench_legal(args: argparse.Namespace) -> Dict[str, float]:
+    limits = compile_grammar_limits({"ast_type": "ggl.program.v1", "@legality": BENCH_LEGALITY_RULES})
+    report: Dict[str, float] = {}
+    for name, ast in (("wide", wide_ast(args.n)), ("deep", deep_ast(args.n))):
+        nodes = _count_nodes(ast)
+        check_s = _timed(lambda: check_legality_limits(ast, limits))
+        diag_s = _timed(lambda: legality_errors(ast, limits))
+        report[f"{name}_nodes"] = float(nodes)
+        report[f"{name}_check_nodes_s"] = nodes / check_s
+        report[f"{name}_diag_nodes_s"] = nodes / diag_s
+
+    # A violation in the first statement stops the walk right there.
+    bad = wide_ast(args.n)
+    bad["children"][0]["children"][1]["children"][0]["value"] = "eval"
+    start = time.perf_counter()
+    try:
+        check_legality_limits(bad, limits)
+    except LegalityError:
+        pass
+    report["early_exit_us"] = (time.perf_counter() - start) * 1e6
+    return report
+
+
+LEX_GRAMMAR = Path(__file__).resolve().parents[1] / "codex" / "lex" / "lex.grammar.v1.ggl.json"
+
+
+def _peak(fn: Callable[[], object]) -> float:
+    """Peak traced allocation of ``fn`` in MB; the result is kept alive until the end."""
+    tracemalloc.start()
+    try:
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak / 1e6
+
+
+def bench_lower(args: argparse.Namespace) -> Dict[str, float]:
+    with open(LEX_GRAMMAR, "r", encoding="utf-8") as f:
+        grammar = dict(json.load(f), lowering_contract_id=SCENE_CONTRACT_V1)
+    abi = abi_from_objects(BENCH_TOKENIZER_ABI, grammar)
+    asts = [
+        r.ast
+        for r in ggl_legality_oracle_many(synthetic_generations(args.n, seed=args.seed), abi)
+        if r.ok
+    ]
+    template = compile_lowering(grammar)
+
+    def fresh() -> List[Dict[str, Any]]:
+        # A table per scene: nothing is shared between generations.
+        return [lower_ast_with_template(ast, template, None) for ast in asts]
+
+    def shared() -> List[Dict[str, Any]]:
+        interner = SceneInterner()
+        return [lower_ast_with_template(ast, template, interner) for ast in asts]
+
+    def via_dict() -> int:
+        sink = io.BytesIO()
+        for ast in asts:
+            sink.write(canon_json_bytes_v1(lower_ast_with_template(ast, template, None)))
+        return sink.tell()
+
+    def streamed() -> int:
+        sink = io.BytesIO()
+        for ast in asts:
+            write_lowered_canon(ast, template, sink)
+        return sink.tell()
+
+    size = streamed()
+    n = len(asts)
+    return {
+        "scenes": float(n),
+        "fresh_scenes_s": n / _timed(fresh),
+        "shared_scenes_s": n / _timed(shared),
+        "fresh_peak_mb": _peak(fresh),
+        "shared_peak_mb": _peak(shared),
+        "canon_mb": size / 1e6,
+        "dict_mb_s": size / _timed(via_dict) / 1e6,
+        "stream_mb_s": size / _timed(streamed) / 1e6,
+    }
+
+
+def bench_prefix(args: argparse.Namespace) -> Dict[str, float]:
+    """Score every 4-character prefix of each generation, as a search would."""
+    with open(LEX_GRAMMAR, "r", encoding="utf-8") as f:
+        grammar = json.load(f)
+    abi = abi_from_objects(BENCH_TOKENIZER_ABI, grammar)
+    texts = synthetic_generations(args.n, seed=args.seed, max_stmts=24)
+    step = 4
+
+    def rerun() -> float:
+        # Closing each prefix lets the full pipeline grade its payload.
+        total = 0.0
+        for text in texts:
+            body = text.replace(BOUNDARY_CLOSE, "")
+            for end in range(step, len(body) + step, step):
+                candidate = body[:end] + BOUNDARY_CLOSE
+                total += ggl_legality_oracle(candidate, abi, want_lower=False).prefix_score
+        return total
+
+    def incremental() -> float:
+        total = 0.0
+        for text in texts:
+            oracle = StreamingOracle(abi, want_lower=False)
+            for end in range(step, len(text) + step, step):
+                oracle.feed(text[end - step : end])
+                total += oracle.prefix_score
+        return total
+
+    prefixes = sum((len(text) + step - 1) // step for text in texts)
+    return {
+        "prefixes": float(prefixes),
+        "rerun_prefix_s": prefixes / _timed(rerun),
+        "stream_prefix_s": prefixes / _timed(incremental),
+    }
+
+
+BENCHMARKS: Dict[str, Callable[[argparse.Namespace], Dict[str, float]]] = {
+    "batch": bench_batch,
+    "canon": bench_canon,
+    "legal": bench_legal,
+    "lower": bench_lower,
+    "prefix": bench_prefix,
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Oracle micro-benchmarks")
+    parser.add_argument("name", choices=sorted(BENCHMARKS), help="Benchmark to run")
+    parser.add_argument("--n", type=int, default=20000, help="Number of inputs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=0, help="Process pool size")
+    parser.add_argument("--lower", action="store_true", help="Also lower legal payloads")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    report = BENCHMARKS[args.name](args)
+    for key, value in report.items():
+        print(f"{key:>16}: {value:,.1f}")
+
+
+if __name__ == "__main__":
+    main()
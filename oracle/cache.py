@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from .oracle import OracleResult
+
+CacheKey = Tuple[str, str, bool]
+
+
+def oracle_cache_key(abi_hash: str, text: str, want_lower: bool) -> CacheKey:
+    digest = hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+    return (abi_hash, digest, bool(want_lower))
+
+
+def _result_size(result: OracleResult) -> int:
+    """Rough resident size of a cached result; the GGL body dominates."""
+    size = 256 + len(result.msg)
+    if result.ast is not None:
+        body = result.ast.get("body")
+        if isinstance(body, str):
+            # A structural AST holds a node dict for roughly every few characters.
+            size += (64 if "children" in result.ast else 2) * len(body)
+    if result.lowered is not None:
+        size += 256
+    return size
+
+
+class SqliteResultStore:
+    """Shared on-disk result store so parallel eval workers reuse each other's hits.
+
+    Each process opens its own connection lazily (connections must not cross
+    a fork); WAL mode lets readers run alongside the writer.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = -1
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"path": self.path}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["path"])
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS oracle_results ("
+                " abi_hash TEXT NOT NULL,"
+                " text_sha256 TEXT NOT NULL,"
+                " want_lower INTEGER NOT NULL,"
+                " result TEXT NOT NULL,"
+                " PRIMARY KEY (abi_hash, text_sha256, want_lower))"
+            )
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key: CacheKey) -> Optional[OracleResult]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT result FROM oracle_results"
+                " WHERE abi_hash = ? AND text_sha256 = ? AND want_lower = ?",
+                (key[0], key[1], int(key[2])),
+            ).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row[0])
+        # Rows written before prefix_score existed.
+        data.setdefault("prefix_score", data["partial_score"])
+        return OracleResult(**data)
+
+    def put(self, key: CacheKey, result: OracleResult) -> None:
+        self.put_many([(key, result)])
+
+    def put_many(self, items: Iterable[Tuple[CacheKey, OracleResult]]) -> None:
+        rows = [
+            (
+                key[0],
+                key[1],
+                int(key[2]),
+                json.dumps(asdict(result), separators=(",", ":"), ensure_ascii=False),
+            )
+            for key, result in items
+        ]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("INSERT OR REPLACE INTO oracle_results VALUES (?, ?, ?, ?)", rows)
+            conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+class OracleCache:
+    """Bounded LRU of oracle results keyed by (abi_hash, sha256(text), want_lower).
+
+    Eviction happens when either ``max_entries`` or ``max_bytes`` (estimated)
+    is exceeded. An optional ``store`` (e.g. SqliteResultStore) backs the
+    in-memory tier. Cached OracleResults are shared objects; treat them as
+    read-only.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 65536,
+        max_bytes: Optional[int] = None,
+        store: Optional[SqliteResultStore] = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store = store
+        self._entries: "OrderedDict[CacheKey, Tuple[OracleResult, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    key = staticmethod(oracle_cache_key)
+
+    def get(self, key: CacheKey) -> Optional[OracleResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        if self.store is not None:
+            result = self.store.get(key)
+            if result is not None:
+                with self._lock:
+                    self.store_hits += 1
+                self._insert(key, result)
+                return result
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: CacheKey, result: OracleResult) -> None:
+        self._insert(key, result)
+        if self.store is not None:
+            self.store.put(key, result)
+
+    def put_many(self, items: Sequence[Tuple[CacheKey, OracleResult]]) -> None:
+        for key, result in items:
+            self._insert(key, result)
+        if self.store is not None:
+            self.store.put_many(items)
+
+    def _insert(self, key: CacheKey, result: OracleResult) -> None:
+        size = _result_size(result)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (result, size)
+            self._bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.store_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.store_hits) / lookups if lookups else 0.0,
+            }
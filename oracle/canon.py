@@ -1,7 +1,19 @@
 from __future__ import annotations
 
+import hashlib
 import json
-from typing import Any
+from typing import Any, Callable, List
+
+_CANON_ENCODER = json.JSONEncoder(sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+# For slices of a large dict whose keys are already sorted and whose values are scalars.
+_PRESORTED_ENCODER = json.JSONEncoder(sort_keys=False, separators=(",", ":"), ensure_ascii=False)
+
+# Containers up to this many entries are encoded in a single C-encoder call;
+# larger ones are streamed in slices of this size.
+INLINE_LEN = 512
+
+# Bytes buffered before they are handed to the sink.
+FLUSH_BYTES = 1 << 16
 
 
 def canon_json_bytes_v1(obj: Any) -> bytes:
@@ -11,3 +23,139 @@ def canon_json_bytes_v1(obj: Any) -> bytes:
     """
     payload = json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
     return payload.encode("utf-8")
+
+
+_CONTAINERS = frozenset((dict, list, tuple))
+# Exact types the presorted encoder may see: subclasses (OrderedDict, enums)
+# still go through the sorting encoder.
+_SCALARS = frozenset((str, int, float, bool, type(None)))
+
+
+def _is_large(value: Any, inline_len: int) -> bool:
+    return type(value) in _CONTAINERS and len(value) > inline_len
+
+
+def _has_large(values: Any, inline_len: int) -> bool:
+    """Whether any of ``values`` is a container that must be streamed on its own."""
+    types = set(map(type, values))
+    if _CONTAINERS.isdisjoint(types):
+        return False
+    if types <= _CONTAINERS:
+        return max(map(len, values)) > inline_len
+    return any(_is_large(value, inline_len) for value in values)
+
+
+class _CanonWriter:
+    def __init__(self, write: Callable[[bytes], Any], inline_len: int) -> None:
+        self._write = write
+        self._inline_len = inline_len
+        self._parts: List[str] = []
+        self._pending = 0
+        self._markers: set = set()
+        self.nbytes = 0
+
+    def emit(self, s: str) -> None:
+        self._parts.append(s)
+        self._pending += len(s)
+        if self._pending >= FLUSH_BYTES:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._parts:
+            data = "".join(self._parts).encode("utf-8")
+            self._parts.clear()
+            self._pending = 0
+            self.nbytes += len(data)
+            self._write(data)
+
+    def value(self, obj: Any) -> None:
+        if not _is_large(obj, self._inline_len):
+            self.emit(_CANON_ENCODER.encode(obj))
+            return
+        marker = id(obj)
+        if marker in self._markers:
+            raise ValueError("Circular reference detected")
+        self._markers.add(marker)
+        if type(obj) is dict:
+            self._dict(obj)
+        else:
+            self._list(obj)
+        self._markers.discard(marker)
+
+    def _dict(self, dct: dict) -> None:
+        step = self._inline_len
+        keys = sorted(dct)
+        sep = "{"
+        for i in range(0, len(keys), step):
+            chunk = keys[i : i + step]
+            batch = dict(zip(chunk, map(dct.__getitem__, chunk)))
+            values = batch.values()
+            if set(map(type, values)) <= _SCALARS:
+                # Keys are already in order and scalars need no sorting.
+                self.emit(sep + _PRESORTED_ENCODER.encode(batch)[1:-1])
+                sep = ","
+                continue
+            if not _has_large(values, step):
+                self.emit(sep + _CANON_ENCODER.encode(batch)[1:-1])
+                sep = ","
+                continue
+            run = {}
+            for key, value in batch.items():
+                if _is_large(value, step):
+                    if run:
+                        self.emit(sep + _CANON_ENCODER.encode(run)[1:-1])
+                        sep, run = ",", {}
+                    # '{"key":null}' -> '"key":' keeps the C encoder's key rules.
+                    self.emit(sep + _CANON_ENCODER.encode({key: None})[1:-5])
+                    sep = ","
+                    self.value(value)
+                else:
+                    run[key] = value
+            if run:
+                self.emit(sep + _CANON_ENCODER.encode(run)[1:-1])
+                sep = ","
+        self.emit("}")
+
+    def _list(self, seq: Any) -> None:
+        step = self._inline_len
+        sep = "["
+        for i in range(0, len(seq), step):
+            chunk = seq[i : i + step]
+            start = 0
+            if _has_large(chunk, step):
+                for j, value in enumerate(chunk):
+                    if _is_large(value, step):
+                        if j > start:
+                            self.emit(sep + _CANON_ENCODER.encode(chunk[start:j])[1:-1])
+                            sep = ","
+                        self.emit(sep)
+                        sep = ","
+                        self.value(value)
+                        start = j + 1
+            if start < len(chunk):
+                self.emit(sep + _CANON_ENCODER.encode(chunk[start:])[1:-1])
+                sep = ","
+        self.emit("]")
+
+
+def write_canon_json_v1(obj: Any, out: Any, *, inline_len: int = INLINE_LEN) -> int:
+    """Stream the canonical JSON bytes of ``obj`` into ``out``; return the byte count.
+
+    ``out`` is anything with ``write(bytes)`` (a binary file) or
+    ``update(bytes)`` (a hashlib object). The bytes are identical to
+    :func:`canon_json_bytes_v1`, but no full-size str or bytes copy is built:
+    containers larger than ``inline_len`` are streamed slice by slice, each
+    slice going through the C JSON encoder.
+    """
+    write = getattr(out, "write", None) or out.update
+    writer = _CanonWriter(write, max(inline_len, 1))
+    writer.value(obj)
+    writer.flush()
+    return writer.nbytes
+
+
+def canon_hash(obj: Any, algorithm: str = "sha256") -> str:
+    """Hex digest of ``canon_json_bytes_v1(obj)``, computed without materializing it."""
+    h = hashlib.new(algorithm)
+    write_canon_json_v1(obj, h)
+    return h.hexdigest()
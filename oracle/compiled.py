@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from .abi import ABI, CACHE_DIR_ENV
+from .ggl_legal import GrammarLimits, compile_grammar_limits
+from .ggl_lower import LoweringTemplate, compile_lowering
+from .ggl_parse import GGLParser, compile_parser
+from .tokenize_abi import TokenizerValidator, compile_tokenizer_abi
+
+# Bump whenever the pickled layout of CompiledABI changes.
+COMPILED_ABI_FORMAT = 4
+
+
+@dataclass(frozen=True)
+class CompiledABI:
+    """Everything the oracle derives from an ABI, built once per abi_hash."""
+
+    abi_hash: str
+    tokenizer: TokenizerValidator
+    parser: GGLParser
+    limits: GrammarLimits
+    lowering: LoweringTemplate
+
+
+class _CompiledABICache:
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, CompiledABI]" = OrderedDict()
+
+    def get(self, abi_hash: str) -> Optional[CompiledABI]:
+        compiled = self._entries.get(abi_hash)
+        if compiled is not None:
+            self._entries.move_to_end(abi_hash)
+        return compiled
+
+    def put(self, compiled: CompiledABI) -> None:
+        self._entries[compiled.abi_hash] = compiled
+        self._entries.move_to_end(compiled.abi_hash)
+        self._evict()
+
+    def resize(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._evict()
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+_CACHE = _CompiledABICache(maxsize=8)
+
+
+def _build(abi: ABI) -> CompiledABI:
+    return CompiledABI(
+        abi_hash=abi.abi_hash,
+        tokenizer=compile_tokenizer_abi(abi.tokenizer),
+        parser=compile_parser(abi.grammar),
+        limits=compile_grammar_limits(abi.grammar),
+        lowering=compile_lowering(abi.grammar),
+    )
+
+
+def _cache_path(cache_dir: Path, abi_hash: str) -> Path:
+    return cache_dir / f"{abi_hash}.compiled-abi.v{COMPILED_ABI_FORMAT}.pkl"
+
+
+def _load_from_disk(cache_dir: Path, abi_hash: str) -> Optional[CompiledABI]:
+    path = _cache_path(cache_dir, abi_hash)
+    try:
+        with open(path, "rb") as f:
+            compiled = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if not isinstance(compiled, CompiledABI) or compiled.abi_hash != abi_hash:
+        return None
+    return compiled
+
+
+def _store_to_disk(cache_dir: Path, compiled: CompiledABI) -> None:
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = _cache_path(cache_dir, compiled.abi_hash)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, prefix=".compiled-abi-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(compiled, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def compile_abi(abi: ABI, cache_dir: Optional[str] = None) -> CompiledABI:
+    """Return the CompiledABI for ``abi``, memoized in-process by abi_hash.
+
+    When ``cache_dir`` (or ``$ASX_ORACLE_ABI_CACHE``) is set, a miss first
+    tries ``<cache_dir>/<abi_hash>.compiled-abi.v<N>.pkl`` and writes it back
+    after compiling, so fresh worker processes start warm.
+    """
+    compiled = _CACHE.get(abi.abi_hash)
+    if compiled is not None:
+        return compiled
+
+    cache_dir = cache_dir or os.environ.get(CACHE_DIR_ENV)
+    disk = Path(cache_dir) if cache_dir else None
+    if disk is not None:
+        compiled = _load_from_disk(disk, abi.abi_hash)
+    if compiled is None:
+        compiled = _build(abi)
+        if disk is not None:
+            _store_to_disk(disk, compiled)
+
+    _CACHE.put(compiled)
+    return compiled
+
+
+def set_compiled_abi_cache_size(maxsize: int) -> None:
+    if maxsize < 1:
+        raise ValueError("maxsize must be >= 1")
+    _CACHE.resize(maxsize)
+
+
+def clear_compiled_abi_cache() -> None:
+    _CACHE.clear()
@@ -0,0 +1,426 @@
+from __future__ import annotations
+
+import sys
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from .abi import ABI
+from .compiled import CompiledABI, compile_abi
+from .ggl_legal import LegalityTracker
+from .ggl_parse import ParseError, ParserState
+from .oracle import BOUNDARY_CLOSE, BOUNDARY_OPEN
+
+_PRE = 0
+_BODY = 1
+_POST = 2
+_DEAD = 3
+
+
+class GenerationCursor:
+    """Tracks a generation character by character against the full oracle.
+
+    A cursor is alive while the text so far can still be completed into
+    something ``ggl_legality_oracle`` accepts: optional whitespace,
+    ``<GGL>``, a payload that passes the tokenizer ABI, parses and fits the
+    grammar limits and ``@legality`` rules, ``</GGL>``, then whitespace only.
+    ``@legality`` rules are tracked as the parser emits nodes, so a cursor
+    dies as soon as a rule is broken and closing never re-parses the payload.
+    """
+
+    __slots__ = (
+        "_abi",
+        "phase",
+        "tag",
+        "parse",
+        "legal",
+        "events",
+        "seen",
+        "ws_bad",
+        "length",
+        "body_len",
+    )
+
+    def __init__(self, compiled: CompiledABI) -> None:
+        self._abi = compiled
+        self.phase = _PRE
+        self.tag = ""
+        self.parse: Optional[ParserState] = None
+        # Legality of the nodes parsed so far, and the last parser event it saw.
+        self.legal: Optional[LegalityTracker] = None
+        self.events: Any = None
+        self.seen = False
+        self.ws_bad = False
+        self.length = 0
+        self.body_len = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.phase != _DEAD
+
+    @property
+    def complete(self) -> bool:
+        """True once the closing boundary has been accepted."""
+        return self.phase == _POST
+
+    def copy(self) -> "GenerationCursor":
+        other = GenerationCursor.__new__(GenerationCursor)
+        other._abi = self._abi
+        other.phase = self.phase
+        other.tag = self.tag
+        other.parse = self.parse.copy() if self.parse is not None else None
+        other.legal = self.legal.copy() if self.legal is not None else None
+        other.events = self.events
+        other.seen = self.seen
+        other.ws_bad = self.ws_bad
+        other.length = self.length
+        other.body_len = self.body_len
+        return other
+
+    def push(self, text: str) -> bool:
+        for ch in text:
+            if not self._push_char(ch):
+                self.phase = _DEAD
+                return False
+        return True
+
+    def key(self, budget_cap: int, legal_slack: Sequence[int] = ()) -> Hashable:
+        """State summary that decides which continuations are legal.
+
+        The remaining max_length budget only matters once it drops below
+        ``budget_cap`` (the longest vocabulary entry), so larger budgets share
+        one key. Likewise a ``max_nodes`` counter is only part of the key once
+        its remaining budget is within its ``legal_slack`` entry.
+        """
+        if self.phase == _BODY:
+            budget = None
+            max_length = self._abi.limits.max_length
+            if max_length is not None:
+                # Measured from ``length``: pending whitespace counts once
+                # more payload follows it.
+                remaining = max_length - self.length
+                if remaining < budget_cap:
+                    budget = remaining
+            parser_key = self._abi.parser.state_key(self.parse)
+            legal = None
+            if self.legal is not None:
+                legal = self.legal.key(legal_slack)
+                if self.legal.plan.token_checks:
+                    # Token rules judge the text of the token still being lexed.
+                    legal += (self.parse.buf,)
+            return (self.phase, self.tag, parser_key, legal, self.seen, self.ws_bad, budget)
+        return (self.phase, self.tag)
+
+    def _push_char(self, ch: str) -> bool:
+        phase = self.phase
+        if phase == _BODY:
+            return self._push_body(ch)
+        if phase == _PRE:
+            if self.tag or ch == "<":
+                tag = self.tag + ch
+                if not BOUNDARY_OPEN.startswith(tag):
+                    return False
+                if tag == BOUNDARY_OPEN:
+                    self.phase = _BODY
+                    self.parse = self._abi.parser.start()
+                    plan = self._abi.limits.plan
+                    if self._abi.parser.structural and not plan.empty:
+                        self.legal = LegalityTracker(plan)
+                    tag = ""
+                self.tag = tag
+                return True
+            return ch.isspace()
+        if phase == _POST:
+            return ch.isspace()
+        return False
+
+    def _push_body(self, ch: str) -> bool:
+        if self.tag or ch == "<":
+            tag = self.tag + ch
+            if BOUNDARY_CLOSE.startswith(tag):
+                self.tag = tag
+                if tag == BOUNDARY_CLOSE:
+                    return self._close()
+                # Held characters stay viable if either reading still can be.
+                return self._can_close() or self._payload_viable(tag)
+            # Not the closing boundary after all: the held characters are payload.
+            self.tag = ""
+            for held in tag[:-1]:
+                if not self._payload(held):
+                    return False
+            return self._push_body(ch)
+        return self._payload(ch)
+
+    def _payload(self, ch: str) -> bool:
+        validator = self._abi.tokenizer
+        if ch.isspace():
+            if not self.seen:
+                # Leading whitespace is stripped by the oracle.
+                return True
+            if validator.classify(ch) is not None:
+                # Trailing whitespace is stripped, so this is only legal right
+                # before the closing boundary.
+                if not self._can_close():
+                    return False
+                self.ws_bad = True
+            self.length += 1
+            return self._feed(ch)
+
+        if self.ws_bad or validator.classify(ch) is not None:
+            return False
+        self.seen = True
+        self.length += 1
+        self.body_len = self.length
+        max_length = self._abi.limits.max_length
+        if max_length is not None and self.body_len > max_length:
+            return False
+        return self._feed(ch)
+
+    def _feed(self, ch: str) -> bool:
+        parser = self._abi.parser
+        if not parser.feed(self.parse, ch):
+            return False
+        legal = self.legal
+        if legal is not None and self.parse.events is not self.events:
+            parser.replay(self.parse.events, self.events, legal)
+            self.events = self.parse.events
+            return not legal.violated
+        return True
+
+    def _can_close(self) -> bool:
+        if not self.seen:
+            return False
+        parser = self._abi.parser
+        try:
+            closed = parser.close(self.parse)
+        except ParseError:
+            return False
+        if self.legal is None:
+            return True
+        legal = self.legal.copy()
+        parser.replay(closed.events, self.events, legal)
+        return not legal.violated
+
+    def _payload_viable(self, held: str) -> bool:
+        probe = self.copy()
+        probe.tag = ""
+        return all(probe._payload(ch) for ch in held)
+
+    def _close(self) -> bool:
+        if not self._can_close():
+            return False
+        self.phase = _POST
+        self.tag = ""
+        self.parse = None
+        return True
+
+
+class VocabIndex:
+    """Decoded vocabulary sorted by text, with shared-prefix lengths.
+
+    Walking the sorted list behaves like a trie walk: a cursor advanced over
+    a common prefix is reused by every entry sharing it, and once a prefix
+    dies the entries under it are jumped over by binary search.
+    """
+
+    def __init__(self, texts: Sequence[Optional[str]], eos_ids: Iterable[int]) -> None:
+        self.size = len(texts)
+        self.by_id = list(texts)
+        self.eos_ids = tuple(sorted(set(int(i) for i in eos_ids)))
+        entries = sorted(
+            (text, tid)
+            for tid, text in enumerate(texts)
+            if text and tid not in self.eos_ids
+        )
+        self.texts = [text for text, _ in entries]
+        self.ids = [tid for _, tid in entries]
+        self.lcp = [0] * len(entries)
+        for i in range(1, len(entries)):
+            a, b = self.texts[i - 1], self.texts[i]
+            n = min(len(a), len(b))
+            k = 0
+            while k < n and a[k] == b[k]:
+                k += 1
+            self.lcp[i] = k
+        self.max_len = max((len(t) for t in self.texts), default=0)
+
+    def _subtree_end(self, lo: int, prefix: str) -> int:
+        """Index of the first entry at or after ``lo`` that does not start with ``prefix``."""
+        last = ord(prefix[-1])
+        if last < sys.maxunicode:
+            return bisect_left(self.texts, prefix[:-1] + chr(last + 1), lo)
+        while lo < len(self.texts) and self.texts[lo].startswith(prefix):
+            lo += 1
+        return lo
+
+    def allowed(self, cursor: GenerationCursor) -> List[int]:
+        """Ids whose text keeps ``cursor`` alive, sorted.
+
+        Costs one cursor step per character of every live prefix: a dead
+        prefix skips its whole subtree by binary search, but a state that
+        accepts most of the vocabulary (e.g. inside an identifier) still
+        walks all of it in Python, ~0.5s for a 60k vocabulary. GGLConstraint
+        memoizes the result per state, so that is paid once per state.
+        """
+        allowed: List[int] = []
+        if not cursor.alive:
+            return allowed
+        if cursor.complete:
+            allowed.extend(self.eos_ids)
+        texts, lcps = self.texts, self.lcp
+        stack = [cursor]
+        i = 0
+        while i < len(texts):
+            text = texts[i]
+            lcp = lcps[i]
+            del stack[lcp + 1 :]
+            for k in range(lcp, len(text)):
+                nxt = stack[k].copy()
+                if not nxt.push(text[k]):
+                    i = self._subtree_end(i + 1, text[: k + 1])
+                    break
+                stack.append(nxt)
+            else:
+                allowed.append(self.ids[i])
+                i += 1
+        allowed.sort()
+        return allowed
+
+
+class GGLConstraint:
+    """Per-(ABI, tokenizer) tables for grammar-constrained decoding.
+
+    ``allowed_ids`` is memoized by cursor state, so after warm-up each decode
+    step is a cursor advance plus a dictionary lookup. The HF logits processor
+    in :mod:`oracle.hf_loss` is a thin wrapper over this class.
+
+    ``max_nodes`` counts grow with every token, so they only enter the key
+    when close to their limit: ``_slack`` holds, per counter, the most any
+    vocabulary walk has grown it without going over, and an allowed set
+    computed with more budget left than that holds for any such budget.
+    """
+
+    def __init__(
+        self,
+        abi: ABI,
+        vocab_texts: Sequence[Optional[str]],
+        eos_ids: Iterable[int],
+        *,
+        max_cached_states: int = 4096,
+    ) -> None:
+        self.compiled = compile_abi(abi)
+        self.vocab = VocabIndex(vocab_texts, eos_ids)
+        self.max_cached_states = max_cached_states
+        self._allowed: "OrderedDict[Hashable, Tuple[int, ...]]" = OrderedDict()
+        self._slack = [0] * len(self.compiled.limits.plan.counters)
+        self.hits = 0
+        self.misses = 0
+
+    def start(self) -> GenerationCursor:
+        return GenerationCursor(self.compiled)
+
+    def state_key(self, cursor: GenerationCursor) -> Hashable:
+        return cursor.key(self.vocab.max_len, self._slack)
+
+    def allowed_ids(self, cursor: GenerationCursor) -> Tuple[int, ...]:
+        key = self.state_key(cursor)
+        allowed = self._allowed.get(key)
+        if allowed is not None:
+            self.hits += 1
+            self._allowed.move_to_end(key)
+            return allowed
+        self.misses += 1
+        legal = cursor.legal
+        if legal is None or not self._slack:
+            allowed = tuple(self.vocab.allowed(cursor))
+        else:
+            probe = cursor.copy()
+            probe.legal.peak = peak = list(legal.counts)
+            allowed = tuple(self.vocab.allowed(probe))
+            for i, (limit, _, _) in enumerate(legal.plan.counters):
+                if peak[i] > limit:
+                    # Some entry went over: the set depends on this exact count.
+                    self._slack[i] = max(self._slack[i], limit - legal.counts[i])
+                else:
+                    self._slack[i] = max(self._slack[i], peak[i] - legal.counts[i])
+            key = self.state_key(cursor)
+        self._allowed[key] = allowed
+        while len(self._allowed) > self.max_cached_states:
+            self._allowed.popitem(last=False)
+        return allowed
+
+    def advance(self, cursor: GenerationCursor, token_id: int) -> GenerationCursor:
+        """Return a new cursor with ``token_id`` appended; ``cursor`` is unchanged."""
+        nxt = cursor.copy()
+        text = self.vocab.by_id[token_id] if 0 <= token_id < self.vocab.size else None
+        if not text:
+            if token_id not in self.vocab.eos_ids or not cursor.complete:
+                nxt.phase = _DEAD
+            return nxt
+        nxt.push(text)
+        return nxt
+
+
+def _decode(tokenizer: Any, ids: List[int]) -> str:
+    return tokenizer.decode(ids, skip_special_tokens=False, clean_up_tokenization_spaces=False)
+
+
+def _anchor_id(tokenizer: Any, special: Iterable[int]) -> Optional[int]:
+    """A plain token to decode others after, so they decode as they do mid-sequence."""
+    ids = tokenizer.encode("a", add_special_tokens=False)
+    if ids and ids[-1] not in special:
+        text = _decode(tokenizer, [ids[-1]])
+        if text and "\ufffd" not in text:
+            return ids[-1]
+    return None
+
+
+def decode_vocab(tokenizer: Any) -> List[Optional[str]]:
+    """Text every vocabulary id contributes mid-sequence, the way free-run text is assembled.
+
+    Each id is decoded after an anchor token and the anchor's own text is
+    cut off, so SentencePiece ``▁`` pieces keep their leading space. Ids
+    that decode to U+FFFD there (byte-level pieces of a split UTF-8
+    character) have no text of their own and are left out (None).
+    """
+    size = len(tokenizer)
+    special = set(getattr(tokenizer, "all_special_ids", []) or [])
+    anchor = _anchor_id(tokenizer, special)
+    head = _decode(tokenizer, [anchor]) if anchor is not None else ""
+    texts: List[Optional[str]] = []
+    for tid in range(size):
+        if tid in special:
+            texts.append(None)
+            continue
+        text = None
+        if anchor is not None:
+            pair = _decode(tokenizer, [anchor, tid])
+            if pair.startswith(head):
+                text = pair[len(head) :]
+        if text is None:
+            text = _decode(tokenizer, [tid])
+        texts.append(None if "\ufffd" in text else text)
+    return texts
+
+
+def constraint_for_tokenizer(
+    abi: ABI,
+    tokenizer: Any,
+    *,
+    eos_token_id: Optional[Any] = None,
+    max_cached_states: int = 4096,
+) -> GGLConstraint:
+    if eos_token_id is None:
+        eos_token_id = tokenizer.eos_token_id
+    if eos_token_id is None:
+        eos_ids: List[int] = []
+    elif isinstance(eos_token_id, int):
+        eos_ids = [eos_token_id]
+    else:
+        eos_ids = list(eos_token_id)
+    return GGLConstraint(
+        abi,
+        decode_vocab(tokenizer),
+        eos_ids,
+        max_cached_states=max_cached_states,
+    )
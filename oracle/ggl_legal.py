@@ -1,7 +1,8 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Dict
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
 
 @dataclass
@@ -15,21 +16,513 @@ class LegalityError(Exception):
         return f"{self.code}: {self.msg}"
 
 
+# Visitor-plan opcodes. Node checks run when a node is entered; token checks
+# run on leaves; counters are bumped for every matching node or token.
+_OP_MAX_CHILDREN = 0
+_OP_TOKEN_PATTERN = 1
+_OP_TOKEN_MAX_LENGTH = 2
+_OP_TOKEN_FORBIDDEN = 3
+
+_RULE_CODES = {
+    "max_depth": "E_LEGAL_MAX_DEPTH",
+    "max_nodes": "E_LEGAL_MAX_NODES",
+    "max_children": "E_LEGAL_MAX_CHILDREN",
+    "token_pattern": "E_LEGAL_TOKEN_PATTERN",
+    "token_max_length": "E_LEGAL_TOKEN_LENGTH",
+    "forbid_values": "E_LEGAL_FORBIDDEN_TOKEN",
+}
+
+# (opcode, argument, error code)
+_Check = Tuple[int, Any, str]
+# (limit, error code, description)
+_Counter = Tuple[int, str, str]
+
+
+@dataclass(frozen=True)
+class LegalityPlan:
+    """``@legality`` rules flattened into per-type check tables.
+
+    Every rule is evaluated during one pre-order walk of the AST, so the
+    cost is one dict lookup per node plus the checks that actually apply
+    to its type.
+    """
+
+    max_depth: Optional[Tuple[int, str]] = None
+    node_checks: Dict[str, Tuple[_Check, ...]] = field(default_factory=dict)
+    token_checks: Dict[str, Tuple[_Check, ...]] = field(default_factory=dict)
+    counters: Tuple[_Counter, ...] = ()
+    # Counter indices bumped per node/token type, and for every non-token node.
+    counted_types: Dict[str, Tuple[int, ...]] = field(default_factory=dict)
+    counted_nodes: Tuple[int, ...] = ()
+
+    @property
+    def empty(self) -> bool:
+        return (
+            self.max_depth is None
+            and not self.node_checks
+            and not self.token_checks
+            and not self.counters
+        )
+
+
+@dataclass(frozen=True)
+class GrammarLimits:
+    ast_type: str
+    max_length: Optional[int]
+    plan: LegalityPlan = field(default_factory=LegalityPlan)
+
+
+def _rule_error(msg: str) -> LegalityError:
+    return LegalityError(code="E_LEGAL_RULE", msg=msg)
+
+
+def _limit(rule: Dict[str, Any], key: str = "max") -> int:
+    value = rule.get(key)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise _rule_error(f"rule {rule.get('kind')!r} needs a non-negative integer {key!r}")
+    return value
+
+
+def _type_name(rule: Dict[str, Any], key: str) -> str:
+    value = rule.get(key)
+    if not isinstance(value, str) or not value:
+        raise _rule_error(f"rule {rule.get('kind')!r} needs a {key!r} type name")
+    return value
+
+
+def compile_legality_plan(rules: Optional[Sequence[Dict[str, Any]]]) -> LegalityPlan:
+    max_depth: Optional[Tuple[int, str]] = None
+    node_checks: Dict[str, List[_Check]] = {}
+    token_checks: Dict[str, List[_Check]] = {}
+    counters: List[_Counter] = []
+    counted_types: Dict[str, List[int]] = {}
+    counted_nodes: List[int] = []
+
+    for rule in rules or ():
+        kind = rule.get("kind")
+        if kind not in _RULE_CODES:
+            raise _rule_error(f"unknown legality rule kind {kind!r}")
+        code = str(rule.get("code") or _RULE_CODES[kind])
+        if kind == "max_depth":
+            limit = _limit(rule)
+            if max_depth is None or limit < max_depth[0]:
+                max_depth = (limit, code)
+        elif kind == "max_nodes":
+            if rule.get("node") is None:
+                counted_nodes.append(len(counters))
+                counters.append((_limit(rule), code, "nodes"))
+            else:
+                node = _type_name(rule, "node")
+                counted_types.setdefault(node, []).append(len(counters))
+                counters.append((_limit(rule), code, f"{node} nodes"))
+        elif kind == "max_children":
+            node_checks.setdefault(_type_name(rule, "node"), []).append(
+                (_OP_MAX_CHILDREN, _limit(rule), code)
+            )
+        elif kind == "token_pattern":
+            try:
+                pattern = re.compile(str(rule.get("re", "")))
+            except re.error as e:
+                raise _rule_error(f"bad token_pattern regex: {e}") from None
+            token_checks.setdefault(_type_name(rule, "token"), []).append(
+                (_OP_TOKEN_PATTERN, pattern, code)
+            )
+        elif kind == "token_max_length":
+            token_checks.setdefault(_type_name(rule, "token"), []).append(
+                (_OP_TOKEN_MAX_LENGTH, _limit(rule), code)
+            )
+        else:
+            values = rule.get("values")
+            if not isinstance(values, list):
+                raise _rule_error("rule 'forbid_values' needs a 'values' list")
+            token_checks.setdefault(_type_name(rule, "token"), []).append(
+                (_OP_TOKEN_FORBIDDEN, frozenset(str(v) for v in values), code)
+            )
+
+    return LegalityPlan(
+        max_depth=max_depth,
+        node_checks={k: tuple(v) for k, v in node_checks.items()},
+        token_checks={k: tuple(v) for k, v in token_checks.items()},
+        counters=tuple(counters),
+        counted_types={k: tuple(v) for k, v in counted_types.items()},
+        counted_nodes=tuple(counted_nodes),
+    )
+
+
+def compile_grammar_limits(grammar_abi: Dict[str, Any]) -> GrammarLimits:
+    max_length = grammar_abi.get("max_length")
+    return GrammarLimits(
+        ast_type=grammar_abi.get("ast_type", "ggl.program.v1"),
+        max_length=max_length if isinstance(max_length, int) else None,
+        plan=compile_legality_plan(grammar_abi.get("@legality")),
+    )
+
+
 def check_legality(ast: Dict[str, Any], grammar_abi: Dict[str, Any]) -> None:
-    expected_type = grammar_abi.get("ast_type", "ggl.program.v1")
-    if ast.get("type") != expected_type:
-        raise LegalityError(
-            code="E_LEGAL_AST_TYPE",
-            msg=f"expected ast type {expected_type}, got {ast.get('type')}",
+    check_legality_limits(ast, compile_grammar_limits(grammar_abi))
+
+
+def check_legality_limits(ast: Dict[str, Any], limits: GrammarLimits) -> None:
+    """Raise the first LegalityError, in document order after the whole-body checks."""
+    _run_checks(ast, limits, None)
+
+
+def check_body_limits(ast_type: Any, length: int, limits: GrammarLimits) -> None:
+    """The whole-body checks of ``check_legality_limits``, for a non-empty body."""
+    _check_type(ast_type, limits, None)
+    _check_length(length, limits, None)
+
+
+def legality_errors(ast: Dict[str, Any], limits: GrammarLimits) -> List[LegalityError]:
+    """Every violation instead of just the first (each counter rule reports once)."""
+    errors: List[LegalityError] = []
+    _run_checks(ast, limits, errors)
+    return errors
+
+
+def check_legality_plan(ast: Dict[str, Any], plan: LegalityPlan) -> None:
+    """Raise the first ``@legality`` rule violation, skipping the whole-body checks."""
+    children = ast.get("children")
+    if children and not plan.empty:
+        _walk(children, plan, None)
+
+
+class LegalityTracker:
+    """``check_legality_plan`` run incrementally over AST nodes as a parser emits them.
+
+    Nodes arrive through ``open_node``/``close_node``/``token`` (see
+    ``GGLParser.replay``). Every rule bounds something that only grows --
+    a count, a depth, a child list, a token already emitted -- so once
+    ``violated`` is set no continuation can clear it. When ``peak`` is a
+    list, this tracker and all its copies record the highest value each
+    counter reaches in it.
+    """
+
+    __slots__ = ("plan", "counts", "open_types", "open_kids", "violated", "peak")
+
+    def __init__(self, plan: LegalityPlan) -> None:
+        self.plan = plan
+        self.counts = [0] * len(plan.counters)
+        self.open_types: List[str] = []
+        self.open_kids: List[int] = []
+        self.violated = False
+        self.peak: Optional[List[int]] = None
+
+    def copy(self) -> "LegalityTracker":
+        other = LegalityTracker.__new__(LegalityTracker)
+        other.plan = self.plan
+        other.counts = list(self.counts)
+        other.open_types = list(self.open_types)
+        other.open_kids = list(self.open_kids)
+        other.violated = self.violated
+        other.peak = self.peak
+        return other
+
+    def key(self, slack: Sequence[int]) -> Tuple[Any, ...]:
+        """Hashable state; a count whose remaining budget exceeds ``slack`` is left out."""
+        counts = tuple(
+            count if limit - count <= room else None
+            for count, (limit, _, _), room in zip(self.counts, self.plan.counters, slack)
+        )
+        checked = self.plan.node_checks
+        kids = tuple(
+            (ntype, n) if ntype in checked else None
+            for ntype, n in zip(self.open_types, self.open_kids)
         )
+        return (counts, kids)
+
+    def open_node(self, ntype: str, line: int = 0, col: int = 0) -> None:
+        self._child()
+        self._count(ntype, False)
+        plan = self.plan
+        if plan.max_depth is not None and len(self.open_types) + 1 > plan.max_depth[0]:
+            self.violated = True
+        self.open_types.append(ntype)
+        self.open_kids.append(0)
+
+    def close_node(self) -> None:
+        if self.open_types:
+            self.open_types.pop()
+            self.open_kids.pop()
+
+    def token(self, ttype: str, value: str, line: int = 0, col: int = 0) -> None:
+        self._child()
+        self._count(ttype, True)
+        checks = self.plan.token_checks.get(ttype)
+        if checks:
+            errors: List[LegalityError] = []
+            _check_token({"value": value}, ttype, checks, errors)
+            if errors:
+                self.violated = True
+
+    def _child(self) -> None:
+        if not self.open_kids:
+            return
+        self.open_kids[-1] += 1
+        checks = self.plan.node_checks.get(self.open_types[-1])
+        if checks:
+            for op, arg, _ in checks:
+                if op == _OP_MAX_CHILDREN and self.open_kids[-1] > arg:
+                    self.violated = True
+
+    def _count(self, ntype: str, is_token: bool) -> None:
+        plan = self.plan
+        if not plan.counters:
+            return
+        bumped = plan.counted_types.get(ntype, ())
+        if not is_token:
+            bumped += plan.counted_nodes
+        counts, peak = self.counts, self.peak
+        for i in bumped:
+            counts[i] += 1
+            if counts[i] > plan.counters[i][0]:
+                self.violated = True
+            if peak is not None and counts[i] > peak[i]:
+                peak[i] = counts[i]
+
+
+class LegalityRecorder:
+    """The LegalityError ``check_legality_plan`` would raise, found from parser events.
+
+    Fed like LegalityTracker, but it keeps the first violation in document
+    order instead of a flag, and only O(depth) state, so a streamed payload
+    can be checked without building its AST. A ``max_children`` violation
+    belongs to its node, which precedes its children, and is only known
+    once the node closes; ``error`` is final after the last close.
+    """
+
+    __slots__ = ("plan", "counts", "open", "seq", "depth_reported", "error", "error_seq")
+
+    def __init__(self, plan: LegalityPlan) -> None:
+        self.plan = plan
+        self.counts = [0] * len(plan.counters)
+        # [type, seq, line, col, children] of every open node.
+        self.open: List[List[Any]] = []
+        self.seq = 0
+        self.depth_reported = False
+        self.error: Optional[LegalityError] = None
+        self.error_seq = 0
+
+    def copy(self) -> "LegalityRecorder":
+        other = LegalityRecorder.__new__(LegalityRecorder)
+        other.plan = self.plan
+        other.counts = list(self.counts)
+        other.open = [list(node) for node in self.open]
+        other.seq = self.seq
+        other.depth_reported = self.depth_reported
+        other.error = self.error
+        other.error_seq = self.error_seq
+        return other
+
+    def open_node(self, ntype: str, line: int = 0, col: int = 0) -> None:
+        seq = self._visit(ntype, False, line, col)
+        depth_limit = self.plan.max_depth
+        depth = len(self.open) + 1
+        if depth_limit is not None and depth > depth_limit[0] and not self.depth_reported:
+            self.depth_reported = True
+            self._report(
+                seq,
+                LegalityError(
+                    depth_limit[1], f"nesting depth {depth} exceeds {depth_limit[0]}", line, col
+                ),
+            )
+        self.open.append([ntype, seq, line, col, 0])
+
+    def close_node(self) -> None:
+        if not self.open:
+            return
+        ntype, seq, line, col, kids = self.open.pop()
+        for op, arg, code in self.plan.node_checks.get(ntype, ()):
+            if op == _OP_MAX_CHILDREN and kids > arg:
+                self._report(
+                    seq, LegalityError(code, f"{ntype} has {kids} children, limit {arg}", line, col)
+                )
+
+    def token(self, ttype: str, value: str, line: int = 0, col: int = 0) -> None:
+        seq = self._visit(ttype, True, line, col)
+        checks = self.plan.token_checks.get(ttype)
+        if checks:
+            errors: List[LegalityError] = []
+            _check_token({"value": value, "line": line, "col": col}, ttype, checks, errors)
+            if errors:
+                self._report(seq, errors[0])
+
+    def _visit(self, ntype: str, is_token: bool, line: int, col: int) -> int:
+        """Number the node in document order, count it and bump its parent's children."""
+        self.seq += 1
+        if self.open:
+            self.open[-1][4] += 1
+        plan = self.plan
+        if plan.counters:
+            bumped = plan.counted_types.get(ntype, ())
+            if not is_token:
+                bumped += plan.counted_nodes
+            for i in bumped:
+                self.counts[i] += 1
+                limit, code, what = plan.counters[i]
+                if self.counts[i] == limit + 1:
+                    err = LegalityError(code, f"more than {limit} {what}", line, col)
+                    self._report(self.seq, err)
+        return self.seq
+
+    def _report(self, seq: int, err: LegalityError) -> None:
+        if self.error is None or seq < self.error_seq:
+            self.error = err
+            self.error_seq = seq
+
+
+def _report(errors: Optional[List[LegalityError]], err: LegalityError) -> None:
+    if errors is None:
+        raise err
+    errors.append(err)
+
+
+def _run_checks(
+    ast: Dict[str, Any],
+    limits: GrammarLimits,
+    errors: Optional[List[LegalityError]],
+) -> None:
+    _check_type(ast.get("type"), limits, errors)
 
     body = ast.get("body")
     if not isinstance(body, str) or not body.strip():
-        raise LegalityError(code="E_LEGAL_EMPTY", msg="GGL body missing or empty")
+        _report(errors, LegalityError(code="E_LEGAL_EMPTY", msg="GGL body missing or empty"))
+        body = ""
+    _check_length(len(body), limits, errors)
 
-    max_length = grammar_abi.get("max_length")
-    if isinstance(max_length, int) and len(body) > max_length:
-        raise LegalityError(
-            code="E_LEGAL_MAX_LENGTH",
-            msg=f"GGL body length {len(body)} exceeds {max_length}",
+    children = ast.get("children")
+    if children and not limits.plan.empty:
+        _walk(children, limits.plan, errors)
+
+
+def _check_type(
+    ast_type: Any, limits: GrammarLimits, errors: Optional[List[LegalityError]]
+) -> None:
+    expected_type = limits.ast_type
+    if ast_type != expected_type:
+        _report(
+            errors,
+            LegalityError(
+                code="E_LEGAL_AST_TYPE",
+                msg=f"expected ast type {expected_type}, got {ast_type}",
+            ),
         )
+
+
+def _check_length(
+    length: int, limits: GrammarLimits, errors: Optional[List[LegalityError]]
+) -> None:
+    max_length = limits.max_length
+    if max_length is not None and length > max_length:
+        _report(
+            errors,
+            LegalityError(
+                code="E_LEGAL_MAX_LENGTH",
+                msg=f"GGL body length {length} exceeds {max_length}",
+            ),
+        )
+
+
+def _walk(
+    children: List[Dict[str, Any]],
+    plan: LegalityPlan,
+    errors: Optional[List[LegalityError]],
+) -> None:
+    node_checks = plan.node_checks
+    token_checks = plan.token_checks
+    depth_limit, depth_code = plan.max_depth if plan.max_depth is not None else (None, "")
+    depth_reported = False
+    counters = plan.counters
+    counted_types = plan.counted_types
+    counted_nodes = plan.counted_nodes
+    counts = [0] * len(counters)
+
+    # One iterator per open node keeps the walk pre-order without copying
+    # child lists; the stack height is the depth of the node being visited.
+    stack: List[Iterator[Dict[str, Any]]] = [iter(children)]
+    while stack:
+        node = next(stack[-1], None)
+        if node is None:
+            stack.pop()
+            continue
+        ntype = node.get("type")
+        kids = node.get("children")
+        is_token = kids is None
+
+        if counters:
+            bumped = counted_types.get(ntype, ())
+            if not is_token:
+                bumped += counted_nodes
+            for i in bumped:
+                counts[i] += 1
+                limit, code, what = counters[i]
+                # Reported once, by the node that first goes over.
+                if counts[i] == limit + 1:
+                    _report(
+                        errors,
+                        LegalityError(
+                            code,
+                            f"more than {limit} {what}",
+                            node.get("line", 0),
+                            node.get("col", 0),
+                        ),
+                    )
+
+        if is_token:
+            checks = token_checks.get(ntype)
+            if checks:
+                _check_token(node, ntype, checks, errors)
+            continue
+
+        depth = len(stack)
+        if depth_limit is not None and depth > depth_limit and not depth_reported:
+            depth_reported = True
+            _report(
+                errors,
+                LegalityError(
+                    depth_code,
+                    f"nesting depth {depth} exceeds {depth_limit}",
+                    node.get("line", 0),
+                    node.get("col", 0),
+                ),
+            )
+
+        checks = node_checks.get(ntype)
+        if checks:
+            for op, arg, code in checks:
+                if op == _OP_MAX_CHILDREN and len(kids) > arg:
+                    _report(
+                        errors,
+                        LegalityError(
+                            code,
+                            f"{ntype} has {len(kids)} children, limit {arg}",
+                            node.get("line", 0),
+                            node.get("col", 0),
+                        ),
+                    )
+
+        if kids:
+            stack.append(iter(kids))
+
+
+def _check_token(
+    node: Dict[str, Any],
+    ttype: str,
+    checks: Tuple[_Check, ...],
+    errors: Optional[List[LegalityError]],
+) -> None:
+    value = str(node.get("value", ""))
+    for op, arg, code in checks:
+        if op == _OP_TOKEN_PATTERN:
+            if arg.fullmatch(value) is not None:
+                continue
+            msg = f"{ttype} {value!r} does not match {arg.pattern!r}"
+        elif op == _OP_TOKEN_MAX_LENGTH:
+            if len(value) <= arg:
+                continue
+            msg = f"{ttype} {value!r} is longer than {arg}"
+        else:
+            if value not in arg:
+                continue
+            msg = f"{ttype} {value!r} is not allowed"
+        _report(errors, LegalityError(code, msg, node.get("line", 0), node.get("col", 0)))
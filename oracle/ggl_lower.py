@@ -1,7 +1,21 @@
 from __future__ import annotations
 
+import json
+import threading
 from dataclasses import dataclass
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .canon import INLINE_LEN, _CanonWriter
+
+# ensure_ascii=False string quoting, exactly as the canonical encoder does it.
+_quote: Callable[[str], str] = json.encoder.encode_basestring
+
+# Lowering contracts with a structural scene. Any other contract id keeps the
+# body-only scene ({"@type", "ggl", "@lowering"}).
+SCENE_CONTRACT_V1 = "asx://lower/ggl.scene.v1"
+_STRUCTURAL_CONTRACTS = frozenset((SCENE_CONTRACT_V1,))
+
+DEFAULT_INTERN_ENTRIES = 1 << 18
 
 
 @dataclass
@@ -13,16 +27,217 @@ class LowerError(Exception):
         return f"{self.code}: {self.msg}"
 
 
+class SceneInterner:
+    """Hash-consing table for lowered subtrees.
+
+    Scene nodes carry no positions, so equal subtrees (the same statement
+    repeated within or across generations) lower to the same object. Each
+    entry gets a serial number; a node's key is its type plus its children's
+    serials, so lookups never hash a subtree twice. The table is cleared
+    once it holds ``max_entries``; serials keep counting, so stale keys
+    simply miss. Lowered scenes are shared and must be treated as read-only.
+
+    One interner may be shared by threads (the module default is): inserts
+    take a lock, so two subtrees never get the same serial, while hits are
+    plain dict reads.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_INTERN_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._table: Dict[Tuple[Any, ...], Tuple[int, Dict[str, Any]]] = {}
+        self._serial = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def _add(self, key: Tuple[Any, ...], obj: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        with self._lock:
+            entry = self._table.get(key)
+            if entry is not None:
+                # Another thread interned it first.
+                return entry
+            if len(self._table) >= self.max_entries:
+                self._table.clear()
+            entry = (self._serial, obj)
+            self._serial += 1
+            self._table[key] = entry
+            self.misses += 1
+        return entry
+
+    def token(self, ttype: str, value: str) -> Tuple[int, Dict[str, Any]]:
+        key = (ttype, value)
+        entry = self._table.get(key)
+        if entry is None:
+            return self._add(key, {"@type": ttype, "value": value})
+        self.hits += 1
+        return entry
+
+    def node(
+        self, ntype: str, kids: List[Tuple[int, Dict[str, Any]]]
+    ) -> Tuple[int, Dict[str, Any]]:
+        # Token keys are 2-tuples of strings; node keys are (type, serials).
+        key = (ntype, tuple([serial for serial, _ in kids]))
+        entry = self._table.get(key)
+        if entry is None:
+            return self._add(key, {"@type": ntype, "children": tuple([obj for _, obj in kids])})
+        self.hits += 1
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._table.clear()
+
+
+_INTERNER = SceneInterner()
+
+
+@dataclass(frozen=True)
+class LoweringTemplate:
+    """Scene shape compiled once from ``lowered_type`` and ``lowering_contract_id``."""
+
+    lowered_type: str
+    lowering_contract_id: Optional[str]
+    structural: bool = False
+
+    def instantiate(self, body: str) -> Dict[str, Any]:
+        scene = {
+            "@type": self.lowered_type,
+            "ggl": body,
+        }
+        if self.lowering_contract_id:
+            scene["@lowering"] = self.lowering_contract_id
+        return scene
+
+    def canon_head(self) -> str:
+        """Canonical text of the scene up to the ``ggl`` value.
+
+        Canonical key order is ``@lowering``, ``@type``, ``ggl``, ``nodes``.
+        """
+        head = "{"
+        if self.lowering_contract_id:
+            head += '"@lowering":' + _quote(self.lowering_contract_id) + ","
+        return head + '"@type":' + _quote(self.lowered_type) + ',"ggl":'
+
+
+def compile_lowering(grammar_abi: Dict[str, Any]) -> LoweringTemplate:
+    contract = grammar_abi.get("lowering_contract_id")
+    return LoweringTemplate(
+        lowered_type=grammar_abi.get("lowered_type", "scene.ir.v1"),
+        lowering_contract_id=contract,
+        structural=contract in _STRUCTURAL_CONTRACTS,
+    )
+
+
 def lower_ast_to_scene_xjson(ast: Dict[str, Any], grammar_abi: Dict[str, Any]) -> Dict[str, Any]:
+    return lower_ast_with_template(ast, compile_lowering(grammar_abi))
+
+
+def _body(ast: Dict[str, Any]) -> str:
     body = ast.get("body")
     if not isinstance(body, str):
         raise LowerError(code="E_LOWER_BODY", msg="missing GGL body for lowering")
+    return body
+
+
+def lower_ast_with_template(
+    ast: Dict[str, Any],
+    template: LoweringTemplate,
+    interner: Optional[SceneInterner] = _INTERNER,
+) -> Dict[str, Any]:
+    """Lower ``ast`` into a scene dict.
 
-    scene = {
-        "@type": grammar_abi.get("lowered_type", "scene.ir.v1"),
-        "ggl": body,
-    }
-    lowering_contract = grammar_abi.get("lowering_contract_id")
-    if lowering_contract:
-        scene["@lowering"] = lowering_contract
+    Under a structural contract the scene also gets ``nodes``: the AST
+    without positions, with equal subtrees shared through ``interner``
+    (None shares only within this scene).
+    """
+    scene = template.instantiate(_body(ast))
+    children = ast.get("children")
+    if template.structural and children is not None:
+        if interner is None:
+            interner = SceneInterner()
+        scene["nodes"] = _lower_nodes(children, interner)
     return scene
+
+
+def _lower_nodes(
+    children: List[Dict[str, Any]],
+    interner: SceneInterner,
+) -> Tuple[Dict[str, Any], ...]:
+    # Post-order over an explicit stack: each frame is the node being built,
+    # the iterator over its AST children and the interned entries so far.
+    top: List[Tuple[int, Dict[str, Any]]] = []
+    stack: List[Tuple[Optional[Dict[str, Any]], Iterator[Dict[str, Any]], list]] = [
+        (None, iter(children), top)
+    ]
+    while stack:
+        node, it, acc = stack[-1]
+        child = next(it, None)
+        if child is None:
+            stack.pop()
+            if node is not None:
+                stack[-1][2].append(interner.node(node.get("type"), acc))
+            continue
+        kids = child.get("children")
+        if kids is None:
+            acc.append(interner.token(child.get("type"), str(child.get("value", ""))))
+        else:
+            stack.append((child, iter(kids), []))
+    return tuple([obj for _, obj in top])
+
+
+def write_lowered_canon(ast: Dict[str, Any], template: LoweringTemplate, out: Any) -> int:
+    """Stream the canonical bytes of the lowered scene into ``out``; return the byte count.
+
+    The bytes equal ``canon_json_bytes_v1(lower_ast_with_template(ast, template))``
+    but no scene dict is built: the template's fixed head is emitted once and
+    ``nodes`` is written straight from the AST. ``out`` has ``write(bytes)``
+    (a file or socket file) or ``update(bytes)`` (a hashlib object).
+    """
+    body = _body(ast)
+    sink = _CanonWriter(getattr(out, "write", None) or out.update, INLINE_LEN)
+    sink.emit(template.canon_head())
+    sink.emit(_quote(body))
+    children = ast.get("children")
+    if template.structural and children is not None:
+        sink.emit(',"nodes":')
+        _write_nodes(children, sink)
+    sink.emit("}")
+    sink.flush()
+    return sink.nbytes
+
+
+def _write_nodes(children: List[Dict[str, Any]], sink: _CanonWriter) -> None:
+    emit = sink.emit
+    emit("[")
+    # Each frame is the iterator over one children list and whether it has
+    # written an element yet.
+    stack: List[List[Any]] = [[iter(children), False]]
+    while stack:
+        frame = stack[-1]
+        child = next(frame[0], None)
+        if child is None:
+            stack.pop()
+            emit("]}" if stack else "]")
+            continue
+        sep = "," if frame[1] else ""
+        frame[1] = True
+        kids = child.get("children")
+        if kids is None:
+            emit(
+                sep
+                + '{"@type":'
+                + _quote(child.get("type"))
+                + ',"value":'
+                + _quote(str(child.get("value", "")))
+                + "}"
+            )
+        else:
+            emit(sep + '{"@type":' + _quote(child.get("type")) + ',"children":[')
+            stack.append([iter(kids), False])
+
+
+def clear_scene_intern_table() -> None:
+    _INTERNER.clear()
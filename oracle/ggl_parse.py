@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Any, Dict
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
 
 
 @dataclass
@@ -10,17 +10,976 @@ class ParseError(Exception):
     msg: str
     line: int = 0
     col: int = 0
+    # Characters of input before the failing token or character; at end of
+    # input, before the construct left unfinished.
+    offset: int = 0
 
     def __str__(self) -> str:
         return f"{self.code}: {self.msg}"
 
 
+# ---------------------------------------------------------------------------
+# Token patterns
+#
+# The grammar ABI declares tokens either as literals ({"t": "KW", "v": "Wo"})
+# or as regexes ({"t": "ID", "re": "..."}). Python's re module cannot tell
+# whether a string is a viable *prefix* of a match, which streaming needs, so
+# token regexes are compiled into one NFA that is determinized lazily. Only
+# the regex subset token specs need is supported: literals, escapes, classes,
+# ".", groups, "|", and the * + ? {m,n} quantifiers.
+# ---------------------------------------------------------------------------
+
+_CLASS_TESTS = {
+    "d": lambda ch: ch.isdecimal(),
+    "w": lambda ch: ch.isalnum() or ch == "_",
+    "s": lambda ch: ch.isspace(),
+    "D": lambda ch: not ch.isdecimal(),
+    "W": lambda ch: not (ch.isalnum() or ch == "_"),
+    "S": lambda ch: not ch.isspace(),
+}
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "f": "\f", "v": "\v", "0": "\0"}
+
+
+class _CharSet:
+    __slots__ = ("ranges", "classes", "negate")
+
+    def __init__(
+        self,
+        ranges: Sequence[Tuple[int, int]] = (),
+        classes: str = "",
+        negate: bool = False,
+    ) -> None:
+        self.ranges = tuple(ranges)
+        self.classes = classes
+        self.negate = negate
+
+    def __getstate__(self) -> Tuple[Any, ...]:
+        return self.ranges, self.classes, self.negate
+
+    def __setstate__(self, state: Tuple[Any, ...]) -> None:
+        self.ranges, self.classes, self.negate = state
+
+    def __contains__(self, ch: str) -> bool:
+        cp = ord(ch)
+        hit = False
+        for lo, hi in self.ranges:
+            if lo <= cp <= hi:
+                hit = True
+                break
+        if not hit:
+            for cls in self.classes:
+                if _CLASS_TESTS[cls](ch):
+                    hit = True
+                    break
+        return hit != self.negate
+
+
+def _literal_set(ch: str) -> _CharSet:
+    return _CharSet(ranges=((ord(ch), ord(ch)),))
+
+
+class _RegexReader:
+    """Recursive-descent reader turning a token regex into a small AST."""
+
+    def __init__(self, pattern: str) -> None:
+        self.p = pattern
+        self.i = 0
+
+    def fail(self, msg: str) -> ParseError:
+        return ParseError(code="E_PARSE_GRAMMAR", msg=f"token regex {self.p!r}: {msg}")
+
+    def peek(self) -> Optional[str]:
+        return self.p[self.i] if self.i < len(self.p) else None
+
+    def take(self) -> str:
+        ch = self.p[self.i]
+        self.i += 1
+        return ch
+
+    def read(self) -> Tuple[Any, ...]:
+        node = self.alt()
+        if self.i != len(self.p):
+            raise self.fail(f"unexpected {self.p[self.i]!r} at {self.i}")
+        return node
+
+    def alt(self) -> Tuple[Any, ...]:
+        branches = [self.concat()]
+        while self.peek() == "|":
+            self.take()
+            branches.append(self.concat())
+        return branches[0] if len(branches) == 1 else ("alt", branches)
+
+    def concat(self) -> Tuple[Any, ...]:
+        items = []
+        while self.peek() not in (None, "|", ")"):
+            items.append(self.repeat())
+        return ("cat", items)
+
+    def repeat(self) -> Tuple[Any, ...]:
+        node = self.atom()
+        while True:
+            ch = self.peek()
+            if ch == "*":
+                self.take()
+                node = ("rep", node, 0, None)
+            elif ch == "+":
+                self.take()
+                node = ("rep", node, 1, None)
+            elif ch == "?":
+                self.take()
+                node = ("rep", node, 0, 1)
+            elif ch == "{" and self._is_bound():
+                lo, hi = self._bound()
+                node = ("rep", node, lo, hi)
+            else:
+                return node
+            if self.peek() == "?":
+                # Lazy quantifiers match the same language.
+                self.take()
+
+    def _is_bound(self) -> bool:
+        end = self.p.find("}", self.i)
+        body = self.p[self.i + 1 : end] if end != -1 else ""
+        return bool(body) and all(part.isdigit() or part == "" for part in body.split(",", 1))
+
+    def _bound(self) -> Tuple[int, Optional[int]]:
+        end = self.p.index("}", self.i)
+        body = self.p[self.i + 1 : end]
+        self.i = end + 1
+        if "," not in body:
+            return int(body), int(body)
+        lo, hi = body.split(",", 1)
+        return int(lo or 0), (int(hi) if hi else None)
+
+    def atom(self) -> Tuple[Any, ...]:
+        ch = self.take()
+        if ch == "(":
+            if self.p.startswith("?:", self.i):
+                self.i += 2
+            elif self.peek() == "?":
+                raise self.fail("only (?:...) groups are supported")
+            node = self.alt()
+            if self.peek() != ")":
+                raise self.fail("unbalanced parenthesis")
+            self.take()
+            return node
+        if ch == "[":
+            return ("set", self._class())
+        if ch == ".":
+            return ("set", _CharSet(ranges=((10, 10),), negate=True))
+        if ch == "\\":
+            return ("set", self._escape())
+        if ch in "^$":
+            raise self.fail("anchors are not supported in token patterns")
+        return ("set", _literal_set(ch))
+
+    def _escape_char(self) -> str:
+        ch = self.take()
+        if ch == "x":
+            code = self.p[self.i : self.i + 2]
+            self.i += 2
+            return chr(int(code, 16))
+        if ch == "u":
+            code = self.p[self.i : self.i + 4]
+            self.i += 4
+            return chr(int(code, 16))
+        return _ESCAPES.get(ch, ch)
+
+    def _escape(self) -> _CharSet:
+        if self.peek() in _CLASS_TESTS:
+            return _CharSet(classes=self.take())
+        return _literal_set(self._escape_char())
+
+    def _class(self) -> _CharSet:
+        negate = False
+        if self.peek() == "^":
+            self.take()
+            negate = True
+        ranges: List[Tuple[int, int]] = []
+        classes = ""
+        first = True
+        while True:
+            if self.peek() is None:
+                raise self.fail("unterminated character class")
+            ch = self.take()
+            if ch == "]" and not first:
+                break
+            first = False
+            if ch == "\\":
+                if self.peek() in _CLASS_TESTS:
+                    classes += self.take()
+                    continue
+                ch = self._escape_char()
+            lo = ord(ch)
+            if self.peek() == "-" and self.p[self.i + 1 : self.i + 2] not in ("]", ""):
+                self.take()
+                hi_ch = self.take()
+                if hi_ch == "\\":
+                    hi_ch = self._escape_char()
+                ranges.append((lo, ord(hi_ch)))
+            else:
+                ranges.append((lo, lo))
+        return _CharSet(ranges=ranges, classes=classes, negate=negate)
+
+
+class _TokenAutomaton:
+    """All token patterns in one NFA, stepped through a lazily built DFA."""
+
+    DEAD = -1
+
+    def __init__(self, specs: Sequence[Dict[str, Any]]) -> None:
+        self._eps: List[List[int]] = []
+        self._moves: List[List[Tuple[_CharSet, int]]] = []
+        self._accept: Dict[int, int] = {}
+        start = self._new()
+        for idx, spec in enumerate(specs):
+            if "v" in spec:
+                node = ("cat", [("set", _literal_set(ch)) for ch in str(spec["v"])])
+            elif "re" in spec:
+                node = _RegexReader(str(spec["re"])).read()
+            else:
+                raise ParseError(code="E_PARSE_GRAMMAR", msg=f"token {idx} has neither 'v' nor 're'")
+            s, e = self._build(node)
+            self._eps[start].append(s)
+            self._accept[e] = idx
+
+        self._sets: List[FrozenSet[int]] = []
+        self._ids: Dict[FrozenSet[int], int] = {}
+        self._trans: Dict[Tuple[int, str], int] = {}
+        self.accepting: List[int] = []
+        self._reach: List[Optional[FrozenSet[int]]] = []
+        self.start = self._dfa_id(self._closure([start]))
+
+    def _new(self) -> int:
+        self._eps.append([])
+        self._moves.append([])
+        return len(self._eps) - 1
+
+    def _build(self, node: Tuple[Any, ...]) -> Tuple[int, int]:
+        kind = node[0]
+        if kind == "set":
+            s, e = self._new(), self._new()
+            self._moves[s].append((node[1], e))
+            return s, e
+        if kind == "cat":
+            s = e = self._new()
+            for item in node[1]:
+                a, b = self._build(item)
+                self._eps[e].append(a)
+                e = b
+            return s, e
+        if kind == "alt":
+            s, e = self._new(), self._new()
+            for branch in node[1]:
+                a, b = self._build(branch)
+                self._eps[s].append(a)
+                self._eps[b].append(e)
+            return s, e
+        # ("rep", item, lo, hi)
+        _, item, lo, hi = node
+        s = e = self._new()
+        for _ in range(lo):
+            a, b = self._build(item)
+            self._eps[e].append(a)
+            e = b
+        if hi is None:
+            a, b = self._build(item)
+            self._eps[e].append(a)
+            self._eps[b].append(a)
+            tail = self._new()
+            self._eps[e].append(tail)
+            self._eps[b].append(tail)
+            return s, tail
+        end = self._new()
+        self._eps[e].append(end)
+        for _ in range(hi - lo):
+            a, b = self._build(item)
+            self._eps[e].append(a)
+            self._eps[b].append(end)
+            e = b
+        return s, end
+
+    def _closure(self, states: Sequence[int]) -> FrozenSet[int]:
+        seen = set(states)
+        stack = list(states)
+        while stack:
+            for nxt in self._eps[stack.pop()]:
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        return frozenset(seen)
+
+    def _dfa_id(self, states: FrozenSet[int]) -> int:
+        if not states:
+            return self.DEAD
+        d = self._ids.get(states)
+        if d is None:
+            d = len(self._sets)
+            self._ids[states] = d
+            self._sets.append(states)
+            labels = [self._accept[s] for s in states if s in self._accept]
+            self.accepting.append(min(labels) if labels else -1)
+            self._reach.append(None)
+        return d
+
+    def step(self, d: int, ch: str) -> int:
+        key = (d, ch)
+        nxt = self._trans.get(key)
+        if nxt is None:
+            targets = [t for s in self._sets[d] for cs, t in self._moves[s] if ch in cs]
+            nxt = self._dfa_id(self._closure(targets))
+            self._trans[key] = nxt
+        return nxt
+
+    def reachable(self, d: int) -> FrozenSet[int]:
+        """Token indices that some continuation from ``d`` could still produce."""
+        reach = self._reach[d]
+        if reach is None:
+            seen = set(self._sets[d])
+            stack = list(seen)
+            while stack:
+                s = stack.pop()
+                for nxt in self._eps[s] + [t for _, t in self._moves[s]]:
+                    if nxt not in seen:
+                        seen.add(nxt)
+                        stack.append(nxt)
+            reach = frozenset(self._accept[s] for s in seen if s in self._accept)
+            self._reach[d] = reach
+        return reach
+
+
+# ---------------------------------------------------------------------------
+# Parser state
+# ---------------------------------------------------------------------------
+
+# Event kinds recorded while parsing; the AST is built from them on finish.
+_OPEN = 0
+_CLOSE = 1
+_TOK = 2
+
+# Stack marker that closes the AST node of an expanded nonterminal.
+_CLOSE_NODE = None
+
+# Persistent cons chains (item, prev) keep ParserState.copy() O(stack depth).
+_Chain = Optional[Tuple[Any, Any]]
+
+# Bottom of an event chain whose older events were handed off by ``release``.
+_RELEASED: _Chain = ((_CLOSE,), None)
+
+
+class ParserState:
+    """Resumable lexer + LL(1) parser state for one payload.
+
+    States are cheap to copy, so a decode loop can fork one per candidate
+    continuation and keep whichever stays viable.
+    """
+
+    __slots__ = (
+        "stack",
+        "events",
+        "chunks",
+        "ws",
+        "error",
+        "offset",
+        "done_at",
+        "line",
+        "col",
+        "seen_text",
+        "dfa",
+        "buf",
+        "tok_offset",
+        "tok_line",
+        "tok_col",
+        "accept_tok",
+        "accept_len",
+        "accept_line",
+        "accept_col",
+    )
+
+    def __init__(self, stack: List[Any]) -> None:
+        self.stack = stack
+        self.events: _Chain = None
+        # Raw input, kept only without productions; structural parses rebuild
+        # the body from token events plus the whitespace before each token.
+        self.chunks: _Chain = None
+        # Whitespace skipped since the last token.
+        self.ws = ""
+        self.error: Optional[ParseError] = None
+        self.offset = 0
+        # Offset just past the last token after which the input was a whole program.
+        self.done_at = 0
+        self.line = 1
+        self.col = 1
+        self.seen_text = False
+        # Lexer: dfa is None between tokens.
+        self.dfa: Optional[int] = None
+        self.buf = ""
+        self.tok_offset = 0
+        self.tok_line = 0
+        self.tok_col = 0
+        self.accept_tok = -1
+        self.accept_len = 0
+        self.accept_line = 0
+        self.accept_col = 0
+
+    @property
+    def viable(self) -> bool:
+        return self.error is None
+
+    def copy(self) -> "ParserState":
+        # Spelled out: this runs once per character of every vocabulary
+        # entry a constraint tries, and a getattr/setattr loop is ~3x slower.
+        other = ParserState.__new__(ParserState)
+        other.stack = list(self.stack)
+        other.events = self.events
+        other.chunks = self.chunks
+        other.ws = self.ws
+        other.error = self.error
+        other.offset = self.offset
+        other.done_at = self.done_at
+        other.line = self.line
+        other.col = self.col
+        other.seen_text = self.seen_text
+        other.dfa = self.dfa
+        other.buf = self.buf
+        other.tok_offset = self.tok_offset
+        other.tok_line = self.tok_line
+        other.tok_col = self.tok_col
+        other.accept_tok = self.accept_tok
+        other.accept_len = self.accept_len
+        other.accept_line = self.accept_line
+        other.accept_col = self.accept_col
+        return other
+
+
+@dataclass(frozen=True)
+class _Production:
+    lhs: str
+    rhs: Tuple[str, ...]
+
+
+class GGLParser:
+    """Table-driven GGL parser compiled from the grammar ABI.
+
+    The grammar ABI supplies ``@tokens`` and ``@productions`` (see
+    codex/lex/lex.grammar.v1.ggl.json). Productions may use ``X*``, ``X+``
+    and ``X?``; these become transparent helper nonterminals. Whitespace
+    separates tokens. Grammar ABIs without productions keep the legacy
+    behaviour of wrapping the whole body in a single program node.
+
+    Feeding text is O(len(chunk)) amortized: the lexer steps a cached DFA
+    per character and the parser only touches the top of its stack.
+    """
+
+    def __init__(self, grammar_abi: Dict[str, Any]) -> None:
+        self.ast_type = grammar_abi.get("ast_type", "ggl.program.v1")
+        productions = grammar_abi.get("@productions")
+        token_specs = grammar_abi.get("@tokens")
+        self.structural = bool(productions) and bool(token_specs)
+        if not self.structural:
+            return
+
+        self._specs = [dict(spec) for spec in token_specs]
+        self._tokens = _TokenAutomaton(self._specs)
+        self._types = [str(spec.get("t", "")) for spec in self._specs]
+        self._values = [str(spec["v"]) if "v" in spec else None for spec in self._specs]
+        # Terminal names each token kind can satisfy, most specific first.
+        self._keys = [
+            (value, ttype) if value is not None else (ttype,)
+            for value, ttype in zip(self._values, self._types)
+        ]
+
+        self._compile_productions(productions, grammar_abi.get("@start"))
+
+    # -- grammar compilation -------------------------------------------------
+
+    def _compile_productions(self, productions: Sequence[Dict[str, Any]], start: Optional[str]) -> None:
+        nonterminals = [str(p["lhs"]) for p in productions]
+        self.nonterminals = set(nonterminals)
+        self.start_symbol = str(start) if start else nonterminals[0]
+        terminal_names = set(self._types) | {v for v in self._values if v is not None}
+
+        prods: List[_Production] = []
+        self.synthetic = set()
+
+        def symbol(item: str) -> str:
+            if item in self.nonterminals or item in terminal_names or len(item) < 2:
+                return item
+            suffix, base = item[-1], item[:-1]
+            if suffix not in "*+?":
+                return item
+            base = symbol(base)
+            name = base + suffix
+            if name in self.synthetic:
+                return name
+            self.synthetic.add(name)
+            if suffix == "*":
+                prods.append(_Production(name, (base, name)))
+                prods.append(_Production(name, ()))
+            elif suffix == "+":
+                prods.append(_Production(name, (base, symbol(base + "*"))))
+            else:
+                prods.append(_Production(name, (base,)))
+                prods.append(_Production(name, ()))
+            return name
+
+        for p in productions:
+            prods.append(_Production(str(p["lhs"]), tuple(symbol(str(s)) for s in p.get("rhs", []))))
+
+        self.nonterminals |= self.synthetic
+        self._prods = prods
+
+        nullable = set()
+        first: Dict[str, set] = {nt: set() for nt in self.nonterminals}
+        changed = True
+        while changed:
+            changed = False
+            for p in prods:
+                acc = first[p.lhs]
+                before = len(acc)
+                all_nullable = True
+                for sym in p.rhs:
+                    if sym in self.nonterminals:
+                        acc |= first[sym]
+                        if sym not in nullable:
+                            all_nullable = False
+                            break
+                    else:
+                        acc.add(sym)
+                        all_nullable = False
+                        break
+                if all_nullable and p.lhs not in nullable:
+                    nullable.add(p.lhs)
+                    changed = True
+                if len(acc) != before:
+                    changed = True
+        self._nullable = frozenset(nullable)
+        self._first = {nt: frozenset(s) for nt, s in first.items()}
+
+        table: Dict[Tuple[str, str], int] = {}
+        eps: Dict[str, int] = {}
+        for idx, p in enumerate(prods):
+            rhs_first, rhs_nullable = self._first_of(p.rhs)
+            for t in rhs_first:
+                table.setdefault((p.lhs, t), idx)
+            if rhs_nullable:
+                eps.setdefault(p.lhs, idx)
+        self._table = table
+        self._eps_prod = eps
+
+    def _first_of(self, rhs: Sequence[str]) -> Tuple[set, bool]:
+        out: set = set()
+        for sym in rhs:
+            if sym in self.nonterminals:
+                out |= self._first[sym]
+                if sym not in self._nullable:
+                    return out, False
+            else:
+                out.add(sym)
+                return out, False
+        return out, True
+
+    # -- streaming API -------------------------------------------------------
+
+    def start(self) -> ParserState:
+        return ParserState([self.start_symbol] if self.structural else [])
+
+    def feed(self, state: ParserState, chunk: str) -> bool:
+        """Append ``chunk`` to ``state``; return whether it is still a viable prefix."""
+        if state.error is not None or not chunk:
+            return state.error is None
+        if not self.structural:
+            state.chunks = (chunk, state.chunks)
+            if not state.seen_text and chunk.strip():
+                state.seen_text = True
+            state.offset += len(chunk)
+            return True
+        tokens = self._tokens
+        trans = tokens._trans
+        accepting = tokens.accepting
+        for ch in chunk:
+            # Fast paths: skipping whitespace and extending the current token.
+            d = state.dfa
+            if d is None:
+                if ch.isspace():
+                    state.ws += ch
+                    self._advance(state, ch)
+                    continue
+            else:
+                nxt = trans.get((d, ch))
+                if nxt is None:
+                    nxt = tokens.step(d, ch)
+                if nxt != _TokenAutomaton.DEAD:
+                    state.dfa = nxt
+                    state.buf += ch
+                    self._advance(state, ch)
+                    if accepting[nxt] >= 0:
+                        state.accept_tok = accepting[nxt]
+                        state.accept_len = len(state.buf)
+                        state.accept_line, state.accept_col = state.line, state.col
+                    continue
+            self._lex_char(state, ch)
+            if state.error is not None:
+                return False
+        return self._lookahead_viable(state)
+
+    def state_key(self, state: ParserState) -> Tuple[Any, ...]:
+        """Hashable summary of everything that decides which continuations stay legal."""
+        if state.error is not None:
+            return ("dead",)
+        if state.accept_tok >= 0:
+            lex = (state.dfa, state.accept_tok, state.buf[state.accept_len :])
+        else:
+            lex = (state.dfa, -1, None)
+        # Close markers decide where later tokens land in the AST, so they stay in.
+        return (lex, tuple(state.stack), state.seen_text)
+
+    def accepts(self, state: ParserState) -> bool:
+        """Whether the text fed so far is a complete, legal program."""
+        try:
+            self.close(state)
+        except ParseError:
+            return False
+        return True
+
+    def close(self, state: ParserState) -> ParserState:
+        """Copy of ``state`` with the input closed: last token emitted, stack drained.
+
+        Costs O(stack depth), not O(input); ``events`` of the copy hold the
+        complete parse. Raises ParseError if the input is not a program.
+        """
+        if state.error is not None:
+            raise state.error
+        if not state.seen_text:
+            raise ParseError(code="E_PARSE_EMPTY", msg="empty GGL payload", line=1, col=1)
+        st = state.copy()
+        if not self.structural:
+            return st
+        if st.dfa is not None:
+            self._flush_token(st, eof=True)
+        if st.error is None:
+            self._drain(st)
+        if st.error is not None:
+            raise st.error
+        return st
+
+    def finish(self, state: ParserState) -> Dict[str, Any]:
+        """Close the input and build the AST. ``state`` itself is left untouched."""
+        st = self.close(state)
+        if not self.structural:
+            return {"type": self.ast_type, "body": _join_chain(st.chunks)}
+        body = _token_body(st.events, st.ws)
+        return {"type": self.ast_type, "body": body, "children": self._build_tree(st.events)}
+
+    def parse(self, text: str) -> Dict[str, Any]:
+        state = self.start()
+        self.feed(state, text)
+        return self.finish(state)
+
+    # -- lexer ---------------------------------------------------------------
+
+    def _lex_char(self, state: ParserState, ch: str) -> None:
+        if state.dfa is None:
+            if ch.isspace():
+                state.ws += ch
+                self._advance(state, ch)
+                return
+            state.seen_text = True
+            nxt = self._tokens.step(self._tokens.start, ch)
+            if nxt == _TokenAutomaton.DEAD:
+                self._fail(
+                    state,
+                    "E_PARSE_LEX",
+                    f"no token matches {ch!r}",
+                    state.line,
+                    state.col,
+                    state.offset,
+                )
+                return
+            state.dfa = nxt
+            state.buf = ""
+            state.tok_offset = state.offset
+            state.tok_line, state.tok_col = state.line, state.col
+            state.accept_tok = -1
+            self._push_char(state, ch, nxt)
+            return
+
+        nxt = self._tokens.step(state.dfa, ch)
+        if nxt != _TokenAutomaton.DEAD:
+            self._push_char(state, ch, nxt)
+            return
+
+        # Longest match ended: emit it and re-lex whatever followed it.
+        rest = self._flush_token(state, eof=False)
+        if state.error is not None:
+            return
+        for pending in rest + ch:
+            self._lex_char(state, pending)
+            if state.error is not None:
+                return
+
+    def _push_char(self, state: ParserState, ch: str, nxt: int) -> None:
+        state.dfa = nxt
+        state.buf += ch
+        self._advance(state, ch)
+        tok = self._tokens.accepting[nxt]
+        if tok >= 0:
+            state.accept_tok = tok
+            state.accept_len = len(state.buf)
+            state.accept_line, state.accept_col = state.line, state.col
+
+    def _advance(self, state: ParserState, ch: str) -> None:
+        state.offset += 1
+        if ch == "\n":
+            state.line += 1
+            state.col = 1
+        else:
+            state.col += 1
+
+    def _flush_token(self, state: ParserState, *, eof: bool) -> str:
+        """Emit the longest accepted token; return the unconsumed characters."""
+        if state.accept_tok < 0:
+            where = "end of input inside token" if eof else "no token matches"
+            self._fail(
+                state,
+                "E_PARSE_LEX",
+                f"{where} {state.buf!r}",
+                state.tok_line,
+                state.tok_col,
+                state.tok_offset,
+            )
+            return ""
+        kind = state.accept_tok
+        text = state.buf[: state.accept_len]
+        rest = state.buf[state.accept_len :]
+        state.dfa = None
+        state.buf = ""
+        state.accept_tok = -1
+        if rest:
+            # Rewind position to just after the emitted token.
+            state.offset -= len(rest)
+            state.line, state.col = state.accept_line, state.accept_col
+        self._shift(state, kind, text, state.tok_line, state.tok_col)
+        if eof and rest and state.error is None:
+            for pending in rest:
+                self._lex_char(state, pending)
+                if state.error is not None:
+                    return ""
+            if state.dfa is not None:
+                return self._flush_token(state, eof=True)
+        return rest
+
+    # -- parser --------------------------------------------------------------
+
+    def _fail(
+        self, state: ParserState, code: str, msg: str, line: int, col: int, offset: int
+    ) -> None:
+        state.error = ParseError(code=code, msg=msg, line=line, col=col, offset=offset)
+
+    def _expand(self, state: ParserState, nt: str, idx: int, line: int, col: int) -> None:
+        stack = state.stack
+        stack.pop()
+        if nt not in self.synthetic:
+            state.events = ((_OPEN, nt, line, col), state.events)
+            stack.append(_CLOSE_NODE)
+        stack.extend(reversed(self._prods[idx].rhs))
+
+    def _shift(self, state: ParserState, kind: int, text: str, line: int, col: int) -> None:
+        keys = self._keys[kind]
+        stack = state.stack
+        # Entries popped from below the starting height, so a failure can report
+        # what the stack expected before nullable symbols were expanded away.
+        low = len(stack)
+        popped: List[Any] = []
+        while stack:
+            top = stack[-1]
+            if len(stack) <= low:
+                low -= 1
+                popped.append(top)
+            if top is _CLOSE_NODE:
+                stack.pop()
+                state.events = ((_CLOSE,), state.events)
+                continue
+            if top in self.nonterminals:
+                idx = None
+                for key in keys:
+                    idx = self._table.get((top, key))
+                    if idx is not None:
+                        break
+                if idx is None:
+                    idx = self._eps_prod.get(top)
+                    if idx is None:
+                        break
+                self._expand(state, top, idx, line, col)
+                continue
+            if top in keys:
+                stack.pop()
+                state.events = ((_TOK, self._types[kind], text, line, col, state.ws), state.events)
+                state.ws = ""
+                if self._can_end(stack):
+                    state.done_at = state.tok_offset + len(text)
+                return
+            break
+        before = stack[:low] + popped[::-1]
+        expected = sorted(self._expected(before)) or ["end of input"]
+        self._fail(
+            state,
+            "E_PARSE_UNEXPECTED",
+            f"unexpected {self._types[kind]} {text!r}; expected {', '.join(expected)}",
+            line,
+            col,
+            state.tok_offset,
+        )
+
+    def _drain(self, state: ParserState) -> None:
+        stack = state.stack
+        while stack:
+            top = stack[-1]
+            if top is _CLOSE_NODE:
+                stack.pop()
+                state.events = ((_CLOSE,), state.events)
+                continue
+            idx = self._eps_prod.get(top) if top in self.nonterminals else None
+            if idx is None:
+                expected = sorted(self._expected(stack))
+                # Offset of the unfinished construct, so a truncated program
+                # is not credited as if all of it parsed.
+                self._fail(
+                    state,
+                    "E_PARSE_EOF",
+                    f"unexpected end of input; expected {', '.join(expected)}",
+                    state.line,
+                    state.col,
+                    state.done_at,
+                )
+                return
+            self._expand(state, top, idx, state.line, state.col)
+
+    def _can_end(self, stack: Sequence[Any]) -> bool:
+        """Whether input may end here: everything left on the stack is nullable."""
+        nullable = self._nullable
+        for top in reversed(stack):
+            if top is not _CLOSE_NODE and top not in nullable:
+                return False
+        return True
+
+    def _expected(self, stack: Sequence[Any]) -> set:
+        out: set = set()
+        for top in reversed(stack):
+            if top is _CLOSE_NODE:
+                continue
+            if top in self.nonterminals:
+                out |= self._first[top]
+                if top in self._nullable:
+                    continue
+                return out
+            out.add(top)
+            return out
+        return out
+
+    def _lookahead_viable(self, state: ParserState) -> bool:
+        """Check that a partially lexed token can still become something the parser takes."""
+        if state.dfa is None:
+            return True
+        expected = self._expected(state.stack)
+        if state.accept_tok >= 0 and any(k in expected for k in self._keys[state.accept_tok]):
+            return True
+        for kind in self._tokens.reachable(state.dfa):
+            if any(k in expected for k in self._keys[kind]):
+                return True
+        return False
+
+    def replay(self, events: _Chain, since: _Chain, visitor: Any) -> None:
+        """Hand ``visitor`` the AST events in ``events`` newer than ``since``, oldest first.
+
+        ``visitor`` has ``open_node(type, line, col)``, ``close_node()`` and
+        ``token(type, value, line, col)``. The start symbol's node, which
+        ``finish`` strips, is skipped; its close arrives with no node open.
+        """
+        pending = []
+        while events is not since and events is not None and events is not _RELEASED:
+            pending.append(events)
+            events = events[1]
+        for cell in reversed(pending):
+            ev = cell[0]
+            if ev[0] == _OPEN:
+                if cell[1] is None and ev[1] == self.start_symbol:
+                    continue
+                visitor.open_node(ev[1], ev[2], ev[3])
+            elif ev[0] == _CLOSE:
+                visitor.close_node()
+            else:
+                visitor.token(ev[1], ev[2], ev[3], ev[4])
+
+    def release(self, state: ParserState, visitor: Any = None) -> None:
+        """Replay the events of ``state`` to ``visitor`` (if any) and drop them, and the raw input.
+
+        Afterwards ``state`` holds O(stack depth) memory however much was
+        fed, but ``finish`` can no longer build its AST; ``close`` still
+        reports errors, and its events are replayed with another ``release``.
+        """
+        if visitor is not None:
+            self.replay(state.events, _RELEASED, visitor)
+        if state.events is not None:
+            # Only a chain that still ends in None starts with the start symbol's node.
+            state.events = _RELEASED
+        state.chunks = None
+
+    def _build_tree(self, events: _Chain) -> List[Any]:
+        ordered = []
+        while events is not None:
+            ordered.append(events[0])
+            events = events[1]
+        ordered.reverse()
+
+        root: Dict[str, Any] = {"children": []}
+        stack = [root]
+        for ev in ordered:
+            if ev[0] == _OPEN:
+                node = {"type": ev[1], "line": ev[2], "col": ev[3], "children": []}
+                stack[-1]["children"].append(node)
+                stack.append(node)
+            elif ev[0] == _CLOSE:
+                stack.pop()
+            else:
+                stack[-1]["children"].append(
+                    {"type": ev[1], "value": ev[2], "line": ev[3], "col": ev[4]}
+                )
+        top = root["children"]
+        # The start symbol's node is the program itself.
+        if len(top) == 1 and top[0].get("type") == self.start_symbol:
+            return top[0]["children"]
+        return top
+
+
+def _token_body(events: _Chain, tail: str) -> str:
+    """The parsed input: each token's preceding whitespace and text, then ``tail``."""
+    parts = [tail]
+    while events is not None:
+        ev = events[0]
+        if ev[0] == _TOK:
+            parts.append(ev[2])
+            parts.append(ev[5])
+        events = events[1]
+    parts.reverse()
+    return "".join(parts)
+
+
+def _join_chain(chain: _Chain) -> str:
+    parts = []
+    while chain is not None:
+        parts.append(chain[0])
+        chain = chain[1]
+    parts.reverse()
+    return "".join(parts)
+
+
+def compile_parser(grammar_abi: Dict[str, Any]) -> GGLParser:
+    return GGLParser(grammar_abi)
+
+
 def parse_ggl_to_ast(text: str, grammar_abi: Dict[str, Any]) -> Dict[str, Any]:
     if not text.strip():
         raise ParseError(code="E_PARSE_EMPTY", msg="empty GGL payload", line=1, col=1)
-
-    ast_type = grammar_abi.get("ast_type", "ggl.program.v1")
-    return {
-        "type": ast_type,
-        "body": text,
-    }
+    return compile_parser(grammar_abi).parse(text)
@@ -1,12 +1,83 @@
 from __future__ import annotations
 
-from typing import Any, Dict
+import copy
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Hashable, List, Optional, Tuple
 
 import torch
-from transformers import Trainer
+from transformers import LogitsProcessor, LogitsProcessorList, Trainer
 
 from .abi import ABI
-from .oracle import ggl_legality_oracle
+from .cache import OracleCache
+from .constraint import GenerationCursor, GGLConstraint, constraint_for_tokenizer
+from .oracle import ggl_legality_oracle, ggl_legality_oracle_many
+
+
+class GGLLogitsProcessor(LogitsProcessor):
+    """Masks every token that would make the generation illegal under the ABI.
+
+    Only the generated continuation is constrained (the prompt is skipped).
+    Cursors are keyed by the generated ids of each row, so beam reordering
+    and sampling are both fine. Allowed-id sets come from the shared
+    GGLConstraint cache; the tensor masks are cached here per state.
+    If no token can keep a row legal, only EOS is allowed so the row stops.
+    """
+
+    def __init__(self, constraint: GGLConstraint, max_cached_masks: int = 1024) -> None:
+        self.constraint = constraint
+        self.max_cached_masks = max_cached_masks
+        self._prompt_len: Optional[int] = None
+        self._cursors: Dict[Tuple[int, ...], GenerationCursor] = {}
+        self._masks: Dict[Tuple[Hashable, int, torch.device], torch.Tensor] = {}
+
+    def _cursor(self, ids: Tuple[int, ...]) -> GenerationCursor:
+        cursor = self._cursors.get(ids)
+        if cursor is not None:
+            return cursor
+        if not ids:
+            return self.constraint.start()
+        return self.constraint.advance(self._cursor(ids[:-1]), ids[-1])
+
+    def _mask(self, cursor: GenerationCursor, vocab_size: int, device: torch.device) -> torch.Tensor:
+        key = (self.constraint.state_key(cursor), vocab_size, device)
+        mask = self._masks.get(key)
+        if mask is None:
+            allowed: List[int] = list(self.constraint.allowed_ids(cursor))
+            if not allowed:
+                allowed = list(self.constraint.vocab.eos_ids)
+            mask = torch.zeros(vocab_size, dtype=torch.bool)
+            allowed = [i for i in allowed if i < vocab_size]
+            if allowed:
+                mask[torch.tensor(allowed, dtype=torch.long)] = True
+            mask = mask.to(device)
+            if len(self._masks) >= self.max_cached_masks:
+                self._masks.clear()
+            # allowed_ids may have widened the key's legality slack; store
+            # under the key the allowed set was actually filed under.
+            key = (self.constraint.state_key(cursor), vocab_size, device)
+            self._masks[key] = mask
+        return mask
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        if self._prompt_len is None:
+            self._prompt_len = input_ids.shape[1]
+        generated = input_ids[:, self._prompt_len :].tolist()
+        cursors: Dict[Tuple[int, ...], GenerationCursor] = {}
+        rows = []
+        for row in generated:
+            ids = tuple(row)
+            cursor = cursors.get(ids) or self._cursor(ids)
+            cursors[ids] = cursor
+            rows.append(self._mask(cursor, scores.shape[-1], scores.device))
+        self._cursors = cursors
+        mask = torch.stack(rows)
+        return scores.masked_fill(~mask, torch.finfo(scores.dtype).min)
+
+
+def ggl_logits_processor(constraint: GGLConstraint) -> LogitsProcessorList:
+    """Fresh processor list for one ``generate`` call, e.g. at eval time."""
+    return LogitsProcessorList([GGLLogitsProcessor(constraint)])
 
 
 class GGLGrammarAwareTrainer(Trainer):
@@ -19,6 +90,12 @@ class GGLGrammarAwareTrainer(Trainer):
         alpha_free: float = 0.25,
         free_every: int = 4,
         max_new_tokens: int = 256,
+        constrain_decode: bool = False,
+        free_run_batch: bool = False,
+        free_run_samples: Optional[int] = None,
+        async_free_run: bool = False,
+        oracle_workers: Optional[int] = None,
+        oracle_cache: Optional[OracleCache] = None,
         **kwargs,
     ):
         super().__init__(*args, **kwargs)
@@ -28,42 +105,214 @@ class GGLGrammarAwareTrainer(Trainer):
         self.alpha_free = float(alpha_free)
         self.free_every = int(free_every)
         self.max_new_tokens = int(max_new_tokens)
+        self.constrain_decode = bool(constrain_decode)
+        self._constraint: Optional[GGLConstraint] = None
+        # Batched free-run: score free_run_samples rows (None = whole batch)
+        # per free-run step; async_free_run moves that work to a background
+        # thread that generates from a synced copy of the model.
+        self.free_run_batch = bool(free_run_batch) or bool(async_free_run)
+        self.free_run_samples = free_run_samples
+        self.async_free_run = bool(async_free_run)
+        self.oracle_workers = oracle_workers
+        self.oracle_cache = oracle_cache
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Optional[Future] = None
+        self._shadow_model: Optional[torch.nn.Module] = None
+        self._free_run_metrics: Dict[str, float] = {}
+        # Row sampling has its own generator: the background thread must not
+        # draw from (and reorder) the global RNG the training loop uses.
+        self._free_run_rng = torch.Generator().manual_seed(int(self.args.seed))
+        self._step_time = 0.0
+        self._step_count = 0
         self._step = 0
 
+    @property
+    def ggl_constraint(self) -> GGLConstraint:
+        if self._constraint is None:
+            self._constraint = constraint_for_tokenizer(self.abi, self.tok_decode)
+        return self._constraint
+
     def _decode_ids(self, ids: torch.Tensor) -> str:
         return self.tok_decode.decode(ids.tolist(), skip_special_tokens=False)
 
-    @torch.no_grad()
-    def _free_run_decode(self, model, inputs: Dict[str, Any]) -> str:
+    def _generate(self, model, input_ids: torch.Tensor, attention_mask: Optional[torch.Tensor]) -> torch.Tensor:
+        """Greedy decode; only the continuation is returned, constrained or not.
+
+        The logits processor starts its cursor after the prompt, so the
+        continuation is what the oracle scores in either mode.
+        """
+        extra: Dict[str, Any] = {}
+        if self.constrain_decode:
+            extra["logits_processor"] = ggl_logits_processor(self.ggl_constraint)
         gen = model.generate(
-            input_ids=inputs["input_ids"],
-            attention_mask=inputs.get("attention_mask"),
+            input_ids=input_ids,
+            attention_mask=attention_mask,
             max_new_tokens=self.max_new_tokens,
             do_sample=False,
             num_beams=1,
+            **extra,
         )
+        return gen[:, input_ids.shape[1] :]
+
+    @torch.no_grad()
+    def _free_run_decode(self, model, inputs: Dict[str, Any]) -> str:
+        gen = self._generate(model, inputs["input_ids"], inputs.get("attention_mask"))
         return self._decode_ids(gen[0])
 
+    @torch.no_grad()
+    def _free_run_decode_batch(self, model, inputs: Dict[str, Any]) -> List[str]:
+        input_ids = inputs["input_ids"]
+        attention_mask = inputs.get("attention_mask")
+        k = self.free_run_samples
+        if k and k < input_ids.shape[0]:
+            rows = torch.randperm(input_ids.shape[0], generator=self._free_run_rng)[:k]
+            rows = rows.sort().values.to(input_ids.device)
+            input_ids = input_ids.index_select(0, rows)
+            if attention_mask is not None:
+                attention_mask = attention_mask.index_select(0, rows)
+        gen = self._generate(model, input_ids, attention_mask)
+        return [self._decode_ids(row) for row in gen]
+
     def _oracle_penalty(self, text: str) -> torch.Tensor:
-        res = ggl_legality_oracle(text, self.abi, want_lower=False)
-        p = 1.0 - float(res.partial_score)
+        res = ggl_legality_oracle(text, self.abi, want_lower=False, cache=self.oracle_cache)
+        p = 1.0 - float(res.prefix_score)
         return torch.tensor(p, device=self.model.device, dtype=torch.float32)
 
+    def _free_run_job(self, model, inputs: Dict[str, Any]) -> Dict[str, float]:
+        """Generate and score one free-run batch; safe to run off the main thread."""
+        t0 = time.perf_counter()
+        texts = self._free_run_decode_batch(model, inputs)
+        t1 = time.perf_counter()
+        results = ggl_legality_oracle_many(
+            texts,
+            self.abi,
+            want_lower=False,
+            workers=self.oracle_workers,
+            cache=self.oracle_cache,
+        )
+        t2 = time.perf_counter()
+        n = len(results)
+        return {
+            "penalty": sum(1.0 - float(r.prefix_score) for r in results) / n,
+            "legal": sum(1 for r in results if r.ok) / n,
+            "samples": float(n),
+            "generate_s": t1 - t0,
+            "score_s": t2 - t1,
+        }
+
+    def _shadow(self) -> torch.nn.Module:
+        """Frozen copy of the model that background free-runs generate from."""
+        if self._shadow_model is None:
+            self._shadow_model = copy.deepcopy(self.model)
+            self._shadow_model.eval()
+            self._shadow_model.requires_grad_(False)
+        else:
+            self._shadow_model.load_state_dict(self.model.state_dict())
+        return self._shadow_model
+
+    def _async_free_run(self, inputs: Dict[str, Any]) -> Optional[Dict[str, float]]:
+        """Collect a finished background job, then start the next one.
+
+        Each job runs on weights synced at submission time, so its penalty
+        lags the live model by one free-run interval.
+        """
+        stats = None
+        if self._pending is not None:
+            if not self._pending.done():
+                return None
+            stats = self._pending.result()
+            self._pending = None
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ggl-free-run")
+        snapshot = {
+            key: inputs[key].detach().clone()
+            for key in ("input_ids", "attention_mask")
+            if inputs.get(key) is not None
+        }
+        self._pending = self._executor.submit(self._free_run_job, self._shadow(), snapshot)
+        return stats
+
+    def _shutdown_free_run(self) -> None:
+        """Wait for the background job, if any, and stop its thread."""
+        executor = self._executor
+        self._executor = None
+        self._pending = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def train(self, *args, **kwargs):
+        try:
+            return super().train(*args, **kwargs)
+        finally:
+            self._shutdown_free_run()
+
+    def __del__(self) -> None:
+        if getattr(self, "_executor", None) is not None:
+            self._executor.shutdown(wait=False)
+
+    def _free_run_penalty(self, model, inputs: Dict[str, Any]) -> Optional[torch.Tensor]:
+        if not self.free_run_batch:
+            with torch.no_grad():
+                text = self._free_run_decode(model, inputs)
+            return self._oracle_penalty(text)
+
+        if self.async_free_run:
+            stats = self._async_free_run(inputs)
+            if stats is None:
+                return None
+        else:
+            stats = self._free_run_job(model, inputs)
+        self._record_free_run(stats)
+        return torch.tensor(stats["penalty"], device=self.model.device, dtype=torch.float32)
+
+    def _record_free_run(self, stats: Dict[str, float]) -> None:
+        m = self._free_run_metrics
+        m["runs"] = m.get("runs", 0.0) + 1.0
+        for key, value in stats.items():
+            m[key] = m.get(key, 0.0) + value
+
+    def _drain_metrics(self) -> Dict[str, float]:
+        out: Dict[str, float] = {}
+        m = self._free_run_metrics
+        runs = m.get("runs", 0.0)
+        if runs:
+            busy = m["generate_s"] + m["score_s"]
+            out["free_run/penalty"] = m["penalty"] / runs
+            out["free_run/legal_rate"] = m["legal"] / runs
+            out["free_run/generate_s"] = m["generate_s"] / runs
+            out["free_run/score_s"] = m["score_s"] / runs
+            out["free_run/samples_per_s"] = m["samples"] / busy if busy > 0 else 0.0
+        if self._step_count:
+            out["train/step_s"] = self._step_time / self._step_count
+        self._free_run_metrics = {}
+        self._step_time = 0.0
+        self._step_count = 0
+        return out
+
+    def log(self, logs: Dict[str, float], *args, **kwargs) -> None:
+        logs = {**logs, **self._drain_metrics()}
+        return super().log(logs, *args, **kwargs)
+
+    def training_step(self, *args, **kwargs):
+        # Whole step (forward, free-run, backward), so train/step_s is comparable
+        # with and without the background free-run.
+        start = time.perf_counter()
+        loss = super().training_step(*args, **kwargs)
+        self._step_time += time.perf_counter() - start
+        self._step_count += 1
+        return loss
+
     def compute_loss(self, model, inputs, return_outputs=False):
         self._step += 1
         outputs = model(**inputs)
         base_loss = outputs.loss
+        loss = base_loss
 
-        if (self._step % self.free_every) != 0:
-            if return_outputs:
-                return base_loss, outputs
-            return base_loss
-
-        with torch.no_grad():
-            text = self._free_run_decode(model, inputs)
-
-        legal_pen = self._oracle_penalty(text)
-        loss = base_loss + (self.alpha_free * (self.lambda_legal * legal_pen))
+        if (self._step % self.free_every) == 0:
+            legal_pen = self._free_run_penalty(model, inputs)
+            if legal_pen is not None:
+                loss = base_loss + (self.alpha_free * (self.lambda_legal * legal_pen))
 
         if return_outputs:
             return loss, outputs
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import re
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+_WS = re.compile(rb"[ \t\n\r]*")
+_STRING_TAIL = re.compile(rb'(?:[^"\\]|\\.)*"', re.S)
+_NESTED_MARK = re.compile(rb'["\[\]{}]')
+_SCALAR_END = re.compile(rb"[ \t\n\r,}\]]")
+
+
+def _malformed(path: str, pos: int) -> ValueError:
+    return ValueError(f"{path}: malformed JSON near byte {pos}")
+
+
+def _string_end(buf: Any, pos: int, path: str) -> int:
+    """``pos`` is just past an opening quote; return the index past the closing one."""
+    m = _STRING_TAIL.match(buf, pos)
+    if m is None:
+        raise _malformed(path, pos)
+    return m.end()
+
+
+def _value_end(buf: Any, pos: int, path: str) -> int:
+    first = buf[pos : pos + 1]
+    if first == b'"':
+        return _string_end(buf, pos + 1, path)
+    if first not in (b"{", b"["):
+        m = _SCALAR_END.search(buf, pos)
+        return m.start() if m is not None else len(buf)
+    depth = 0
+    while True:
+        m = _NESTED_MARK.search(buf, pos)
+        if m is None:
+            raise _malformed(path, pos)
+        ch = m.group()
+        if ch == b'"':
+            pos = _string_end(buf, m.end(), path)
+            continue
+        pos = m.end()
+        depth += 1 if ch in (b"{", b"[") else -1
+        if depth == 0:
+            return pos
+
+
+def _skip_ws(buf: Any, pos: int) -> int:
+    return _WS.match(buf, pos).end()
+
+
+def _top_level_spans(buf: Any, path: str) -> Optional[Dict[str, Tuple[int, int]]]:
+    """Byte spans of each top-level member, or None when the document is not an object."""
+    pos = _skip_ws(buf, 0)
+    if buf[pos : pos + 1] != b"{":
+        return None
+    spans: Dict[str, Tuple[int, int]] = {}
+    pos = _skip_ws(buf, pos + 1)
+    if buf[pos : pos + 1] == b"}":
+        return spans
+    while True:
+        if buf[pos : pos + 1] != b'"':
+            raise _malformed(path, pos)
+        end = _string_end(buf, pos + 1, path)
+        key = json.loads(buf[pos:end].decode("utf-8"))
+        pos = _skip_ws(buf, end)
+        if buf[pos : pos + 1] != b":":
+            raise _malformed(path, pos)
+        start = _skip_ws(buf, pos + 1)
+        end = _value_end(buf, start, path)
+        # Later duplicates win, as with json.loads.
+        spans[key] = (start, end)
+        pos = _skip_ws(buf, end)
+        sep = buf[pos : pos + 1]
+        if sep == b"}":
+            if _skip_ws(buf, pos + 1) != len(buf):
+                raise _malformed(path, pos + 1)
+            return spans
+        if sep != b",":
+            raise _malformed(path, pos)
+        pos = _skip_ws(buf, pos + 1)
+
+
+class MappedJSONDocument(Mapping):
+    """Read-only view of a top-level JSON object backed by an mmap of its file.
+
+    Nothing is decoded until a member is read, and then only that member.
+    Member spans come from a structural scan, or from ``spans`` recorded
+    earlier for the same bytes (e.g. in an ABI sidecar).
+    Pages of the file are shared through the OS page cache, so many worker
+    processes holding the same document cost little extra memory. Pickling
+    ships the path and the raw sha256; the receiving process reopens the
+    file lazily and refuses it if the bytes changed.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        raw_sha256: Optional[str] = None,
+        *,
+        spans: Optional[Dict[str, Tuple[int, int]]] = None,
+        verify: bool = False,
+    ) -> None:
+        self.path = path
+        self._raw_sha256 = raw_sha256
+        self._verify = verify and raw_sha256 is not None
+        self._buf: Optional[Any] = None
+        self._spans = spans
+        self._decoded: Dict[str, Any] = {}
+
+    @property
+    def raw_sha256(self) -> str:
+        if self._raw_sha256 is None:
+            self._raw_sha256 = hashlib.sha256(self._map()).hexdigest()
+        return self._raw_sha256
+
+    @property
+    def spans(self) -> Dict[str, Tuple[int, int]]:
+        """Byte span of every top-level member, found by a scan that decodes nothing."""
+        return self._index()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"path": self.path, "raw_sha256": self.raw_sha256, "spans": self._spans}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["path"], state["raw_sha256"], spans=state["spans"], verify=True)
+
+    def _map(self) -> Any:
+        if self._buf is None:
+            with open(self.path, "rb") as f:
+                try:
+                    buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # Empty files cannot be mapped.
+                    buf = f.read()
+            if self._verify and hashlib.sha256(buf).hexdigest() != self._raw_sha256:
+                raise ValueError(f"{self.path} changed since the ABI was loaded")
+            self._buf = buf
+        return self._buf
+
+    def _index(self) -> Dict[str, Tuple[int, int]]:
+        if self._spans is None:
+            buf = self._map()
+            spans = _top_level_spans(buf, self.path)
+            if spans is None:
+                raise ValueError(f"{self.path}: ABI document must be a JSON object")
+            self._spans = spans
+        return self._spans
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return self._decoded[key]
+        except KeyError:
+            pass
+        start, end = self._index()[key]
+        value = json.loads(self._map()[start:end].decode("utf-8"))
+        self._decoded[key] = value
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index())
+
+    def __len__(self) -> int:
+        return len(self._index())
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._index()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Decode the whole document (not cached)."""
+        return json.loads(self._map()[:].decode("utf-8"))
+
+    def release(self) -> None:
+        """Drop decoded members and the mapping; they are rebuilt on next access."""
+        self._decoded.clear()
+        self._spans = None
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+        self._buf = None
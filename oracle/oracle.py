@@ -1,13 +1,20 @@
 from __future__ import annotations
 
+import re
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Dict, Optional, Tuple
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
 
 from .abi import ABI
-from .ggl_legal import LegalityError, check_legality
-from .ggl_lower import LowerError, lower_ast_to_scene_xjson
-from .ggl_parse import ParseError, parse_ggl_to_ast
-from .tokenize_abi import abi_tokenize_ok
+from .compiled import CompiledABI, compile_abi
+from .ggl_legal import LegalityError, check_legality_limits
+from .ggl_lower import LowerError, lower_ast_with_template
+from .ggl_parse import GGLParser, ParseError, ParserState
+from .stats import OracleStats, active_stats, disable_stats, enable_stats
+
+if TYPE_CHECKING:
+    from .cache import OracleCache
 
 
 @dataclass
@@ -19,6 +26,8 @@ class OracleResult:
     line: int = 0
     col: int = 0
     partial_score: float = 0.0
+    # partial_score refined by how far into the payload the first failure is.
+    prefix_score: float = 0.0
     ast: Optional[Dict[str, Any]] = None
     lowered: Optional[Dict[str, Any]] = None
 
@@ -26,29 +35,39 @@ class OracleResult:
 BOUNDARY_OPEN = "<GGL>"
 BOUNDARY_CLOSE = "</GGL>"
 
+# Matches exactly the characters str.strip() removes.
+_NON_WS = re.compile(r"\S")
+
 
 def extract_ggl_payload(text: str) -> Tuple[Optional[str], Optional[OracleResult]]:
     a = text.find(BOUNDARY_OPEN)
     b = text.find(BOUNDARY_CLOSE)
     if a == -1 or b == -1 or b < a:
-        return None, OracleResult(
-            ok=False,
-            stage="boundary",
-            code="E_GGL_BOUNDARY",
-            msg="missing or malformed <GGL>...</GGL> boundary",
-            partial_score=0.0,
-        )
-    inner = text[a + len(BOUNDARY_OPEN) : b]
-    outside = (text[:a] + text[b + len(BOUNDARY_CLOSE) :]).strip()
+        return None, _boundary_failure(outside=False)
+    end = b + len(BOUNDARY_CLOSE)
+    # Search the outside spans in place instead of joining and stripping them.
+    if _NON_WS.search(text, 0, a) or _NON_WS.search(text, end):
+        return None, _boundary_failure(outside=True)
+    return text[a + len(BOUNDARY_OPEN) : b].strip(), None
+
+
+def _boundary_failure(outside: bool) -> OracleResult:
     if outside:
-        return None, OracleResult(
+        return OracleResult(
             ok=False,
             stage="boundary",
             code="E_GGL_OUTSIDE_TEXT",
             msg="non-empty text outside GGL boundary",
             partial_score=0.05,
+            prefix_score=0.05,
         )
-    return inner.strip(), None
+    return OracleResult(
+        ok=False,
+        stage="boundary",
+        code="E_GGL_BOUNDARY",
+        msg="missing or malformed <GGL>...</GGL> boundary",
+        partial_score=0.0,
+    )
 
 
 def legality_score(flags: Dict[str, bool]) -> float:
@@ -66,7 +85,76 @@ def legality_score(flags: Dict[str, bool]) -> float:
     return round(s, 6)
 
 
-def ggl_legality_oracle(text: str, abi: ABI, want_lower: bool = True) -> OracleResult:
+def prefix_credit(tokenized: float, parsed: float) -> float:
+    """Score of a payload whose first ``tokenized``/``parsed`` fraction passes each stage.
+
+    The tokenize and parse credit of ``legality_score`` is scaled by the
+    fraction earned. A failure's fractions stay below 1 (an unfinished
+    program only earns credit up to its last complete point), so it scores
+    below a payload that parses. Scores are not ordered by stage, though: a
+    late tokenizer failure can outscore an early parse failure, and the score
+    of a growing prefix can drop as well as rise.
+    """
+    return round(0.10 + 0.15 * tokenized + 0.35 * parsed, 6)
+
+
+def parsed_prefix_len(parser: GGLParser, text: str) -> int:
+    """Characters of ``text`` that parse, up to its last complete point if it ends early."""
+    state = parser.start()
+    parser.feed(state, text)
+    return closed_prefix_len(parser, state, len(text))
+
+
+def closed_prefix_len(parser: GGLParser, state: ParserState, size: int) -> int:
+    """``parsed_prefix_len`` of the ``size`` characters already fed to ``state``."""
+    try:
+        parser.close(state)
+    except ParseError as e:
+        return 0 if e.code == "E_PARSE_EMPTY" else e.offset
+    return size
+
+
+def ggl_legality_oracle(
+    text: str,
+    abi: ABI,
+    want_lower: bool = True,
+    cache: Optional["OracleCache"] = None,
+) -> OracleResult:
+    if cache is None:
+        return _run_oracle(text, abi, compile_abi(abi), want_lower)
+    key = cache.key(abi.abi_hash, text, want_lower)
+    res = cache.get(key)
+    if res is None:
+        res = _run_oracle(text, abi, compile_abi(abi), want_lower)
+        cache.put(key, res)
+    return res
+
+
+def _run_oracle(
+    text: str,
+    abi: ABI,
+    compiled: CompiledABI,
+    want_lower: bool,
+) -> OracleResult:
+    stats = active_stats()
+    result = _run_pipeline(text, compiled, want_lower, stats)
+    if stats is not None:
+        stats.record_result(result.stage, result.code, result.ok)
+    return result
+
+
+def _record_stage(stats: OracleStats, stage: str, start: float, text: str) -> float:
+    now = perf_counter()
+    stats.record_stage(stage, now - start, len(text.encode("utf-8", "surrogatepass")))
+    return now
+
+
+def _run_pipeline(
+    text: str,
+    compiled: CompiledABI,
+    want_lower: bool,
+    stats: Optional[OracleStats],
+) -> OracleResult:
     flags = {
         "boundary": False,
         "tokenize": False,
@@ -74,69 +162,124 @@ def ggl_legality_oracle(text: str, abi: ABI, want_lower: bool = True) -> OracleR
         "legal": False,
         "lower": False,
     }
+    t = perf_counter() if stats is not None else 0.0
 
     inner, err = extract_ggl_payload(text)
+    if stats is not None:
+        t = _record_stage(stats, "boundary", t, text)
     if err:
         return err
 
     flags["boundary"] = True
 
-    tok_err = abi_tokenize_ok(inner, abi.tokenizer)
-    if tok_err:
-        return OracleResult(
-            ok=False,
-            stage="tokenize",
-            code=tok_err["code"],
-            msg=tok_err["msg"],
-            line=tok_err.get("line", 0),
-            col=tok_err.get("col", 0),
-            partial_score=legality_score(flags),
+    idx = compiled.tokenizer.first_bad_index(inner)
+    if stats is not None:
+        t = _record_stage(stats, "tokenize", t, inner)
+    if idx >= 0:
+        good = parsed_prefix_len(compiled.parser, inner[:idx])
+        n = len(inner)
+        return _tokenize_failure(
+            compiled.tokenizer.error_at(inner, idx), flags, prefix_credit(idx / n, good / n)
         )
     flags["tokenize"] = True
 
     try:
-        ast = parse_ggl_to_ast(inner, abi.grammar)
+        ast = compiled.parser.parse(inner)
     except ParseError as e:
-        return OracleResult(
-            ok=False,
-            stage="parse",
-            code=e.code,
-            msg=e.msg,
-            line=e.line,
-            col=e.col,
-            partial_score=legality_score(flags),
-        )
+        if stats is not None:
+            _record_stage(stats, "parse", t, inner)
+        return _parse_failure(e, flags, prefix_credit(1.0, e.offset / max(len(inner), 1)))
+    if stats is not None:
+        t = _record_stage(stats, "parse", t, inner)
     flags["parse"] = True
 
+    return _check_and_lower(ast, compiled, want_lower, flags, stats, t, inner)
+
+
+def _tokenize_failure(
+    tok_err: Dict[str, Any],
+    flags: Dict[str, bool],
+    prefix_score: float,
+) -> OracleResult:
+    return OracleResult(
+        ok=False,
+        stage="tokenize",
+        code=tok_err["code"],
+        msg=tok_err["msg"],
+        line=tok_err.get("line", 0),
+        col=tok_err.get("col", 0),
+        partial_score=legality_score(flags),
+        prefix_score=prefix_score,
+    )
+
+
+def _parse_failure(e: ParseError, flags: Dict[str, bool], prefix_score: float) -> OracleResult:
+    return OracleResult(
+        ok=False,
+        stage="parse",
+        code=e.code,
+        msg=e.msg,
+        line=e.line,
+        col=e.col,
+        partial_score=legality_score(flags),
+        prefix_score=prefix_score,
+    )
+
+
+def _legality_failure(
+    e: LegalityError, flags: Dict[str, bool], ast: Optional[Dict[str, Any]]
+) -> OracleResult:
+    return OracleResult(
+        ok=False,
+        stage="legal",
+        code=e.code,
+        msg=e.msg,
+        line=e.line,
+        col=e.col,
+        partial_score=legality_score(flags),
+        prefix_score=legality_score(flags),
+        ast=ast,
+    )
+
+
+def _check_and_lower(
+    ast: Dict[str, Any],
+    compiled: CompiledABI,
+    want_lower: bool,
+    flags: Dict[str, bool],
+    stats: Optional[OracleStats],
+    t: float,
+    inner: str,
+) -> OracleResult:
     try:
-        check_legality(ast, abi.grammar)
+        check_legality_limits(ast, compiled.limits)
     except LegalityError as e:
-        return OracleResult(
-            ok=False,
-            stage="legal",
-            code=e.code,
-            msg=e.msg,
-            line=e.line,
-            col=e.col,
-            partial_score=legality_score(flags),
-            ast=ast,
-        )
+        if stats is not None:
+            _record_stage(stats, "legal", t, inner)
+        return _legality_failure(e, flags, ast)
+    if stats is not None:
+        t = _record_stage(stats, "legal", t, inner)
     flags["legal"] = True
 
     lowered = None
     if want_lower:
         try:
-            lowered = lower_ast_to_scene_xjson(ast, abi.grammar)
+            lowered = lower_ast_with_template(ast, compiled.lowering)
             flags["lower"] = True
         except LowerError as e:
+            if stats is not None:
+                _record_stage(stats, "lower", t, inner)
             return OracleResult(
                 ok=False,
                 stage="lower",
                 code=e.code,
                 msg=e.msg,
                 partial_score=legality_score(flags),
+                prefix_score=legality_score(flags),
                 ast=ast,
             )
+        if stats is not None:
+            _record_stage(stats, "lower", t, inner)
 
     return OracleResult(
         ok=True,
@@ -144,6 +287,96 @@ def ggl_legality_oracle(text: str, abi: ABI, want_lower: bool = True) -> OracleR
         code="OK",
         msg="legal",
         partial_score=legality_score(flags),
+        prefix_score=legality_score(flags),
         ast=ast,
         lowered=lowered,
     )
+
+
+# Batches smaller than this are scored in-process even when workers are requested.
+MIN_PARALLEL_BATCH = 256
+
+_WORKER_ABI: Optional[ABI] = None
+
+
+def _init_worker(abi: ABI) -> None:
+    global _WORKER_ABI
+    _WORKER_ABI = abi
+    compile_abi(abi)
+
+
+def _worker_oracle_chunk(
+    args: Tuple[List[str], bool, bool],
+) -> Tuple[List[OracleResult], Optional[Dict[str, Any]]]:
+    texts, want_lower, collect_stats = args
+    abi = _WORKER_ABI
+    compiled = compile_abi(abi)
+    if not collect_stats:
+        return [_run_oracle(text, abi, compiled, want_lower) for text in texts], None
+    # Stats live in the parent; ship this chunk's numbers back with the results.
+    stats = enable_stats()
+    try:
+        results = [_run_oracle(text, abi, compiled, want_lower) for text in texts]
+    finally:
+        disable_stats()
+    return results, stats.snapshot()
+
+
+def ggl_legality_oracle_many(
+    texts: Iterable[str],
+    abi: ABI,
+    *,
+    want_lower: bool = True,
+    workers: Optional[int] = None,
+    chunksize: int = 64,
+    cache: Optional["OracleCache"] = None,
+) -> List[OracleResult]:
+    """Score many generations against one ABI, returning results in input order.
+
+    The CompiledABI is resolved once for the whole batch. With
+    ``workers`` > 1 and a large enough batch, scoring fans out over a process
+    pool whose workers receive the ABI once at startup. With a ``cache``,
+    only the inputs it misses are scored.
+    """
+    if not isinstance(texts, (list, tuple)):
+        texts = list(texts)
+
+    results: List[Optional[OracleResult]] = [None] * len(texts)
+    todo = range(len(texts))
+    keys: List[Any] = []
+    if cache is not None:
+        keys = [cache.key(abi.abi_hash, text, want_lower) for text in texts]
+        todo = []
+        for i, key in enumerate(keys):
+            res = cache.get(key)
+            if res is None:
+                todo.append(i)
+            else:
+                results[i] = res
+    pending = [texts[i] for i in todo]
+
+    if not workers or workers <= 1 or len(pending) < MIN_PARALLEL_BATCH:
+        compiled = compile_abi(abi)
+        scored = [_run_oracle(text, abi, compiled, want_lower) for text in pending]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(abi,),
+        ) as pool:
+            stats = active_stats()
+            jobs = (
+                (pending[i : i + chunksize], want_lower, stats is not None)
+                for i in range(0, len(pending), chunksize)
+            )
+            scored = []
+            for chunk, snap in pool.map(_worker_oracle_chunk, jobs):
+                scored.extend(chunk)
+                if snap is not None:
+                    stats.merge(snap)
+
+    for i, res in zip(todo, scored):
+        results[i] = res
+    if cache is not None:
+        cache.put_many([(keys[i], res) for i, res in zip(todo, scored)])
+    return results
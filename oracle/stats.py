@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import json
+import threading
+from bisect import bisect_left
+from typing import Any, Dict, Optional, Sequence
+
+STAGES = ("boundary", "tokenize", "parse", "legal", "lower")
+
+# Upper bucket edges in microseconds; the last bucket is open-ended.
+DEFAULT_BUCKETS_US = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 100000, 1000000)
+
+
+class _Histogram:
+    __slots__ = ("edges", "counts", "count", "total_s", "min_s", "max_s")
+
+    def __init__(self, edges: Sequence[float]) -> None:
+        self.edges = tuple(edges)
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total_s = 0.0
+        self.min_s = float("inf")
+        self.max_s = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.counts[bisect_left(self.edges, seconds * 1e6)] += 1
+        self.count += 1
+        self.total_s += seconds
+        if seconds < self.min_s:
+            self.min_s = seconds
+        if seconds > self.max_s:
+            self.max_s = seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [f"le_{edge}us" for edge in self.edges] + ["inf"]
+        return {
+            "count": self.count,
+            "total_s": self.total_s,
+            "mean_us": (self.total_s / self.count) * 1e6 if self.count else 0.0,
+            "min_us": self.min_s * 1e6 if self.count else 0.0,
+            "max_us": self.max_s * 1e6,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+    def merge(self, snap: Dict[str, Any]) -> None:
+        for i, value in enumerate(snap["buckets"].values()):
+            self.counts[i] += value
+        if snap["count"]:
+            self.count += snap["count"]
+            self.total_s += snap["total_s"]
+            self.min_s = min(self.min_s, snap["min_us"] / 1e6)
+            self.max_s = max(self.max_s, snap["max_us"] / 1e6)
+
+
+class OracleStats:
+    """Per-stage latency histograms, bytes processed and failure counts.
+
+    Collection is opt-in: the oracle only records into the stats object set
+    with :func:`enable_stats`, so with stats off every stage pays a single
+    ``is None`` check.
+    """
+
+    def __init__(self, bucket_edges_us: Sequence[float] = DEFAULT_BUCKETS_US) -> None:
+        self._edges = tuple(bucket_edges_us)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._latency = {stage: _Histogram(self._edges) for stage in STAGES}
+            self._bytes = {stage: 0 for stage in STAGES}
+            self._failures: Dict[str, Dict[str, int]] = {}
+            self.calls = 0
+            self.ok = 0
+
+    def record_stage(self, stage: str, seconds: float, nbytes: int) -> None:
+        with self._lock:
+            self._latency[stage].add(seconds)
+            self._bytes[stage] += nbytes
+
+    def record_result(self, stage: str, code: str, ok: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            if ok:
+                self.ok += 1
+                return
+            codes = self._failures.setdefault(stage, {})
+            codes[code] = codes.get(code, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "ok": self.ok,
+                "stages": {
+                    stage: {**self._latency[stage].snapshot(), "bytes": self._bytes[stage]}
+                    for stage in STAGES
+                },
+                "failures": {stage: dict(codes) for stage, codes in self._failures.items()},
+            }
+
+    def merge(self, snap: Dict[str, Any]) -> None:
+        """Fold a snapshot (e.g. from a worker process) into these stats."""
+        with self._lock:
+            self.calls += snap["calls"]
+            self.ok += snap["ok"]
+            for stage, data in snap["stages"].items():
+                self._latency[stage].merge(data)
+                self._bytes[stage] += data["bytes"]
+            for stage, codes in snap["failures"].items():
+                mine = self._failures.setdefault(stage, {})
+                for code, count in codes.items():
+                    mine[code] = mine.get(code, 0) + count
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        return json.dumps(self.snapshot(), indent=indent, sort_keys=True)
+
+    def dump(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_json())
+            f.write("\n")
+
+
+_ACTIVE: Optional[OracleStats] = None
+
+
+def enable_stats(stats: Optional[OracleStats] = None) -> OracleStats:
+    global _ACTIVE
+    _ACTIVE = stats if stats is not None else OracleStats()
+    return _ACTIVE
+
+
+def disable_stats() -> Optional[OracleStats]:
+    global _ACTIVE
+    stats, _ACTIVE = _ACTIVE, None
+    return stats
+
+
+def active_stats() -> Optional[OracleStats]:
+    return _ACTIVE
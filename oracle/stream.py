@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import copy
+from typing import Any, Dict, Iterable, Optional, TextIO, Union
+
+from .abi import ABI
+from .compiled import CompiledABI, compile_abi
+from .ggl_legal import LegalityError, LegalityRecorder, check_body_limits
+from .ggl_parse import ParseError, ParserState
+from .oracle import (
+    _NON_WS,
+    BOUNDARY_CLOSE,
+    BOUNDARY_OPEN,
+    OracleResult,
+    _boundary_failure,
+    _check_and_lower,
+    _legality_failure,
+    _parse_failure,
+    _tokenize_failure,
+    closed_prefix_len,
+    legality_score,
+    prefix_credit,
+)
+from .stats import active_stats
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+_PRE = 0
+_BODY = 1
+_POST = 2
+
+# Characters held back between chunks so a boundary split across them is still found.
+_OPEN_HOLD = max(len(BOUNDARY_OPEN), len(BOUNDARY_CLOSE)) - 1
+_CLOSE_HOLD = len(BOUNDARY_CLOSE) - 1
+
+
+class StreamingOracle:
+    """``ggl_legality_oracle`` over a generation that arrives in chunks.
+
+    The verdict is identical to running the oracle on the concatenated text,
+    but the text is never joined: boundaries and outside text are found with
+    a few characters of lookbehind, and the payload is fed to the tokenizer
+    and parser as it arrives. After the first tokenizer or parser violation
+    the payload is no longer kept, and once the verdict cannot change
+    (text outside the boundary, ``</GGL>`` before ``<GGL>``) ``feed`` returns
+    False so callers can stop reading.
+
+    Lowering needs the AST, so with ``want_lower`` (or ``keep_ast``) the
+    parsed payload is kept as AST events and the result carries the AST.
+    Otherwise ``@legality`` rules are checked as the parser emits nodes and
+    the events are dropped, so memory stays O(nesting depth) however long
+    the payload; the result is the same except that ``ast`` is None.
+
+    ``prefix_score`` grades the text fed so far at no extra cost, and
+    ``copy`` forks the state, so a search can score every candidate
+    continuation for the price of its new characters.
+    """
+
+    def __init__(
+        self,
+        abi: ABI,
+        want_lower: bool = True,
+        compiled: Optional[CompiledABI] = None,
+        keep_ast: bool = False,
+    ) -> None:
+        self.compiled = compiled if compiled is not None else compile_abi(abi)
+        self.want_lower = want_lower
+        self.keep_ast = want_lower or keep_ast
+        self._phase = _PRE
+        self._hold = ""
+        self._outside = False
+        self._result: Optional[OracleResult] = None
+        # Payload: leading whitespace is dropped and trailing whitespace is
+        # held back until more payload follows it, matching inner.strip().
+        self._live = False
+        self._seen = False
+        self._pending_ws = ""
+        self._line = 1
+        self._col = 1
+        # Payload characters so far, and where the first tokenizer failure is
+        # along with how much of the payload before it parses.
+        self._size = 0
+        self._tok_at = 0
+        self._parsed = 0
+        self._tok_err: Optional[Dict[str, Any]] = None
+        self._parse: Optional[ParserState] = None
+        self._parse_err: Optional[ParseError] = None
+        # Without keep_ast: the first @legality violation among released events.
+        self._legal: Optional[LegalityRecorder] = None
+
+    @property
+    def settled(self) -> bool:
+        """True once further input can no longer change the result."""
+        return self._result is not None
+
+    @property
+    def prefix_score(self) -> float:
+        """``prefix_score`` of the text so far, as if the generation ended well from here.
+
+        Once settled this is the result's prefix_score.
+        """
+        if self._result is not None:
+            return self._result.prefix_score
+        if self._phase == _PRE or self._outside or not self._size:
+            return 0.0
+        n = self._size
+        if self._tok_err is not None:
+            return prefix_credit(self._tok_at / n, self._parsed / n)
+        if self._parse_err is not None:
+            return prefix_credit(1.0, self._parse_err.offset / n)
+        return prefix_credit(1.0, 1.0)
+
+    def copy(self) -> "StreamingOracle":
+        """Independent fork of this state, e.g. one per candidate continuation."""
+        other = copy.copy(self)
+        if self._parse is not None:
+            other._parse = self._parse.copy()
+        if self._legal is not None:
+            other._legal = self._legal.copy()
+        return other
+
+    def feed(self, chunk: str) -> bool:
+        """Consume ``chunk``; return False once the verdict is settled."""
+        if self._result is None and chunk:
+            buf = self._hold + chunk if self._hold else chunk
+            self._hold = ""
+            self._scan(buf, final=False)
+        return self._result is None
+
+    def finish(self) -> OracleResult:
+        if self._result is None:
+            buf, self._hold = self._hold, ""
+            self._scan(buf, final=True)
+        if self._result is None:
+            if self._phase != _POST:
+                self._result = _boundary_failure(outside=False)
+            else:
+                self._result = self._payload_result()
+        stats = active_stats()
+        if stats is not None:
+            stats.record_result(self._result.stage, self._result.code, self._result.ok)
+        return self._result
+
+    def _scan(self, buf: str, final: bool) -> None:
+        while buf:
+            if self._phase == _PRE:
+                a = buf.find(BOUNDARY_OPEN)
+                b = buf.find(BOUNDARY_CLOSE)
+                if b != -1 and (a == -1 or b < a):
+                    self._result = _boundary_failure(outside=False)
+                    return
+                if a == -1:
+                    cut = len(buf) if final else max(len(buf) - _OPEN_HOLD, 0)
+                    if not self._outside and _NON_WS.search(buf, 0, cut):
+                        self._outside = True
+                    self._hold = buf[cut:]
+                    return
+                if not self._outside and _NON_WS.search(buf, 0, a):
+                    self._outside = True
+                self._phase = _BODY
+                if not self._outside:
+                    # With outside text the verdict no longer depends on the payload.
+                    self._live = True
+                    self._parse = self.compiled.parser.start()
+                    plan = self.compiled.limits.plan
+                    if not self.keep_ast and self.compiled.parser.structural and not plan.empty:
+                        self._legal = LegalityRecorder(plan)
+                buf = buf[a + len(BOUNDARY_OPEN) :]
+            elif self._phase == _BODY:
+                b = buf.find(BOUNDARY_CLOSE)
+                if b == -1:
+                    cut = len(buf) if final else max(len(buf) - _CLOSE_HOLD, 0)
+                    self._payload(buf[:cut])
+                    self._hold = buf[cut:]
+                    return
+                self._payload(buf[:b])
+                self._phase = _POST
+                self._live = False
+                if self._outside:
+                    self._result = _boundary_failure(outside=True)
+                    return
+                buf = buf[b + len(BOUNDARY_CLOSE) :]
+            else:
+                if _NON_WS.search(buf):
+                    self._result = _boundary_failure(outside=True)
+                    self._parse = None
+                return
+
+    def _payload(self, seg: str) -> None:
+        if not self._live or not seg:
+            return
+        if not self._seen:
+            seg = seg.lstrip()
+            if not seg:
+                return
+            self._seen = True
+        head = seg.rstrip()
+        if not head:
+            self._pending_ws += seg
+            return
+        text = self._pending_ws + head if self._pending_ws else head
+        self._pending_ws = seg[len(head) :]
+        if self._tok_err is None:
+            self._consume(text)
+        # After a tokenizer failure the rest of the payload is only measured.
+        self._size += len(text)
+
+    def _consume(self, text: str) -> None:
+        validator = self.compiled.tokenizer
+        idx = validator.first_bad_index(text)
+        if idx >= 0:
+            err = validator.error_at(text, idx)
+            if err["line"] == 1:
+                err["line"], err["col"] = self._line, self._col + err["col"] - 1
+            else:
+                err["line"] += self._line - 1
+            self._tok_err = err
+            self._tok_at = self._size + idx
+            state = self._parse
+            if state is not None:
+                self.compiled.parser.feed(state, text[:idx])
+            if self._parse_err is not None:
+                self._parsed = self._parse_err.offset
+            elif state is not None:
+                self._parsed = closed_prefix_len(self.compiled.parser, state, self._tok_at)
+            else:
+                self._parsed = self._tok_at
+            self._parse = None
+            return
+
+        state = self._parse
+        if state is not None:
+            self.compiled.parser.feed(state, text)
+            if state.error is not None:
+                # The tokenizer still has to vet the rest of the payload, but
+                # the parse verdict is fixed; drop the parser state.
+                self._parse_err = state.error
+                self._parse = None
+            elif not self.keep_ast:
+                self.compiled.parser.release(state, self._legal)
+
+        newlines = text.count("\n")
+        if newlines:
+            self._line += newlines
+            self._col = len(text) - text.rfind("\n")
+        else:
+            self._col += len(text)
+
+    def _payload_result(self) -> OracleResult:
+        flags = {
+            "boundary": True,
+            "tokenize": False,
+            "parse": False,
+            "legal": False,
+            "lower": False,
+        }
+        n = max(self._size, 1)
+        if self._tok_err is not None:
+            score = prefix_credit(self._tok_at / n, self._parsed / n)
+            return _tokenize_failure(self._tok_err, flags, score)
+        flags["tokenize"] = True
+
+        parser = self.compiled.parser
+        try:
+            if self._parse_err is not None:
+                raise self._parse_err
+            if not self.keep_ast:
+                closed = parser.close(self._parse)
+            else:
+                ast = parser.finish(self._parse)
+        except ParseError as e:
+            return _parse_failure(e, flags, prefix_credit(1.0, e.offset / n))
+        self._parse = None
+        flags["parse"] = True
+
+        if self.keep_ast:
+            return _check_and_lower(ast, self.compiled, self.want_lower, flags, None, 0.0, "")
+        legal = self._legal
+        try:
+            check_body_limits(parser.ast_type, self._size, self.compiled.limits)
+            if legal is not None:
+                parser.release(closed, legal)
+                if legal.error is not None:
+                    raise legal.error
+        except LegalityError as e:
+            return _legality_failure(e, flags, None)
+        flags["legal"] = True
+        return OracleResult(
+            ok=True,
+            stage="ok",
+            code="OK",
+            msg="legal",
+            partial_score=legality_score(flags),
+            prefix_score=legality_score(flags),
+        )
+
+
+def ggl_legality_oracle_stream(
+    source: Union[Iterable[str], TextIO],
+    abi: ABI,
+    want_lower: bool = True,
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> OracleResult:
+    """Score a generation read from an iterable of chunks or a text stream.
+
+    Reading stops early once the verdict is settled.
+    """
+    oracle = StreamingOracle(abi, want_lower)
+    read = getattr(source, "read", None)
+    if read is not None:
+        while True:
+            chunk = read(chunk_size)
+            if not chunk or not oracle.feed(chunk):
+                break
+    else:
+        for chunk in source:
+            if not oracle.feed(chunk):
+                break
+    return oracle.finish()
@@ -1,7 +1,11 @@
 from __future__ import annotations
 
 import re
-from typing import Any, Dict, Iterable, Optional, Tuple
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+_FIRST_WINDOW = 256
 
 
 def _line_col(text: str, idx: int) -> Tuple[int, int]:
@@ -10,55 +14,127 @@ def _line_col(text: str, idx: int) -> Tuple[int, int]:
     return line, col
 
 
-def _char_in_ranges(ch: str, ranges: Iterable[Tuple[int, int]]) -> bool:
-    cp = ord(ch)
-    for start, end in ranges:
-        if start <= cp <= end:
-            return True
-    return False
+def _merge_ranges(ranges: Iterable[Sequence[int]]) -> Tuple[List[int], List[int]]:
+    """Sort and merge inclusive codepoint ranges into parallel start/end tables."""
+    starts: List[int] = []
+    ends: List[int] = []
+    for start, end in sorted((int(r[0]), int(r[1])) for r in ranges):
+        if end < start:
+            continue
+        if ends and start <= ends[-1] + 1:
+            if end > ends[-1]:
+                ends[-1] = end
+            continue
+        starts.append(start)
+        ends.append(end)
+    return starts, ends
+
+
+def _in_table(cp: int, starts: List[int], ends: List[int]) -> bool:
+    i = bisect_right(starts, cp) - 1
+    return i >= 0 and cp <= ends[i]
+
+
+class TokenizerValidator:
+    """Tokenizer ABI checks compiled once and reused across payloads.
+
+    Every check in the ABI depends on a single character, so each distinct
+    character is classified once and the payload is scanned for the first
+    character that failed. Line/col is only computed for the failing index.
+    """
+
+    def __init__(self, tokenizer_abi: Dict[str, Any]) -> None:
+        allowed_ranges = tokenizer_abi.get("allowed_unicode_ranges")
+        disallowed_ranges = tokenizer_abi.get("disallowed_unicode_ranges")
+        allowed_regex = tokenizer_abi.get("allowed_char_regex")
+        disallowed_regex = tokenizer_abi.get("disallowed_char_regex")
+
+        self._allowed = _merge_ranges(allowed_ranges) if allowed_ranges else None
+        self._disallowed = _merge_ranges(disallowed_ranges) if disallowed_ranges else None
+        self._allowed_pattern = re.compile(allowed_regex) if allowed_regex else None
+        self._disallowed_pattern = re.compile(disallowed_regex) if disallowed_regex else None
+        # ch -> error code, or None when the character passes every check.
+        self._verdicts: Dict[str, Optional[str]] = {}
+
+    @property
+    def is_trivial(self) -> bool:
+        return not (
+            self._allowed
+            or self._disallowed
+            or self._allowed_pattern
+            or self._disallowed_pattern
+        )
+
+    def classify(self, ch: str) -> Optional[str]:
+        try:
+            return self._verdicts[ch]
+        except KeyError:
+            pass
+        code = self._classify(ch)
+        self._verdicts[ch] = code
+        return code
+
+    def _classify(self, ch: str) -> Optional[str]:
+        cp = ord(ch)
+        if self._disallowed and _in_table(cp, *self._disallowed):
+            return "E_TOK_DISALLOWED_CHAR"
+        if self._allowed and not _in_table(cp, *self._allowed):
+            return "E_TOK_OUT_OF_RANGE"
+        if self._allowed_pattern and not self._allowed_pattern.fullmatch(ch):
+            return "E_TOK_REGEX_MISMATCH"
+        if self._disallowed_pattern and self._disallowed_pattern.search(ch):
+            return "E_TOK_DISALLOWED_REGEX"
+        return None
+
+    def first_bad_index(self, text: str, start: int = 0) -> int:
+        """Index of the first character at or after ``start`` that fails, or -1."""
+        if self.is_trivial:
+            return -1
+        # Growing windows keep early failures cheap without giving up the
+        # set-based scan on long valid payloads.
+        n = len(text)
+        window = _FIRST_WINDOW
+        while start < n:
+            stop = min(n, start + window)
+            bad = [ch for ch in set(text[start:stop]) if self.classify(ch) is not None]
+            if bad:
+                if len(bad) == 1:
+                    return text.find(bad[0], start, stop)
+                pattern = re.compile("[" + "".join(re.escape(ch) for ch in bad) + "]")
+                return pattern.search(text, start, stop).start()
+            start = stop
+            window *= 4
+        return -1
+
+    def check(self, text: str) -> Optional[Dict[str, Any]]:
+        idx = self.first_bad_index(text)
+        if idx < 0:
+            return None
+        return self.error_at(text, idx)
+
+    def error_at(self, text: str, idx: int) -> Dict[str, Any]:
+        ch = text[idx]
+        code = self.classify(ch)
+        line, col = _line_col(text, idx)
+        return {
+            "code": code,
+            "msg": _ERROR_MESSAGES[code].format(cp=ord(ch)),
+            "line": line,
+            "col": col,
+        }
+
+
+_ERROR_MESSAGES = {
+    "E_TOK_DISALLOWED_CHAR": "disallowed character U+{cp:04X}",
+    "E_TOK_OUT_OF_RANGE": "character U+{cp:04X} outside allowed ranges",
+    "E_TOK_REGEX_MISMATCH": "character U+{cp:04X} failed allowed regex",
+    "E_TOK_DISALLOWED_REGEX": "character U+{cp:04X} matched disallowed regex",
+}
+
+
+def compile_tokenizer_abi(tokenizer_abi: Dict[str, Any]) -> TokenizerValidator:
+    return TokenizerValidator(tokenizer_abi)
 
 
 def abi_tokenize_ok(text: str, tokenizer_abi: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    allowed_ranges = tokenizer_abi.get("allowed_unicode_ranges")
-    disallowed_ranges = tokenizer_abi.get("disallowed_unicode_ranges")
-    allowed_regex = tokenizer_abi.get("allowed_char_regex")
-    disallowed_regex = tokenizer_abi.get("disallowed_char_regex")
-
-    allowed_pattern = re.compile(allowed_regex) if allowed_regex else None
-    disallowed_pattern = re.compile(disallowed_regex) if disallowed_regex else None
-
-    for idx, ch in enumerate(text):
-        if disallowed_ranges and _char_in_ranges(ch, disallowed_ranges):
-            line, col = _line_col(text, idx)
-            return {
-                "code": "E_TOK_DISALLOWED_CHAR",
-                "msg": f"disallowed character U+{ord(ch):04X}",
-                "line": line,
-                "col": col,
-            }
-        if allowed_ranges and not _char_in_ranges(ch, allowed_ranges):
-            line, col = _line_col(text, idx)
-            return {
-                "code": "E_TOK_OUT_OF_RANGE",
-                "msg": f"character U+{ord(ch):04X} outside allowed ranges",
-                "line": line,
-                "col": col,
-            }
-        if allowed_pattern and not allowed_pattern.fullmatch(ch):
-            line, col = _line_col(text, idx)
-            return {
-                "code": "E_TOK_REGEX_MISMATCH",
-                "msg": f"character U+{ord(ch):04X} failed allowed regex",
-                "line": line,
-                "col": col,
-            }
-        if disallowed_pattern and disallowed_pattern.search(ch):
-            line, col = _line_col(text, idx)
-            return {
-                "code": "E_TOK_DISALLOWED_REGEX",
-                "msg": f"character U+{ord(ch):04X} matched disallowed regex",
-                "line": line,
-                "col": col,
-            }
-
-    return None
+    return TokenizerValidator(tokenizer_abi).check(text)
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+from oracle.canon import INLINE_LEN, canon_hash, canon_json_bytes_v1, write_canon_json_v1
+
+CANON_CORPUS = Path(__file__).with_name("canon_conformance.v1.jsonl")
+
+
+def _corpus_cases() -> List[Dict[str, Any]]:
+    with open(CANON_CORPUS, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def _mapping_cases() -> List[Dict[str, Any]]:
+    """Dict subclasses, which a JSON corpus cannot hold; the recorded bytes come from json.dumps."""
+    nested = {f"k{i:03d}": OrderedDict([("b", i), ("a", [i])]) for i in range(8)}
+    flat = {f"k{i:03d}": OrderedDict([("b", i), ("a", i)]) for i in range(8)}
+    cases = []
+    for name, value in (("nested_ordered_dict", nested), ("ordered_dict_values", flat)):
+        canon = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        cases.append(
+            {
+                "name": name,
+                "value": value,
+                "canon": canon,
+                "sha256": hashlib.sha256(canon.encode("utf-8")).hexdigest(),
+            }
+        )
+    cases.append({**cases[0], "name": "ordered_dict_root", "value": OrderedDict(nested)})
+    return cases
+
+
+CASES = _corpus_cases() + _mapping_cases()
+
+
+@pytest.mark.parametrize("case", CASES, ids=[case["name"] for case in CASES])
+def test_canonical_encoders_match_corpus(case: Dict[str, Any]) -> None:
+    expected = case["canon"].encode("utf-8")
+    assert hashlib.sha256(expected).hexdigest() == case["sha256"]
+    assert canon_json_bytes_v1(case["value"]) == expected
+    assert canon_hash(case["value"]) == case["sha256"]
+    for inline_len in (1, 3, INLINE_LEN):
+        out = io.BytesIO()
+        write_canon_json_v1(case["value"], out, inline_len=inline_len)
+        assert out.getvalue() == expected
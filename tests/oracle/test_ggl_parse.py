@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from oracle.ggl_parse import GGLParser, ParseError
+
+LEX_GRAMMAR = Path(__file__).resolve().parents[2] / "codex" / "lex" / "lex.grammar.v1.ggl.json"
+
+
+@pytest.fixture(scope="module")
+def parser() -> GGLParser:
+    with open(LEX_GRAMMAR, "r", encoding="utf-8") as f:
+        return GGLParser(json.load(f))
+
+
+# Payloads the lex grammar rejects, with the expected-token list each error must name.
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Wonder = 1", "expected Pop, Sek, Wo"),
+        ("Wo a = 1 Wonder", "expected Pop, Sek, Wo"),
+        ("Sek a -> b 5", "expected ->, Pop, Sek, Wo"),
+        ("Wo a.b 5", "expected ., ="),
+    ],
+)
+def test_parse_error_lists_expected_tokens(parser: GGLParser, text: str, expected: str) -> None:
+    with pytest.raises(ParseError) as info:
+        parser.parse(text)
+    assert info.value.msg.endswith(expected)
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from oracle.abi import ABI, abi_from_objects
+from oracle.bench import BENCH_TOKENIZER_ABI, LEX_GRAMMAR
+from oracle.oracle import ggl_legality_oracle, prefix_credit
+from oracle.stream import StreamingOracle
+
+
+@pytest.fixture(scope="module")
+def abi() -> ABI:
+    with open(LEX_GRAMMAR, "r", encoding="utf-8") as f:
+        return abi_from_objects(BENCH_TOKENIZER_ABI, json.load(f))
+
+
+def _streamed(text: str, abi: ABI, step: int = 3) -> tuple:
+    oracle = StreamingOracle(abi, want_lower=False)
+    for i in range(0, len(text), step):
+        oracle.feed(text[i : i + step])
+    res = oracle.finish()
+    return res.code, res.prefix_score
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "<GGL>Wo a = 1\nWo b =</GGL>",
+        "<GGL>Wo a = 1 Wo b</GGL>",
+        "<GGL>Sek a -> b -></GGL>",
+        "<GGL>Wo a = 1\nWo b = <x</GGL>",
+    ],
+)
+def test_truncated_payload_scores_below_full_parse(abi: ABI, text: str) -> None:
+    res = ggl_legality_oracle(text, abi, want_lower=False)
+    assert not res.ok
+    assert res.prefix_score < prefix_credit(1.0, 1.0)
+    assert _streamed(text, abi) == (res.code, res.prefix_score)
+
+
+LEGALITY_RULES = [
+    {"kind": "max_nodes", "node": "stmt", "max": 3},
+    {"kind": "max_children", "node": "path", "max": 2},
+    {"kind": "max_depth", "max": 4},
+    {"kind": "token_max_length", "token": "ID", "max": 5},
+]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "<GGL>Wo a = 1\nWo b = 2</GGL>",
+        "<GGL>Wo camera.fov = 60</GGL>",
+        "<GGL>Wo a = 1\nWo b = 2\nWo c = 3\nWo d = 4</GGL>",
+        "<GGL>Wo ab.cd = 1</GGL>",
+        "<GGL>Wo a.b.c = 1</GGL>",
+    ],
+)
+@pytest.mark.parametrize("step", [1, 4, 64])
+def test_stream_without_ast_matches_batch(text: str, step: int) -> None:
+    with open(LEX_GRAMMAR, "r", encoding="utf-8") as f:
+        grammar = json.load(f)
+    grammar["@legality"] = LEGALITY_RULES
+    abi = abi_from_objects(BENCH_TOKENIZER_ABI, grammar)
+    res = ggl_legality_oracle(text, abi, want_lower=False)
+    oracle = StreamingOracle(abi, want_lower=False)
+    for i in range(0, len(text), step):
+        oracle.feed(text[i : i + step])
+    streamed = oracle.finish()
+    assert streamed.ast is None
+    assert (streamed.code, streamed.msg, streamed.line, streamed.col, streamed.prefix_score) == (
+        res.code,
+        res.msg,
+        res.line,
+        res.col,
+        res.prefix_score,
+    )
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+
+from binary_pack import gather_files, load_and_clean
+from pi_tokenizer import PiTokenizer
+
+# Mostly ASCII with some accents, CJK and emoji, so every lookup path is hit.
+_SAMPLE_ALPHABET = (
+    "abcdefghijklmnopqrstuvwxyz" * 8
+    + "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 .,;:\n" * 4
+    + "éüñßøåçœ"
+    + "数据矩阵原子"
+    + "\U0001f600\U0001f680"
+)
+
+
+def synthetic_text(size: int, seed: int) -> str:
+    rng = random.Random(seed)
+    return "".join(rng.choices(_SAMPLE_ALPHABET, k=size))
+
+
+def load_corpus(input_dir: Path) -> str:
+    return "\n".join(load_and_clean(path) for path in gather_files(input_dir))
+
+
+def timed(fn: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark PiTokenizer encode throughput")
+    parser.add_argument("--tokenizer", required=True, type=Path, help="pi_symbol_map.json path")
+    parser.add_argument("--input", type=Path, help="Corpus directory (default: synthetic text)")
+    parser.add_argument("--chars", type=int, default=4_000_000, help="Synthetic corpus size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="tokenize_batch worker processes")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    tokenizer = PiTokenizer.from_file(args.tokenizer)
+    text = load_corpus(args.input) if args.input else synthetic_text(args.chars, args.seed)
+    mb = len(text.encode("utf-8")) / 1e6
+
+    reference: List[int] = []
+    loop_s = timed(lambda: reference.extend(tokenizer._tokenize_chars(text)))
+    fast_s = timed(lambda: tokenizer.encode(text))
+    if tokenizer.tokenize(text) != reference:
+        raise SystemExit("[FAIL] encode output differs from the per-character tokenizer")
+
+    print(f"[OK] {mb:.2f} MB, {len(reference)} tokens")
+    print(f"[OK] per-char loop: {mb / loop_s:.2f} MB/s")
+    print(f"[OK] vectorized:    {mb / fast_s:.2f} MB/s")
+
+    ids = tokenizer.encode(text)
+    decoded: List[str] = []
+    decode_s = timed(lambda: decoded.append(tokenizer.decode_array(ids)))
+    lossless = "exact" if decoded[0] == tokenizer.normalize(text) else "lossy (unk ids)"
+    print(f"[OK] decode:        {mb / decode_s:.2f} MB/s, round trip {lossless}")
+
+    docs = text.splitlines(keepends=True)
+    batch: List[np.ndarray] = []
+    batch_s = timed(lambda: batch.extend(tokenizer.tokenize_batch(docs, workers=args.workers)))
+    ids, offsets = batch
+    expected = [tokenizer.encode(doc) for doc in docs]
+    if offsets[-1] != len(ids) or not np.array_equal(ids, np.concatenate(expected or [ids])):
+        raise SystemExit("[FAIL] tokenize_batch output differs from per-text encode")
+    print(f"[OK] batch x{args.workers}:     {mb / batch_s:.2f} MB/s ({len(docs)} texts)")
+
+
+if __name__ == "__main__":
+    main()
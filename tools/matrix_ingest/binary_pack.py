@@ -1,19 +1,22 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
+import os
 import struct
+import tempfile
 import zlib
 from pathlib import Path
-from typing import Iterable, List
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 
-from pi_tokenizer import PiTokenizer
+from matrix_atom import HEADER_SIZE, MAGIC, MANIFEST_FORMAT, write_manifest
+from pi_tokenizer import PiTokenizer, _pool_context
 
 ALLOWED_SUFFIXES = {".txt", ".md", ".html", ".json"}
-MAGIC = b"MTRXATOM"
-HEADER_SIZE = 64
+INDEX_FORMAT = "matrix-atom-index.v2"
 
 DTYPE_ID = {
     np.uint16: 1,
@@ -34,16 +37,10 @@ def load_and_clean(path: Path) -> str:
     return text
 
 
-def gather_files(input_dir: Path) -> Iterable[Path]:
-    for path in input_dir.rglob("*"):
-        if path.suffix.lower() in ALLOWED_SUFFIXES:
-            yield path
-
-
-def pad_tokens(tokens: List[int], atom_size: int, pad_id: int) -> None:
-    pad = (-len(tokens)) % atom_size
-    if pad:
-        tokens.extend([pad_id] * pad)
+def gather_files(input_dir: Path) -> List[Path]:
+    """Packable files under ``input_dir``, sorted by relative path so every run agrees."""
+    paths = [path for path in input_dir.rglob("*") if path.suffix.lower() in ALLOWED_SUFFIXES]
+    return sorted(paths, key=lambda path: path.relative_to(input_dir).as_posix())
 
 
 def build_header(
@@ -77,34 +74,395 @@ def build_header(
     return header
 
 
+class AtomWriter:
+    """Streams token chunks into a MATRIX-ATOM v1 file.
+
+    A zeroed header goes first, so an interrupted pack never has a valid
+    magic; chunks are appended as typed arrays while the payload CRC is
+    updated, and ``close`` pads to whole atoms and writes the real header.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        dtype: np.dtype,
+        vocab_size: int,
+        atom_size: int,
+        pad_id: int,
+    ) -> None:
+        if vocab_size > np.iinfo(dtype).max + 1:
+            raise ValueError(f"vocab_size {vocab_size} does not fit in {dtype}")
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.vocab_size = vocab_size
+        self.atom_size = atom_size
+        self.pad_id = pad_id
+        self.token_count = 0
+        self.payload_crc32 = 0
+        self._handle: BinaryIO = path.open("wb")
+        self._handle.write(b"\x00" * HEADER_SIZE)
+
+    def write(self, tokens: np.ndarray) -> None:
+        chunk = np.ascontiguousarray(tokens, dtype=self.dtype)
+        self.payload_crc32 = zlib.crc32(chunk, self.payload_crc32)
+        self._handle.write(chunk)
+        self.token_count += len(chunk)
+
+    def close(self) -> None:
+        pad = (-self.token_count) % self.atom_size
+        if pad:
+            self.write(np.full(pad, self.pad_id, dtype=self.dtype))
+        header = build_header(
+            dtype=self.dtype,
+            vocab_size=self.vocab_size,
+            atom_size=self.atom_size,
+            token_count=self.token_count,
+            payload_crc32=self.payload_crc32,
+        )
+        self._handle.seek(0)
+        self._handle.write(header)
+        self._handle.close()
+
+    def __enter__(self) -> "AtomWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._handle.close()
+
+
+def shard_path(output_file: Path, index: int) -> Path:
+    return output_file.with_name(f"{output_file.stem}.{index:05d}{output_file.suffix}")
+
+
+def manifest_path(output_file: Path) -> Path:
+    return output_file.with_name(f"{output_file.stem}.manifest.json")
+
+
+def _manifest_shards(manifest: Path) -> List[Path]:
+    """Shard paths listed by an existing manifest; empty if there is none or it is unreadable."""
+    try:
+        data = json.loads(manifest.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return []
+    if not isinstance(data, dict) or data.get("format") != MANIFEST_FORMAT:
+        return []
+    return [manifest.parent / entry["path"] for entry in data.get("shards", [])]
+
+
+class ShardedAtomWriter:
+    """Splits one token stream into MATRIX-ATOM files of ``shard_atoms`` atoms each.
+
+    Shards are cut on atom boundaries of the whole stream, so only the last
+    one is padded and reading them back in order gives the same atoms as an
+    unsharded pack. Each shard is a complete file with its own header and
+    CRCs; ``close`` writes the manifest that ties them together.
+    """
+
+    def __init__(
+        self,
+        output_file: Path,
+        *,
+        shard_atoms: int,
+        dtype: np.dtype,
+        vocab_size: int,
+        atom_size: int,
+        pad_id: int,
+    ) -> None:
+        if shard_atoms <= 0:
+            raise ValueError("shard_atoms must be positive")
+        self.output_file = output_file
+        self.shard_tokens = shard_atoms * atom_size
+        self._options = {
+            "dtype": dtype,
+            "vocab_size": vocab_size,
+            "atom_size": atom_size,
+            "pad_id": pad_id,
+        }
+        self.shards: List[Path] = []
+        self._shard_token_total = 0
+        self._current: Optional[AtomWriter] = None
+
+    @property
+    def token_count(self) -> int:
+        current = self._current.token_count if self._current is not None else 0
+        return self._shard_token_total + current
+
+    def write(self, tokens: np.ndarray) -> None:
+        while len(tokens):
+            if self._current is None:
+                path = shard_path(self.output_file, len(self.shards))
+                self._current = AtomWriter(path, **self._options)
+            room = self.shard_tokens - self._current.token_count
+            self._current.write(tokens[:room])
+            tokens = tokens[room:]
+            if self._current.token_count == self.shard_tokens:
+                self._finish_shard()
+
+    def _finish_shard(self) -> None:
+        self._current.close()
+        self.shards.append(self._current.path)
+        self._shard_token_total += self._current.token_count
+        self._current = None
+
+    def close(self) -> None:
+        if self._current is None and not self.shards:
+            # An empty stream still gets one (empty) shard to carry the metadata.
+            self._current = AtomWriter(shard_path(self.output_file, 0), **self._options)
+        if self._current is not None:
+            self._finish_shard()
+        manifest = manifest_path(self.output_file)
+        previous = _manifest_shards(manifest)
+        write_manifest(manifest, self.shards)
+        # Shards of an earlier, longer pack that the new manifest dropped.
+        kept = {path.resolve() for path in self.shards}
+        for path in previous:
+            if path.resolve() not in kept and path.exists():
+                path.unlink()
+
+    def __enter__(self) -> "ShardedAtomWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        if exc_type is None:
+            self.close()
+        elif self._current is not None:
+            self._current.__exit__(exc_type, exc, tb)
+
+
+# (tokenizer, dtype) of a pack worker, set once by _init_pack_worker.
+_PACK_WORKER: Optional[Tuple[PiTokenizer, np.dtype]] = None
+
+
+def _init_pack_worker(tokenizer: PiTokenizer, dtype: np.dtype) -> None:
+    global _PACK_WORKER
+    _PACK_WORKER = (tokenizer, np.dtype(dtype))
+
+
+def _pack_file(job: Tuple[Path, Path]) -> Path:
+    """Tokenize one file into a raw chunk of ``dtype`` tokens; return the chunk path."""
+    source, chunk = job
+    tokenizer, dtype = _PACK_WORKER
+    tokens = tokenizer.encode(load_and_clean(source)).astype(dtype)
+    # Written aside and renamed, so an interrupted run never leaves a short chunk.
+    fd, tmp = tempfile.mkstemp(dir=chunk.parent, prefix=".chunk-")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            tokens.tofile(handle)
+        os.replace(tmp, chunk)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return chunk
+
+
+def _tokenize_to_chunks(
+    jobs: List[Tuple[Path, Path]], tokenizer: PiTokenizer, dtype: np.dtype, workers: int
+) -> Iterator[Path]:
+    """Run (source, chunk) jobs, yielding each chunk path in job order as it is written."""
+    if workers <= 1 or len(jobs) <= 1:
+        _init_pack_worker(tokenizer, dtype)
+        for job in jobs:
+            yield _pack_file(job)
+        return
+    with _pool_context().Pool(
+        min(workers, len(jobs)), initializer=_init_pack_worker, initargs=(tokenizer, dtype)
+    ) as pool:
+        yield from pool.imap(_pack_file, jobs)
+
+
+def index_path(output_file: Path) -> Path:
+    return output_file.with_name(f"{output_file.stem}.index.json")
+
+
+def chunk_dir(output_file: Path) -> Path:
+    return output_file.with_name(f"{output_file.stem}.chunks")
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _chunk_key(digest: str, path: Path, tokenizer: PiTokenizer, dtype: np.dtype) -> str:
+    """Chunk name for file content ``digest``: everything its tokens depend on."""
+    # load_and_clean re-serializes .json files and leaves the rest as text.
+    cleaning = "json" if path.suffix == ".json" else "text"
+    key = f"{digest}:{tokenizer.source_sha256}:{np.dtype(dtype).name}:{cleaning}"
+    return hashlib.sha256(key.encode("ascii")).hexdigest()
+
+
+def _load_index(
+    path: Path, tokenizer: PiTokenizer, dtype: np.dtype
+) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Entries of a previous run by relative path; None if missing, unusable or stale."""
+    try:
+        index = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if (
+        index.get("format") != INDEX_FORMAT
+        or index.get("tokenizer_sha256") != tokenizer.source_sha256
+        or index.get("dtype") != np.dtype(dtype).name
+    ):
+        return None
+    return {entry["path"]: entry for entry in index.get("files", [])}
+
+
+def _plan_incremental(
+    input_dir: Path,
+    paths: List[Path],
+    chunks: Path,
+    previous: Dict[str, Dict[str, Any]],
+    tokenizer: PiTokenizer,
+    dtype: np.dtype,
+) -> Tuple[List[Dict[str, Any]], List[Tuple[Path, Path]]]:
+    """Index entries for ``paths`` and the (source, chunk) jobs still to tokenize.
+
+    A file whose size and mtime match its previous entry is not read again;
+    otherwise it is hashed. A chunk is reused only if its byte size matches
+    the token count recorded for it, else it is tokenized again. Chunks are
+    named by content hash plus tokenizer, dtype and cleaning mode (see
+    ``_chunk_key``), so moved or duplicated files are reused too.
+    """
+    itemsize = np.dtype(dtype).itemsize
+    counts = {entry["chunk"]: entry["token_count"] for entry in previous.values()}
+    entries: List[Dict[str, Any]] = []
+    jobs: List[Tuple[Path, Path]] = []
+    queued = set()
+    for path in paths:
+        rel = path.relative_to(input_dir).as_posix()
+        stat = path.stat()
+        old = previous.get(rel)
+        if old is not None and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+            digest = old["sha256"]
+        else:
+            digest = _file_sha256(path)
+        key = _chunk_key(digest, path, tokenizer, dtype)
+        chunk = chunks / f"{key}.tok"
+        if key not in queued:
+            try:
+                size = chunk.stat().st_size
+            except OSError:
+                size = None
+            if key not in counts or size != counts[key] * itemsize:
+                jobs.append((path, chunk))
+            queued.add(key)
+        entries.append(
+            {
+                "path": rel,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": digest,
+                "chunk": key,
+            }
+        )
+    return entries, jobs
+
+
+def _write_index(
+    path: Path, tokenizer: PiTokenizer, dtype: np.dtype, entries: List[Dict[str, Any]]
+) -> None:
+    index = {
+        "format": INDEX_FORMAT,
+        "tokenizer_sha256": tokenizer.source_sha256,
+        "dtype": np.dtype(dtype).name,
+        "files": entries,
+    }
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".index-")
+    with os.fdopen(fd, "w", encoding="utf-8") as handle:
+        json.dump(index, handle, indent=1)
+    os.replace(tmp, path)
+
+
+def _open_writer(
+    output_file: Path, shard_atoms: Optional[int], options: Dict[str, Any]
+) -> Union[AtomWriter, ShardedAtomWriter]:
+    if shard_atoms is None:
+        return AtomWriter(output_file, **options)
+    return ShardedAtomWriter(output_file, shard_atoms=shard_atoms, **options)
+
+
 def pack_directory(
     input_dir: Path,
     tokenizer: PiTokenizer,
     output_file: Path,
     atom_size: int,
     dtype: np.dtype,
+    workers: int = 1,
+    shard_atoms: Optional[int] = None,
+    incremental: bool = False,
 ) -> None:
-    tokens: List[int] = []
-    for path in gather_files(input_dir):
-        text = load_and_clean(path)
-        tokens.extend(tokenizer.tokenize(text))
-    pad_tokens(tokens, atom_size, tokenizer.pad_id())
-
-    arr = np.array(tokens, dtype=dtype)
-    payload_crc32 = zlib.crc32(arr.tobytes())
-    header = build_header(
-        dtype=arr.dtype,
-        vocab_size=tokenizer.vocab_size(),
-        atom_size=atom_size,
-        token_count=len(arr),
-        payload_crc32=payload_crc32,
-    )
+    """Pack every file under ``input_dir``; memory is bounded by the largest file.
+
+    With ``workers`` > 1 a process pool tokenizes files into per-file chunks
+    and they are appended in sorted file order, so the output bytes do not
+    depend on ``workers``. With ``shard_atoms`` the output is a set of
+    shards plus a manifest instead of one file. With ``incremental`` each
+    file's chunk is kept next to the output under a sidecar index, and a
+    re-run tokenizes only new or changed files; the output is rebuilt from
+    the chunks and is identical to a full pack.
+    """
+    if incremental and tokenizer.source_sha256 is None:
+        raise ValueError("incremental packing needs a tokenizer loaded from a symbol map file")
+    paths = gather_files(input_dir)
+    options = {
+        "dtype": dtype,
+        "vocab_size": tokenizer.vocab_size(),
+        "atom_size": atom_size,
+        "pad_id": tokenizer.pad_id(),
+    }
 
-    output_file.write_bytes(header + arr.tobytes())
-    atom_count = len(arr) // atom_size
-    print(f"[OK] Packed {len(arr)} tokens")
-    print(f"[OK] Atoms: {atom_count}")
-    print(f"[OK] Output: {output_file}")
+    if incremental:
+        chunks = chunk_dir(output_file)
+        chunks.mkdir(parents=True, exist_ok=True)
+        previous = _load_index(index_path(output_file), tokenizer, dtype)
+        if previous is None:
+            # Chunks are only trusted under an index that matches this run.
+            for stale in chunks.glob("*.tok"):
+                stale.unlink()
+            previous = {}
+        entries, jobs = _plan_incremental(input_dir, paths, chunks, previous, tokenizer, dtype)
+        for _ in _tokenize_to_chunks(jobs, tokenizer, dtype, workers):
+            pass
+        with _open_writer(output_file, shard_atoms, options) as writer:
+            for entry in entries:
+                tokens = np.fromfile(chunks / f"{entry['chunk']}.tok", dtype=dtype)
+                entry["token_offset"] = writer.token_count
+                entry["token_count"] = len(tokens)
+                writer.write(tokens)
+        _write_index(index_path(output_file), tokenizer, dtype, entries)
+        live = {f"{entry['chunk']}.tok" for entry in entries}
+        for stale in chunks.glob("*.tok"):
+            if stale.name not in live:
+                stale.unlink()
+        print(f"[OK] Tokenized {len(jobs)} files, reused {len(entries) - len(jobs)}")
+    elif workers <= 1 or len(paths) <= 1:
+        with _open_writer(output_file, shard_atoms, options) as writer:
+            for path in paths:
+                writer.write(tokenizer.encode(load_and_clean(path)))
+    else:
+        with tempfile.TemporaryDirectory(prefix=".pack-", dir=output_file.parent) as tmp:
+            with _open_writer(output_file, shard_atoms, options) as writer:
+                jobs = [(path, Path(tmp) / f"{i:08d}.tok") for i, path in enumerate(paths)]
+                for chunk in _tokenize_to_chunks(jobs, tokenizer, dtype, workers):
+                    writer.write(np.fromfile(chunk, dtype=dtype))
+                    chunk.unlink()
+
+    print(f"[OK] Packed {writer.token_count} tokens")
+    print(f"[OK] Atoms: {writer.token_count // atom_size}")
+    if shard_atoms is None:
+        print(f"[OK] Output: {output_file}")
+    else:
+        print(f"[OK] Shards: {len(writer.shards)}")
+        print(f"[OK] Manifest: {manifest_path(output_file)}")
 
 
 def parse_args() -> argparse.Namespace:
@@ -114,19 +472,34 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--output", required=True, type=Path, help="Output .bin")
     parser.add_argument("--atom-size", type=int, default=256, help="Tokens per atom")
     parser.add_argument("--dtype", choices=["uint16", "uint32"], default="uint16")
+    parser.add_argument("--cache-dir", type=Path, help="Reuse compiled symbol maps from here")
+    parser.add_argument("--workers", type=int, default=1, help="Tokenizer worker processes")
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        help="Atoms per shard; writes <output>.NNNNN.bin shards and <output>.manifest.json",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Keep per-file token chunks in <output>.chunks and retokenize only changed files",
+    )
     return parser.parse_args()
 
 
 def main() -> None:
     args = parse_args()
     dtype = np.uint16 if args.dtype == "uint16" else np.uint32
-    tokenizer = PiTokenizer.from_file(args.tokenizer)
+    tokenizer = PiTokenizer.from_file(args.tokenizer, args.cache_dir)
     pack_directory(
         input_dir=args.input,
         tokenizer=tokenizer,
         output_file=args.output,
         atom_size=args.atom_size,
         dtype=np.dtype(dtype),
+        workers=args.workers,
+        shard_atoms=args.shard_size,
+        incremental=args.incremental,
     )
 
 
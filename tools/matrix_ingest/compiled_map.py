@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import argparse
+import mmap
+import os
+import struct
+import tempfile
+from collections.abc import Mapping
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from symbol_trie import SymbolTrie
+
+COMPILED_MAGIC = b"PISYMMAP"
+COMPILED_FORMAT = 2
+
+# magic, format, section count, sha256 of the source JSON, version,
+# vocab_size, unk_id, pad_id, byte_base_id, byte_fallback, normalization,
+# trie max_len; then one (offset, count) pair per section.
+_HEADER = struct.Struct("<8sII32sIIIIIB7sI")
+_SECTION = struct.Struct("<QQ")
+_ALIGN = 64
+
+# Section order and dtypes are fixed by the format version.
+_SECTIONS: Tuple[Tuple[str, str], ...] = (
+    ("bmp", "<i8"),
+    ("astral_cps", "<u4"),
+    ("astral_ids", "<i8"),
+    ("symbol_ids", "<i8"),
+    ("piece_offsets", "<i8"),
+    ("piece_bytes", "u1"),
+    ("alias_ids", "<i8"),
+    ("alias_offsets", "<i8"),
+    ("alias_bytes", "u1"),
+    ("trie_keys", "<i8"),
+    ("trie_children", "<i8"),
+    ("trie_root", "<i8"),
+    ("trie_token", "<i8"),
+)
+
+
+@dataclass(frozen=True)
+class TokenizerTables:
+    """Every lookup table PiTokenizer needs, as flat arrays.
+
+    ``bmp`` maps BMP codepoints of single-character symbols to ids (-1 if
+    none); ``astral_cps``/``astral_ids`` do the same for the rest, sorted by
+    codepoint. ``piece_bytes``/``piece_offsets`` hold the UTF-8 of every id,
+    which is also the string blob of the symbols listed in ``symbol_ids``.
+    Symbols sharing an id with another symbol keep their own text in
+    ``alias_bytes``/``alias_offsets``, one entry per ``alias_ids`` id.
+    """
+
+    bmp: np.ndarray
+    astral_cps: np.ndarray
+    astral_ids: np.ndarray
+    symbol_ids: np.ndarray
+    piece_offsets: np.ndarray
+    piece_bytes: np.ndarray
+    alias_ids: np.ndarray
+    alias_offsets: np.ndarray
+    alias_bytes: np.ndarray
+    trie: SymbolTrie
+
+
+class BlobSymbols(Mapping):
+    """Symbol text -> id view over a compiled map, decoded on first lookup."""
+
+    def __init__(self, tables: TokenizerTables) -> None:
+        self._tables = tables
+        self._symbols: Optional[Dict[str, int]] = None
+
+    def _decoded(self) -> Dict[str, int]:
+        if self._symbols is None:
+            tables = self._tables
+            blob = tables.piece_bytes.tobytes()
+            offsets = tables.piece_offsets.tolist()
+            self._symbols = {
+                blob[offsets[i] : offsets[i + 1]].decode("utf-8", "surrogatepass"): i
+                for i in tables.symbol_ids.tolist()
+            }
+            blob = tables.alias_bytes.tobytes()
+            offsets = tables.alias_offsets.tolist()
+            for k, i in enumerate(tables.alias_ids.tolist()):
+                self._symbols[blob[offsets[k] : offsets[k + 1]].decode("utf-8", "surrogatepass")] = i
+        return self._symbols
+
+    def __getitem__(self, text: str) -> int:
+        return self._decoded()[text]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._decoded())
+
+    def __len__(self) -> int:
+        return len(self._tables.symbol_ids) + len(self._tables.alias_ids)
+
+
+def compiled_cache_path(cache_dir: Path, digest: str) -> Path:
+    return cache_dir / f"{digest}.pimap.v{COMPILED_FORMAT}"
+
+
+def _section_arrays(tables: TokenizerTables) -> Dict[str, np.ndarray]:
+    trie = tables.trie
+    return {
+        "bmp": tables.bmp,
+        "astral_cps": tables.astral_cps,
+        "astral_ids": tables.astral_ids,
+        "symbol_ids": tables.symbol_ids,
+        "piece_offsets": tables.piece_offsets,
+        "piece_bytes": tables.piece_bytes,
+        "alias_ids": tables.alias_ids,
+        "alias_offsets": tables.alias_offsets,
+        "alias_bytes": tables.alias_bytes,
+        "trie_keys": trie.keys,
+        "trie_children": trie.children,
+        "trie_root": trie.root,
+        "trie_token": trie.token,
+    }
+
+
+def write_compiled(
+    path: Path, digest: str, scalars: Dict[str, Any], tables: TokenizerTables
+) -> None:
+    """Write a compiled map atomically, so concurrent workers never read a partial file.
+
+    ``scalars`` holds the SymbolMap fields other than ``symbols``.
+    """
+    arrays = _section_arrays(tables)
+    header = _HEADER.pack(
+        COMPILED_MAGIC,
+        COMPILED_FORMAT,
+        len(_SECTIONS),
+        bytes.fromhex(digest),
+        scalars["version"],
+        scalars["vocab_size"],
+        scalars["unk_id"],
+        scalars["pad_id"],
+        scalars["byte_base_id"],
+        int(scalars["byte_fallback"]),
+        scalars["normalization"].encode("ascii"),
+        tables.trie.max_len,
+    )
+    pos = _HEADER.size + _SECTION.size * len(_SECTIONS)
+    table = b""
+    blobs = []
+    for name, dtype in _SECTIONS:
+        pos += -pos % _ALIGN
+        data = np.ascontiguousarray(arrays[name], dtype=dtype).tobytes()
+        table += _SECTION.pack(pos, len(arrays[name]))
+        blobs.append((pos, data))
+        pos += len(data)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".pimap-")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(header + table)
+            for offset, data in blobs:
+                handle.write(b"\x00" * (offset - handle.tell()))
+                handle.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def read_compiled(
+    path: Path, digest: Optional[str] = None
+) -> Optional[Tuple[Dict[str, Any], TokenizerTables]]:
+    """Map a compiled map and view its sections in place; None if unusable.
+
+    Nothing is parsed or copied: every table is an ndarray over the mapping.
+    With ``digest`` the file must have been built from JSON with that sha256.
+    """
+    try:
+        with path.open("rb") as handle:
+            buf = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(buf) < _HEADER.size:
+        return None
+    (
+        magic,
+        fmt,
+        section_count,
+        source_sha256,
+        version,
+        vocab_size,
+        unk_id,
+        pad_id,
+        byte_base_id,
+        byte_fallback,
+        normalization,
+        max_len,
+    ) = _HEADER.unpack_from(buf)
+    if magic != COMPILED_MAGIC or fmt != COMPILED_FORMAT or section_count != len(_SECTIONS):
+        return None
+    if digest is not None and source_sha256.hex() != digest:
+        return None
+    arrays: Dict[str, np.ndarray] = {}
+    for i, (name, dtype) in enumerate(_SECTIONS):
+        offset, count = _SECTION.unpack_from(buf, _HEADER.size + i * _SECTION.size)
+        if offset + count * np.dtype(dtype).itemsize > len(buf):
+            return None
+        arrays[name] = np.frombuffer(buf, dtype=dtype, count=count, offset=offset)
+    scalars = {
+        "version": version,
+        "vocab_size": vocab_size,
+        "unk_id": unk_id,
+        "pad_id": pad_id,
+        "byte_fallback": bool(byte_fallback),
+        "byte_base_id": byte_base_id,
+        "normalization": normalization.rstrip(b"\x00").decode("ascii"),
+        "source_sha256": source_sha256.hex(),
+    }
+    tables = TokenizerTables(
+        bmp=arrays["bmp"],
+        astral_cps=arrays["astral_cps"],
+        astral_ids=arrays["astral_ids"],
+        symbol_ids=arrays["symbol_ids"],
+        piece_offsets=arrays["piece_offsets"],
+        piece_bytes=arrays["piece_bytes"],
+        alias_ids=arrays["alias_ids"],
+        alias_offsets=arrays["alias_offsets"],
+        alias_bytes=arrays["alias_bytes"],
+        trie=SymbolTrie(
+            keys=arrays["trie_keys"],
+            children=arrays["trie_children"],
+            root=arrays["trie_root"],
+            token=arrays["trie_token"],
+            max_len=max_len,
+        ),
+    )
+    return scalars, tables
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compile a π symbol map for mmap loading")
+    parser.add_argument("--tokenizer", required=True, type=Path, help="pi_symbol_map.json path")
+    parser.add_argument("--output", required=True, type=Path, help="Compiled map path")
+    return parser.parse_args()
+
+
+def main() -> None:
+    # Imported here: pi_tokenizer itself imports this module.
+    from pi_tokenizer import PiTokenizer
+
+    args = parse_args()
+    tokenizer = PiTokenizer.from_file(args.tokenizer)
+    tokenizer.save_compiled(args.output)
+    print(f"[OK] Compiled {tokenizer.vocab_size()} ids to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
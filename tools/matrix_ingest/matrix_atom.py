@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import argparse
+import json
+import struct
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+import numpy as np
+
+MAGIC = b"MTRXATOM"
+HEADER_SIZE = 64
+MANIFEST_FORMAT = "matrix-atom-manifest.v1"
+
+# binary_pack.build_header's layout: 48 bytes of fields, the header CRC
+# (taken with both CRC slots zeroed), the payload CRC and 8 reserved bytes.
+_HEADER_FORMAT = struct.Struct("<8sHHBBHIIQQQII")
+_CRC_OFFSET = 48
+DTYPES = {1: np.dtype("<u2"), 2: np.dtype("<u4")}
+
+# Atoms hashed per step when the payload CRC is checked.
+_VERIFY_ATOMS = 1 << 14
+
+
+@dataclass(frozen=True)
+class AtomHeader:
+    dtype: np.dtype
+    vocab_size: int
+    atom_size: int
+    atom_count: int
+    token_count: int
+    payload_offset: int
+    header_crc32: int
+    payload_crc32: int
+
+
+def parse_header(raw: bytes) -> AtomHeader:
+    """Validate a MATRIX-ATOM v1 header (magic, version, CRC, dtype) and decode it."""
+    if len(raw) < HEADER_SIZE:
+        raise ValueError("file shorter than the MATRIX-ATOM header")
+    (
+        magic,
+        version,
+        header_size,
+        dtype_id,
+        _flags,
+        _reserved,
+        vocab_size,
+        atom_size,
+        atom_count,
+        token_count,
+        payload_offset,
+        header_crc,
+        payload_crc32,
+    ) = _HEADER_FORMAT.unpack_from(raw)
+    if magic != MAGIC:
+        raise ValueError("bad magic, not a MATRIX-ATOM file")
+    if version != 1 or header_size != HEADER_SIZE:
+        raise ValueError(f"unsupported MATRIX-ATOM version {version}")
+    if zlib.crc32(raw[:_CRC_OFFSET] + b"\x00" * (HEADER_SIZE - _CRC_OFFSET)) != header_crc:
+        raise ValueError("header CRC mismatch")
+    if dtype_id not in DTYPES:
+        raise ValueError(f"unknown dtype id {dtype_id}")
+    if atom_size <= 0 or atom_count * atom_size != token_count:
+        raise ValueError("token_count is not atom_count * atom_size")
+    return AtomHeader(
+        dtype=DTYPES[dtype_id],
+        vocab_size=vocab_size,
+        atom_size=atom_size,
+        atom_count=atom_count,
+        token_count=token_count,
+        payload_offset=payload_offset,
+        header_crc32=header_crc,
+        payload_crc32=payload_crc32,
+    )
+
+
+class MatrixAtomFile:
+    """Read-only MATRIX-ATOM v1 file with its payload as an ``(atom_count, atom_size)`` memmap.
+
+    Opening reads only the header; atoms are paged in on access, so any
+    atom or slice is O(1) to reach and processes reading the same file
+    share it through the page cache. With ``verify=True`` the payload CRC
+    is checked on the first payload access by any path (``atoms``,
+    ``tokens``, indexing, ``iter_chunks``) instead of at open. Pickling
+    ships the path only, so DataLoader workers remap the file rather than
+    copy it.
+    """
+
+    def __init__(self, path: Path, verify: bool = False) -> None:
+        self.path = Path(path)
+        with self.path.open("rb") as handle:
+            self.header = parse_header(handle.read(HEADER_SIZE))
+            size = handle.seek(0, 2)
+        header = self.header
+        if size < header.payload_offset + header.token_count * header.dtype.itemsize:
+            raise ValueError("payload shorter than token_count")
+        self._verify = verify
+        self._verified: Optional[bool] = None
+        self._atoms: Optional[np.ndarray] = None
+
+    @property
+    def atoms(self) -> np.ndarray:
+        if self._verify and not self._verified:
+            # Raises on every access once the CRC has failed.
+            self.verify_payload()
+        return self._mapped()
+
+    def _mapped(self) -> np.ndarray:
+        if self._atoms is None:
+            header = self.header
+            shape = (header.atom_count, header.atom_size)
+            if header.atom_count == 0:
+                # Zero-length files cannot be mapped.
+                self._atoms = np.zeros(shape, dtype=header.dtype)
+            else:
+                self._atoms = np.memmap(
+                    self.path,
+                    dtype=header.dtype,
+                    mode="r",
+                    offset=header.payload_offset,
+                    shape=shape,
+                )
+        return self._atoms
+
+    @property
+    def tokens(self) -> np.ndarray:
+        """The payload as one flat token array (no copy)."""
+        return self.atoms.reshape(-1)
+
+    def __len__(self) -> int:
+        return self.header.atom_count
+
+    def __getitem__(self, index: Any) -> np.ndarray:
+        return self.atoms[index]
+
+    def iter_chunks(self, atoms_per_chunk: int = _VERIFY_ATOMS) -> Iterator[np.ndarray]:
+        """Flat token chunks of whole atoms, in order."""
+        atoms = self.atoms
+        for start in range(0, len(atoms), atoms_per_chunk):
+            yield atoms[start : start + atoms_per_chunk].reshape(-1)
+
+    def payload_crc32(self) -> int:
+        # Reads the mapping directly: verification itself must not recurse.
+        atoms = self._mapped()
+        crc = 0
+        for start in range(0, len(atoms), _VERIFY_ATOMS):
+            crc = zlib.crc32(atoms[start : start + _VERIFY_ATOMS].reshape(-1), crc)
+        return crc
+
+    def verify_payload(self) -> None:
+        """Raise ValueError unless the payload matches its CRC; checked once per instance."""
+        if self._verified is None:
+            self._verified = self.payload_crc32() == self.header.payload_crc32
+        if not self._verified:
+            raise ValueError(f"{self.path}: payload CRC mismatch")
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"path": self.path, "verify": self._verify, "verified": self._verified}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["path"], state["verify"])
+        self._verified = state["verified"]
+
+
+def write_manifest(path: Path, shards: List[Path]) -> Dict[str, Any]:
+    """Index ``shards`` (in order) from their headers into a JSON manifest at ``path``.
+
+    Works on any set of compatible shard files, so shards written by
+    separate processes or machines can be joined afterwards.
+    """
+    entries: List[Dict[str, Any]] = []
+    first: Optional[AtomHeader] = None
+    atom_offset = 0
+    for shard in shards:
+        with shard.open("rb") as handle:
+            header = parse_header(handle.read(HEADER_SIZE))
+        if first is None:
+            first = header
+        elif (header.dtype, header.vocab_size, header.atom_size) != (
+            first.dtype,
+            first.vocab_size,
+            first.atom_size,
+        ):
+            raise ValueError(f"{shard}: dtype, vocab_size or atom_size differs from {shards[0]}")
+        entries.append(
+            {
+                "path": shard.name if shard.parent == path.parent else str(shard),
+                "atom_offset": atom_offset,
+                "atom_count": header.atom_count,
+                "token_count": header.token_count,
+                "header_crc32": header.header_crc32,
+                "payload_crc32": header.payload_crc32,
+            }
+        )
+        atom_offset += header.atom_count
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "dtype": first.dtype.name if first is not None else None,
+        "vocab_size": first.vocab_size if first is not None else None,
+        "atom_size": first.atom_size if first is not None else None,
+        "atom_count": atom_offset,
+        "token_count": sum(entry["token_count"] for entry in entries),
+        "shards": entries,
+    }
+    path.write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+    return manifest
+
+
+class ShardedAtomFile:
+    """The shards of a manifest presented as one logical ``(atom_count, atom_size)`` array.
+
+    Every shard is a MatrixAtomFile checked against its manifest entry at
+    open; atom ``i`` is found by binary search over the shard offsets, and
+    slices that span shards are stitched together (only those copy).
+    Every read goes through a shard's ``atoms``, so with ``verify`` each
+    shard's payload CRC is checked on its first access.
+    """
+
+    def __init__(self, manifest: Path, verify: bool = False) -> None:
+        self.path = Path(manifest)
+        data = json.loads(self.path.read_text(encoding="utf-8"))
+        if data.get("format") != MANIFEST_FORMAT:
+            raise ValueError(f"{self.path}: not a {MANIFEST_FORMAT} manifest")
+        self.shards: List[MatrixAtomFile] = []
+        offsets = [0]
+        for entry in data["shards"]:
+            shard = MatrixAtomFile(self.path.parent / entry["path"], verify)
+            header = shard.header
+            if (
+                header.atom_count != entry["atom_count"]
+                or header.header_crc32 != entry["header_crc32"]
+                or header.payload_crc32 != entry["payload_crc32"]
+                or offsets[-1] != entry["atom_offset"]
+            ):
+                raise ValueError(f"{shard.path}: does not match its manifest entry")
+            self.shards.append(shard)
+            offsets.append(offsets[-1] + header.atom_count)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.dtype = np.dtype(data["dtype"] or "uint16")
+        self.atom_size = int(data["atom_size"] or 0)
+        self.vocab_size = int(data["vocab_size"] or 0)
+        self.token_count = int(data["token_count"])
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def _locate(self, index: int) -> int:
+        return int(np.searchsorted(self.offsets, index, side="right")) - 1
+
+    def __getitem__(self, index: Union[int, slice]) -> np.ndarray:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return self._span(start, max(stop, start))
+            rows = [self[i] for i in range(start, stop, step)]
+            return np.stack(rows) if rows else self._span(0, 0)
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("atom index out of range")
+        at = self._locate(index)
+        return self.shards[at][index - int(self.offsets[at])]
+
+    def _span(self, start: int, stop: int) -> np.ndarray:
+        pieces = []
+        at = self._locate(start) if start < stop else len(self.shards)
+        while start < stop:
+            base = int(self.offsets[at])
+            end = min(stop, int(self.offsets[at + 1]))
+            pieces.append(self.shards[at][start - base : end - base])
+            start = end
+            at += 1
+        if not pieces:
+            return np.zeros((0, self.atom_size), dtype=self.dtype)
+        return pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+
+    def iter_chunks(self, atoms_per_chunk: int = _VERIFY_ATOMS) -> Iterator[np.ndarray]:
+        for shard in self.shards:
+            yield from shard.iter_chunks(atoms_per_chunk)
+
+    def verify_payload(self) -> None:
+        for shard in self.shards:
+            shard.verify_payload()
+
+
+def open_atoms(path: Path, verify: bool = False) -> Union[MatrixAtomFile, ShardedAtomFile]:
+    """A packed ``.bin``, or the logical array of a ``.manifest.json``."""
+    if Path(path).suffix == ".json":
+        return ShardedAtomFile(path, verify)
+    return MatrixAtomFile(path, verify)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Join MATRIX-ATOM shards under one manifest")
+    parser.add_argument("shards", nargs="+", type=Path, help="Shard files, in logical order")
+    parser.add_argument("--manifest", required=True, type=Path, help="Manifest JSON to write")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    manifest = write_manifest(args.manifest, args.shards)
+    print(f"[OK] {len(args.shards)} shards, {manifest['atom_count']} atoms")
+    print(f"[OK] Manifest: {args.manifest}")
+
+
+if __name__ == "__main__":
+    main()
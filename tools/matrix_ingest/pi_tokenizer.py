@@ -1,10 +1,33 @@
 from __future__ import annotations
 
+import codecs
+import hashlib
 import json
+import multiprocessing
 import unicodedata
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Iterable, List
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from compiled_map import (
+    BlobSymbols,
+    TokenizerTables,
+    compiled_cache_path,
+    read_compiled,
+    write_compiled,
+)
+from symbol_trie import build_trie, longest_matches, token_starts
+
+# Codepoints below this resolve through a dense array; the rest by binary search.
+BMP_SIZE = 0x10000
+
+# Texts per task sent to a tokenize_batch worker.
+DEFAULT_BATCH_CHUNK = 256
+
+# Source digest of a compiled map written without one.
+_NO_DIGEST = "00" * 32
 
 
 @dataclass(frozen=True)
@@ -16,16 +39,104 @@ class SymbolMap:
     byte_fallback: bool
     byte_base_id: int
     normalization: str
-    symbols: Dict[str, int]
+    symbols: Mapping[str, int]
 
 
 class PiTokenizer:
-    def __init__(self, symbol_map: SymbolMap) -> None:
+    """Longest-match tokenizer over a π symbol map.
+
+    Single characters resolve through dense codepoint tables; symbols of two
+    or more characters through a SymbolTrie, walked only where one can start.
+    Decoding goes through one contiguous id -> UTF-8 bytes table. All tables
+    live in a TokenizerTables, which a compiled map provides ready-made.
+    """
+
+    def __init__(
+        self,
+        symbol_map: SymbolMap,
+        tables: Optional[TokenizerTables] = None,
+        source_sha256: Optional[str] = None,
+    ) -> None:
         self._map = symbol_map
+        # sha256 of the symbol map JSON this tokenizer came from, when known.
+        self.source_sha256 = source_sha256
+        if tables is None:
+            tables = self._build_tables(symbol_map)
+        self._tables = tables
+        self._bmp = tables.bmp
+        self._astral_cps = tables.astral_cps
+        self._astral_ids = tables.astral_ids
+        self._trie = tables.trie
+        self._piece_bytes = tables.piece_bytes
+        self._piece_offsets = tables.piece_offsets
+
+    @staticmethod
+    def _build_tables(symbol_map: SymbolMap) -> TokenizerTables:
+        # Codepoint -> id for single-character symbols; -1 marks unmapped.
+        bmp = np.full(BMP_SIZE, -1, dtype=np.int64)
+        astral: Dict[int, int] = {}
+        for text, token_id in symbol_map.symbols.items():
+            if len(text) != 1:
+                continue
+            cp = ord(text)
+            if cp < BMP_SIZE:
+                bmp[cp] = token_id
+            else:
+                astral[cp] = token_id
+        astral_cps = np.asarray(sorted(astral), dtype=np.uint32)
+        piece_bytes, piece_offsets = PiTokenizer._build_decode_table(symbol_map)
+        # The decode table holds the last symbol of each id; the others are aliases.
+        last = {token_id: text for text, token_id in symbol_map.symbols.items()}
+        aliases = [(text, i) for text, i in symbol_map.symbols.items() if last[i] != text]
+        alias_bytes = [text.encode("utf-8", "surrogatepass") for text, _ in aliases]
+        alias_offsets = np.zeros(len(aliases) + 1, dtype=np.int64)
+        np.cumsum([len(blob) for blob in alias_bytes], out=alias_offsets[1:])
+        return TokenizerTables(
+            bmp=bmp,
+            astral_cps=astral_cps,
+            astral_ids=np.asarray([astral[cp] for cp in astral_cps.tolist()], dtype=np.int64),
+            symbol_ids=np.asarray(sorted(set(symbol_map.symbols.values())), dtype=np.int64),
+            piece_offsets=piece_offsets,
+            piece_bytes=piece_bytes,
+            alias_ids=np.asarray([i for _, i in aliases], dtype=np.int64),
+            alias_offsets=alias_offsets,
+            alias_bytes=np.frombuffer(b"".join(alias_bytes), dtype=np.uint8),
+            trie=build_trie(symbol_map.symbols),
+        )
+
+    @staticmethod
+    def _build_decode_table(symbol_map: SymbolMap) -> Tuple[np.ndarray, np.ndarray]:
+        """UTF-8 bytes of every id as one uint8 blob plus vocab_size + 1 offsets.
+
+        Byte-fallback ids hold their single raw byte, so decoding a run of them
+        rebuilds the original UTF-8. Symbols win over byte ids they share, and
+        ids with neither (unk and pad, unless mapped) decode to nothing.
+        """
+        pieces: List[bytes] = [b""] * symbol_map.vocab_size
+        if symbol_map.byte_fallback:
+            base = symbol_map.byte_base_id
+            pieces[base : base + 256] = [bytes((byte,)) for byte in range(256)]
+        for text, token_id in symbol_map.symbols.items():
+            pieces[token_id] = text.encode("utf-8", "surrogatepass")
+        offsets = np.zeros(len(pieces) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, pieces), dtype=np.int64, count=len(pieces)), out=offsets[1:])
+        return np.frombuffer(b"".join(pieces), dtype=np.uint8), offsets
 
     @classmethod
-    def from_file(cls, path: Path) -> "PiTokenizer":
-        raw = json.loads(path.read_text(encoding="utf-8"))
+    def from_file(cls, path: Path, cache_dir: Optional[Path] = None) -> "PiTokenizer":
+        """Load a symbol map; with ``cache_dir`` it is compiled once and mmapped after.
+
+        Compiled maps are keyed by the sha256 of the JSON bytes, so an edited
+        map is recompiled. A cache hit skips JSON parsing and validation.
+        """
+        data = path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        if cache_dir is not None:
+            cache_path = compiled_cache_path(cache_dir, digest)
+            tokenizer = cls.from_compiled(cache_path, digest)
+            if tokenizer is not None:
+                return tokenizer
+        raw = json.loads(data.decode("utf-8"))
         symbols = {entry["text"]: entry["id"] for entry in raw.get("symbols", [])}
         symbol_map = SymbolMap(
             version=int(raw.get("version", 1)),
@@ -34,11 +145,55 @@ class PiTokenizer:
             pad_id=int(raw.get("pad_id", raw.get("unk_id", 0))),
             byte_fallback=bool(raw.get("byte_fallback", False)),
             byte_base_id=int(raw.get("byte_base_id", 0)),
-            normalization=str(raw.get("normalization", "nfkc")),
+            # Maps spell the form in lower case; unicodedata only takes "NFKC" etc.
+            normalization=str(raw.get("normalization", "nfkc")).upper(),
             symbols=symbols,
         )
         cls._validate(symbol_map)
-        return cls(symbol_map)
+        tokenizer = cls(symbol_map, source_sha256=digest)
+        if cache_dir is not None:
+            tokenizer.save_compiled(cache_path, digest)
+        return tokenizer
+
+    @classmethod
+    def from_compiled(cls, path: Path, digest: Optional[str] = None) -> Optional["PiTokenizer"]:
+        """Tokenizer over a compiled map (see compiled_map), or None if it is unusable.
+
+        With ``digest`` the map must have been compiled from JSON with that sha256.
+        """
+        loaded = read_compiled(path, digest)
+        if loaded is None:
+            return None
+        scalars, tables = loaded
+        symbol_map = SymbolMap(
+            version=scalars["version"],
+            vocab_size=scalars["vocab_size"],
+            unk_id=scalars["unk_id"],
+            pad_id=scalars["pad_id"],
+            byte_fallback=scalars["byte_fallback"],
+            byte_base_id=scalars["byte_base_id"],
+            normalization=scalars["normalization"],
+            symbols=BlobSymbols(tables),
+        )
+        source = scalars["source_sha256"]
+        return cls(symbol_map, tables, None if source == _NO_DIGEST else source)
+
+    def save_compiled(self, path: Path, digest: Optional[str] = None) -> None:
+        """Write this tokenizer's tables as a compiled map for ``from_compiled``.
+
+        ``digest`` is the sha256 of the source JSON, by default ``source_sha256``;
+        without either it is left zero.
+        """
+        scalars = {
+            "version": self._map.version,
+            "vocab_size": self._map.vocab_size,
+            "unk_id": self._map.unk_id,
+            "pad_id": self._map.pad_id,
+            "byte_fallback": self._map.byte_fallback,
+            "byte_base_id": self._map.byte_base_id,
+            "normalization": self._map.normalization,
+        }
+        write_compiled(path, digest or self.source_sha256 or _NO_DIGEST, scalars, self._tables)
 
     @staticmethod
     def _validate(symbol_map: SymbolMap) -> None:
@@ -58,13 +213,142 @@ class PiTokenizer:
                 raise ValueError(f"token id out of range for symbol: {text}")
 
     def tokenize(self, text: str) -> List[int]:
-        normalized = unicodedata.normalize(self._map.normalization, text)
+        return self.encode(text).tolist()
+
+    def normalize(self, text: str) -> str:
+        """``text`` in the map's normalization form, as encode sees it."""
+        return unicodedata.normalize(self._map.normalization, text)
+
+    def encode(self, text: str) -> np.ndarray:
+        """Token ids of ``text`` as an int64 array; same ids as the per-character rules."""
+        return self._encode_many([text])[0]
+
+    def tokenize_batch(
+        self,
+        texts: Sequence[str],
+        workers: int = 1,
+        chunk_size: int = DEFAULT_BATCH_CHUNK,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Encode many texts into one flat int64 buffer plus int64 offsets.
+
+        Text ``i`` is ``ids[offsets[i]:offsets[i + 1]]``, exactly ``encode(texts[i])``.
+        With ``workers`` > 1 chunks of texts are encoded in a process pool and
+        reassembled in input order. The tokenizer reaches each worker once, at
+        start-up: under fork its tables are shared copy-on-write, elsewhere it
+        is pickled once per worker rather than once per task.
+        """
+        if workers <= 1 or len(texts) <= chunk_size:
+            ids, lengths = self._encode_many(texts)
+        else:
+            chunks = [texts[i : i + chunk_size] for i in range(0, len(texts), chunk_size)]
+            with _pool_context().Pool(
+                min(workers, len(chunks)), initializer=_init_worker, initargs=(self,)
+            ) as pool:
+                parts = pool.map(_encode_chunk, chunks)
+            ids = np.concatenate([part_ids for part_ids, _ in parts])
+            lengths = np.concatenate([part_lengths for _, part_lengths in parts])
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return ids, offsets
+
+    def _encode_many(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Token ids of all ``texts`` back to back, and the token count of each.
+
+        The texts are joined into one codepoint array so every lookup runs
+        once per call; symbol matches stop at text boundaries.
+        """
+        normalized = [self.normalize(text) for text in texts]
+        sizes = np.fromiter(map(len, normalized), dtype=np.int64, count=len(normalized))
+        joined = "".join(normalized)
+        if not joined:
+            return np.zeros(0, dtype=np.int64), np.zeros(len(texts), dtype=np.int64)
+        cps = np.frombuffer(joined.encode("utf-32-le", "surrogatepass"), dtype="<u4")
+        ids = self._bmp[np.minimum(cps, BMP_SIZE - 1)]
+        astral = np.flatnonzero(cps >= BMP_SIZE)
+        if len(astral) and not len(self._astral_cps):
+            ids[astral] = -1
+        elif len(astral):
+            wanted = cps[astral]
+            at = np.minimum(np.searchsorted(self._astral_cps, wanted), len(self._astral_cps) - 1)
+            ids[astral] = np.where(self._astral_cps[at] == wanted, self._astral_ids[at], -1)
+        bounds = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=bounds[1:])
+        keep = None
+        if self._trie.max_len:
+            ends = np.repeat(bounds[1:], sizes) if len(texts) > 1 else None
+            ids, cps, keep = self._merge_symbols(cps, ids, ends)
+        widths = None
+        unmapped = ids < 0
+        if unmapped.any():
+            if self._map.byte_fallback:
+                ids, widths = self._byte_fallback(ids, cps, unmapped)
+            else:
+                ids[unmapped] = self._map.unk_id
+        if len(texts) == 1:
+            return ids, np.asarray([len(ids)], dtype=np.int64)
+        # Tokens emitted by each codepoint position, summed per text.
+        emitted = np.zeros(len(keep) if keep is not None else len(cps), dtype=np.int64)
+        if keep is None:
+            emitted[:] = 1 if widths is None else widths
+        else:
+            emitted[keep] = 1 if widths is None else widths
+        totals = np.zeros(len(emitted) + 1, dtype=np.int64)
+        np.cumsum(emitted, out=totals[1:])
+        return ids, np.diff(totals[bounds])
+
+    def _merge_symbols(
+        self,
+        cps: np.ndarray,
+        ids: np.ndarray,
+        ends: Optional[np.ndarray],
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Replace each leftmost-longest multi-character match by its id.
+
+        Positions covered by a match are dropped from both arrays; the mask
+        of positions kept is returned with them.
+        """
+        lengths, match_ids = longest_matches(self._trie, cps, ends)
+        keep = token_starts(lengths)
+        matched = keep & (lengths > 0)
+        ids[matched] = match_ids[matched]
+        return ids[keep], cps[keep], keep
+
+    def _byte_fallback(
+        self, ids: np.ndarray, cps: np.ndarray, unmapped: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Expand every unmapped codepoint into its UTF-8 byte ids, in place order.
+
+        Also returns how many ids each input position became.
+        """
+        missing = cps[unmapped]
+        # Raises on lone surrogates exactly like str.encode("utf-8") does.
+        raw = missing.astype("<u4").tobytes().decode("utf-32-le", "surrogatepass").encode("utf-8")
+        widths = np.ones(len(cps), dtype=np.int64)
+        widths[unmapped] = (
+            1 + (missing >= 0x80).astype(np.int64) + (missing >= 0x800) + (missing >= BMP_SIZE)
+        )
+        # Unmapped slots stay -1 after the repeat, one per UTF-8 byte, in order.
+        out = np.repeat(ids, widths)
+        out[out < 0] = np.frombuffer(raw, dtype=np.uint8).astype(np.int64) + self._map.byte_base_id
+        return out, widths
+
+    def _tokenize_chars(self, text: str) -> List[int]:
+        """Reference longest-match loop over substrings that ``encode`` must match."""
+        normalized = self.normalize(text)
+        symbols = self._map.symbols
+        longest = max(self._trie.max_len, 1)
         tokens: List[int] = []
-        for ch in normalized:
-            token_id = self._map.symbols.get(ch)
+        pos = 0
+        while pos < len(normalized):
+            for size in range(min(longest, len(normalized) - pos), 0, -1):
+                token_id = symbols.get(normalized[pos : pos + size])
+                if token_id is not None:
+                    break
+            pos += size
             if token_id is not None:
                 tokens.append(token_id)
                 continue
+            ch = normalized[pos - 1]
             if self._map.byte_fallback:
                 for byte in ch.encode("utf-8"):
                     tokens.append(self._map.byte_base_id + byte)
@@ -72,6 +356,39 @@ class PiTokenizer:
                 tokens.append(self._map.unk_id)
         return tokens
 
+    def decode(self, ids: Iterable[int], errors: str = "replace") -> str:
+        return self.decode_array(np.fromiter(ids, dtype=np.int64), errors)
+
+    def decode_array(self, ids: np.ndarray, errors: str = "replace") -> str:
+        """Text of ``ids``; byte-fallback runs merge back into UTF-8 characters."""
+        return self.decode_bytes(ids).decode("utf-8", errors)
+
+    def decode_bytes(self, ids: np.ndarray) -> bytes:
+        """Concatenated UTF-8 bytes of ``ids``, gathered from the table in one pass."""
+        ids = np.asarray(ids).astype(np.int64, copy=False)
+        if len(ids) and (ids.min() < 0 or ids.max() >= self._map.vocab_size):
+            raise ValueError("token id out of range")
+        starts = self._piece_offsets[ids]
+        sizes = self._piece_offsets[ids + 1] - starts
+        ends = np.cumsum(sizes)
+        # Output byte k of piece j comes from blob[starts[j] + k].
+        index = np.repeat(starts - (ends - sizes), sizes)
+        index += np.arange(len(index))
+        return self._piece_bytes[index].tobytes()
+
+    def decode_stream(self, chunks: Iterable[np.ndarray], errors: str = "replace") -> Iterator[str]:
+        """Decode id arrays one after another, e.g. atoms read from a packed file.
+
+        A character whose fallback bytes straddle two chunks is emitted whole
+        with the later chunk.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors)
+        for chunk in chunks:
+            yield decoder.decode(self.decode_bytes(chunk))
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
     def pad_id(self) -> int:
         return self._map.pad_id
 
@@ -82,5 +399,25 @@ class PiTokenizer:
         return self._map.symbols.keys()
 
 
+# Tokenizer of a tokenize_batch worker process, set once by _init_worker.
+_WORKER_TOKENIZER: Optional[PiTokenizer] = None
+
+
+def _pool_context() -> multiprocessing.context.BaseContext:
+    # Forked workers inherit the parent's tables without copying them.
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def _init_worker(tokenizer: PiTokenizer) -> None:
+    global _WORKER_TOKENIZER
+    _WORKER_TOKENIZER = tokenizer
+
+
+def _encode_chunk(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    return _WORKER_TOKENIZER._encode_many(texts)
+
+
 def load_tokenizer(path: str) -> PiTokenizer:
     return PiTokenizer.from_file(Path(path))
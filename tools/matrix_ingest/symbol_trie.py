@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Positions resolved per pointer-doubling pass in token_starts.
+_CHUNK = 1 << 16
+
+# Edge keys pack (parent node, codepoint); codepoints need 21 bits.
+_LABEL_BITS = 21
+_EMPTY = -1
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+# First steps from the root for BMP codepoints go through a dense array.
+_ROOT_SIZE = 0x10000
+
+
+@dataclass(frozen=True)
+class SymbolTrie:
+    """Trie over multi-character symbols, stored as flat arrays.
+
+    Node 0 is the root. Edges live in an open-addressing hash table:
+    ``keys`` holds ``parent << 21 | codepoint`` (-1 for a free slot) and
+    ``children`` the node it leads to, so a step is O(1) and whole arrays
+    of positions advance together. ``root`` repeats the root's BMP edges
+    as a dense codepoint -> child array (-1 for none), since every position
+    takes that first step. ``token[n]`` is the id of the symbol ending at
+    node ``n``, or -1.
+    """
+
+    keys: np.ndarray
+    children: np.ndarray
+    root: np.ndarray
+    token: np.ndarray
+    max_len: int
+
+    @property
+    def node_count(self) -> int:
+        return len(self.token)
+
+
+def _slots(keys: np.ndarray, bits: int) -> np.ndarray:
+    # Fibonacci hashing: the top bits of key * 2**64/phi.
+    return ((keys.astype(np.uint64) * _GOLDEN) >> np.uint64(64 - bits)).astype(np.int64)
+
+
+def _build_table(keys: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    bits = max(int(len(keys) * 2 - 1).bit_length(), 4)
+    mask = (1 << bits) - 1
+    table_keys = np.full(1 << bits, _EMPTY, dtype=np.int64)
+    table_values = np.zeros(1 << bits, dtype=np.int64)
+    pending = np.arange(len(keys))
+    slot = _slots(keys, bits)
+    while len(pending):
+        free = table_keys[slot] == _EMPTY
+        # Among keys probing the same free slot, the first one takes it.
+        _, first = np.unique(slot[free], return_index=True)
+        won = np.flatnonzero(free)[first]
+        table_keys[slot[won]] = keys[pending[won]]
+        table_values[slot[won]] = values[pending[won]]
+        lost = np.ones(len(pending), dtype=bool)
+        lost[won] = False
+        pending = pending[lost]
+        slot = (slot[lost] + 1) & mask
+    return table_keys, table_values
+
+
+def build_trie(symbols: Dict[str, int], min_len: int = 2) -> SymbolTrie:
+    """Trie of every symbol at least ``min_len`` characters long."""
+    edges: List[Dict[str, int]] = [{}]
+    token: List[int] = [-1]
+    parents: List[int] = []
+    labels: List[int] = []
+    max_len = 0
+    for text, token_id in symbols.items():
+        if len(text) < min_len:
+            continue
+        max_len = max(max_len, len(text))
+        node = 0
+        for ch in text:
+            nxt = edges[node].get(ch)
+            if nxt is None:
+                nxt = len(edges)
+                edges[node][ch] = nxt
+                edges.append({})
+                token.append(-1)
+                parents.append(node)
+                labels.append(ord(ch))
+            node = nxt
+        token[node] = token_id
+
+    parent_arr = np.asarray(parents, dtype=np.int64)
+    label_arr = np.asarray(labels, dtype=np.int64)
+    # Node i + 1 was created by edge i.
+    child_arr = np.arange(1, len(parents) + 1, dtype=np.int64)
+    keys, children = _build_table((parent_arr << _LABEL_BITS) | label_arr, child_arr)
+    root = np.full(_ROOT_SIZE, -1, dtype=np.int64)
+    from_root = (parent_arr == 0) & (label_arr < _ROOT_SIZE)
+    root[label_arr[from_root]] = child_arr[from_root]
+    return SymbolTrie(
+        keys=keys,
+        children=children,
+        root=root,
+        token=np.asarray(token, dtype=np.int64),
+        max_len=max_len,
+    )
+
+
+def _step(trie: SymbolTrie, nodes: np.ndarray, cps: np.ndarray) -> np.ndarray:
+    """Child of each node along each codepoint, or -1 where there is no edge."""
+    keys = (nodes << _LABEL_BITS) | cps.astype(np.int64)
+    mask = len(trie.keys) - 1
+    slot = _slots(keys, mask.bit_length())
+    out = np.full(len(keys), -1, dtype=np.int64)
+    todo = np.arange(len(keys))
+    while len(todo):
+        found = trie.keys[slot]
+        hit = found == keys[todo]
+        out[todo[hit]] = trie.children[slot[hit]]
+        more = ~hit & (found != _EMPTY)
+        todo = todo[more]
+        slot = (slot[more] + 1) & mask
+    return out
+
+
+def longest_matches(
+    trie: SymbolTrie,
+    cps: np.ndarray,
+    ends: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Length and id of the longest symbol starting at every position (0 and -1 if none).
+
+    All candidate positions walk the trie together, one level per pass.
+    ``ends[p]``, when given, is where the text holding position ``p`` stops,
+    so several texts can be matched in one array without a symbol spanning two.
+    """
+    n = len(cps)
+    lengths = np.zeros(n, dtype=np.int64)
+    ids = np.full(n, -1, dtype=np.int64)
+    first = trie.root[np.minimum(cps, _ROOT_SIZE - 1)]
+    astral = np.flatnonzero(cps >= _ROOT_SIZE)
+    if len(astral):
+        first[astral] = _step(trie, np.zeros(len(astral), dtype=np.int64), cps[astral])
+    pos = np.flatnonzero(first >= 0)
+    nodes = first[pos]
+    for depth in range(trie.max_len):
+        if depth:
+            at = pos + depth
+            inside = at < (n if ends is None else ends[pos])
+            if not inside.all():
+                pos, nodes, at = pos[inside], nodes[inside], at[inside]
+            nodes = _step(trie, nodes, cps[at])
+        alive = nodes >= 0
+        pos, nodes = pos[alive], nodes[alive]
+        if not len(pos):
+            break
+        tok = trie.token[nodes]
+        done = tok >= 0
+        lengths[pos[done]] = depth + 1
+        ids[pos[done]] = tok[done]
+    return lengths, ids
+
+
+def token_starts(lengths: np.ndarray) -> np.ndarray:
+    """Mask of the positions where greedy left-to-right tokens begin.
+
+    From position p the next token starts at p + max(lengths[p], 1). The
+    chain from 0 is enumerated by pointer doubling over chunks: with jump
+    tables for 1, 2, 4, ... steps, every level doubles the set of known
+    chain members, so no Python loop runs per token.
+    """
+    n = len(lengths)
+    on_chain = np.zeros(n, dtype=bool)
+    step = np.maximum(lengths, 1)
+    entry = 0
+    for lo in range(0, n, _CHUNK):
+        hi = min(lo + _CHUNK, n)
+        if entry >= hi:
+            continue
+        size = hi - lo
+        # Local jump table; ``size`` is a sink for chains leaving the chunk.
+        jump = np.empty(size + 1, dtype=np.int64)
+        np.minimum(np.arange(size) + step[lo:hi], size, out=jump[:size])
+        jump[size] = size
+        levels = [jump]
+        while (1 << len(levels)) < size:
+            levels.append(levels[-1][levels[-1]])
+        members = np.asarray([entry - lo], dtype=np.int64)
+        for table in reversed(levels):
+            ahead = table[members]
+            members = np.concatenate((members, ahead[ahead < size]))
+        on_chain[lo + members] = True
+        last = lo + int(members.max())
+        entry = last + int(step[last])
+    return on_chain
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import argparse
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+import numpy as np
+
+from binary_pack import gather_files, load_and_clean
+from matrix_atom import MatrixAtomFile, ShardedAtomFile, open_atoms
+from pi_tokenizer import PiTokenizer
+
+
+def checked_chunks(
+    atoms: Union[MatrixAtomFile, ShardedAtomFile], atoms_per_chunk: int
+) -> Iterator[np.ndarray]:
+    """Token chunks of ``atoms``, checking each file's payload CRC once it has been read."""
+    files = atoms.shards if isinstance(atoms, ShardedAtomFile) else [atoms]
+    for atom_file in files:
+        crc = 0
+        for chunk in atom_file.iter_chunks(atoms_per_chunk):
+            crc = zlib.crc32(chunk, crc)
+            yield chunk
+        if crc != atom_file.header.payload_crc32:
+            raise ValueError(f"{atom_file.path}: payload CRC mismatch")
+
+
+def first_mismatch(actual: Iterable[str], expected: Iterable[str]) -> Optional[int]:
+    """Character offset where two chunked strings first differ, or None if equal."""
+    pending = ""
+    pos = 0
+    expected_iter = iter(expected)
+    for piece in actual:
+        while len(pending) < len(piece):
+            more = next(expected_iter, None)
+            if more is None:
+                break
+            pending += more
+        size = min(len(piece), len(pending))
+        if piece[:size] != pending[:size]:
+            return pos + next(i for i in range(size) if piece[i] != pending[i])
+        if len(piece) > len(pending):
+            return pos + len(pending)
+        pending = pending[len(piece) :]
+        pos += len(piece)
+    if pending or any(expected_iter):
+        return pos
+    return None
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Check a MATRIX-ATOM v1 file by decoding it")
+    parser.add_argument("--bin", required=True, type=Path, help="Packed .bin or .manifest.json")
+    parser.add_argument("--tokenizer", required=True, type=Path, help="pi_symbol_map.json path")
+    parser.add_argument("--input", type=Path, help="Directory it was packed from, to compare text")
+    parser.add_argument("--chunk-atoms", type=int, default=1 << 12, help="Atoms read per step")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    tokenizer = PiTokenizer.from_file(args.tokenizer)
+    atoms = open_atoms(args.bin)
+    header = atoms if isinstance(atoms, ShardedAtomFile) else atoms.header
+    token_count = header.token_count
+    if header.vocab_size != tokenizer.vocab_size():
+        raise SystemExit("[FAIL] vocab_size differs from the tokenizer")
+    decoded = tokenizer.decode_stream(checked_chunks(atoms, args.chunk_atoms))
+    if args.input is None:
+        chars = sum(len(text) for text in decoded)
+        print(f"[OK] Decoded {token_count} tokens to {chars} characters")
+        return
+    # Padding ids decode to nothing, so the text is the normalized corpus.
+    expected = (tokenizer.normalize(load_and_clean(path)) for path in gather_files(args.input))
+    mismatch = first_mismatch(decoded, expected)
+    if mismatch is not None:
+        raise SystemExit(f"[FAIL] Decoded text differs from the input at character {mismatch}")
+    print(f"[OK] Round trip matches {args.input} ({token_count} tokens)")
+
+
+if __name__ == "__main__":
+    main()